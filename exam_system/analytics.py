@@ -0,0 +1,216 @@
+"""
+Phân tích câu hỏi (item analysis) trên toàn bộ bài nộp của một đề thi
+
+answers của các bài nộp được chuyển một lượt sang dạng cột (pyarrow -> NumPy):
+ma trận điểm [học sinh x câu hỏi] và ma trận mã lựa chọn cho câu trắc nghiệm.
+Mọi chỉ số sau đó đều tính bằng phép toán trên mảng, không lặp từng bài nộp.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from cache import QuestionCache
+from scoring import CHOICE_TYPES
+
+GROUP_FRACTION = 0.27  # Nhóm cao/thấp 27% cho chỉ số phân biệt
+
+_ANSWER_TYPE = pa.struct([
+    ("type", pa.string()),
+    ("score", pa.float64()),
+    ("max_score", pa.float64()),
+    ("student_choice", pa.string()),
+    ("correct_choice", pa.string()),
+])
+
+
+class ItemMatrix:
+    """
+    Dữ liệu dạng cột của một đề:
+    - scores: float [n, k], NaN nếu bài nộp không có câu đó
+    - max_scores: float [k]
+    - choices: int32 [n, k], -1 nếu không chọn / không phải câu trắc nghiệm
+    - options: list k phần tử, danh sách lựa chọn (theo mã) của từng câu
+    """
+
+    def __init__(self, qids, types, scores, max_scores, choices, options, correct):
+        self.qids = qids
+        self.types = types
+        self.scores = scores
+        self.max_scores = max_scores
+        self.choices = choices
+        self.options = options
+        self.correct = correct
+
+    @property
+    def n_submissions(self):
+        return self.scores.shape[0]
+
+    @staticmethod
+    def from_answers(answers_list, question_options=None):
+        """
+        Tạo từ list các map answers ({qid: {...}}) của từng bài nộp.
+        question_options: {qid: [lựa chọn]} để liệt kê cả lựa chọn chưa ai chọn
+        """
+        qids = sorted(set().union(*(a.keys() for a in answers_list))) if answers_list else []
+        n, k = len(answers_list), len(qids)
+        scores = np.full((n, k), np.nan)
+        max_scores = np.ones(k)
+        choices = np.full((n, k), -1, dtype=np.int32)
+        types, options, correct = [], [], []
+        if not k:
+            return ItemMatrix(qids, types, scores, max_scores, choices, options, correct)
+
+        # Chuyển một lượt sang struct Arrow theo schema cố định (bỏ qua các trường không dùng)
+        schema = pa.struct([(qid, _ANSWER_TYPE) for qid in qids])
+        table = pa.array(answers_list, type=schema)
+
+        for j, qid in enumerate(qids):
+            column = table.field(qid)
+            valid = column.is_valid()
+            scores[:, j] = column.field("score").to_numpy(zero_copy_only=False)
+            # Câu không có trong bài nộp -> NaN
+            scores[~valid.to_numpy(zero_copy_only=False), j] = np.nan
+
+            # Thông tin chung của câu lấy từ các bài có câu này
+            present = column.filter(valid)
+            max_column = present.field("max_score").drop_null()
+            max_scores[j] = pc.max(max_column).as_py() if len(max_column) else 1.0
+            q_types = present.field("type").drop_null()
+            q_type = q_types[0].as_py() if len(q_types) else None
+            types.append(q_type)
+
+            # Đáp án đúng phổ biến nhất (đáp án có thể đã được sửa giữa chừng)
+            correct_counts = pc.value_counts(present.field("correct_choice").drop_null())
+            if len(correct_counts):
+                top = int(np.argmax(correct_counts.field("counts").to_numpy()))
+                correct.append(correct_counts.field("values")[top].as_py())
+            else:
+                correct.append(None)
+
+            if q_type in CHOICE_TYPES:
+                student_choice = pc.if_else(valid, column.field("student_choice"), pa.scalar(None, pa.string()))
+                encoded = pc.dictionary_encode(student_choice)
+                choices[:, j] = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+                labels = encoded.dictionary.to_pylist()
+                labels += [o for o in (question_options or {}).get(qid, []) if o not in labels]
+                options.append(labels)
+            else:
+                options.append([])
+
+        max_scores[max_scores <= 0] = 1.0
+        return ItemMatrix(qids, types, scores, max_scores, choices, options, correct)
+
+
+def analyze(matrix, bins=10):
+    """
+    Trả về dict:
+    - items: DataFrame theo câu (độ khó, độ phân biệt, tương quan điểm câu - tổng, số bài làm)
+    - distractors: {qid: DataFrame lựa chọn / số lượt / tỉ lệ / nhóm cao / nhóm thấp}
+    - histogram: DataFrame phân bố tổng điểm
+    - summary: số bài, điểm trung bình, độ lệch chuẩn, Cronbach's alpha
+    """
+    n, k = matrix.scores.shape
+    answered = ~np.isnan(matrix.scores)
+    # Câu bỏ trống tính 0 điểm khi cộng tổng
+    filled = np.where(answered, matrix.scores, 0.0)
+    ratio = filled / matrix.max_scores
+    totals = filled.sum(axis=1)
+
+    # Độ khó: tỉ lệ điểm đạt được trung bình (1 = dễ)
+    counts = answered.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        difficulty = np.where(counts > 0, (ratio * answered).sum(axis=0) / counts, np.nan)
+
+    # Nhóm cao/thấp theo tổng điểm
+    group = max(1, int(round(n * GROUP_FRACTION))) if n else 0
+    order = np.argsort(totals, kind="stable")
+    lower, upper = order[:group], order[n - group:]
+    if group:
+        discrimination = ratio[upper].mean(axis=0) - ratio[lower].mean(axis=0)
+    else:
+        discrimination = np.full(k, np.nan)
+
+    # Tương quan điểm câu với tổng điểm các câu còn lại (corrected item-total)
+    item_total = np.full(k, np.nan)
+    if n:
+        rest = totals[:, None] - filled
+        item_centered = ratio - ratio.mean(axis=0)
+        rest_centered = rest - rest.mean(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            item_total = (item_centered * rest_centered).sum(axis=0) / np.sqrt(
+                (item_centered ** 2).sum(axis=0) * (rest_centered ** 2).sum(axis=0)
+            )
+
+    items = pd.DataFrame({
+        "qid": matrix.qids,
+        "type": matrix.types,
+        "answered": counts,
+        "difficulty": difficulty,
+        "discrimination": discrimination,
+        "item_total_corr": item_total,
+        "correct_answer": matrix.correct,
+    })
+
+    distractors = {}
+    for j in range(k):
+        labels = matrix.options[j]
+        if not labels:
+            continue
+        codes = matrix.choices[:, j]
+        size = len(labels)
+        chosen = codes >= 0
+        all_counts = np.bincount(codes[chosen], minlength=size)
+        upper_codes, lower_codes = codes[upper], codes[lower]
+        distractors[matrix.qids[j]] = pd.DataFrame({
+            "option": labels,
+            "count": all_counts,
+            "share": all_counts / max(1, chosen.sum()),
+            "upper": np.bincount(upper_codes[upper_codes >= 0], minlength=size),
+            "lower": np.bincount(lower_codes[lower_codes >= 0], minlength=size),
+            "is_correct": [label == matrix.correct[j] for label in labels],
+        })
+
+    max_total = float(matrix.max_scores.sum()) if k else 1.0
+    hist, edges = np.histogram(totals, bins=bins, range=(0, max_total or 1.0))
+    histogram = pd.DataFrame({
+        "range": [f"{edges[i]:.1f}-{edges[i + 1]:.1f}" for i in range(len(hist))],
+        "count": hist,
+    })
+
+    # Cronbach's alpha: k/(k-1) * (1 - tổng phương sai từng câu / phương sai tổng điểm)
+    alpha = np.nan
+    if k > 1 and n > 1:
+        total_var = totals.var(ddof=1)
+        if total_var > 0:
+            alpha = k / (k - 1) * (1 - filled.var(axis=0, ddof=1).sum() / total_var)
+
+    summary = {
+        "submissions": n,
+        "questions": k,
+        "mean": float(totals.mean()) if n else 0.0,
+        "std": float(totals.std(ddof=1)) if n > 1 else 0.0,
+        "max_total": max_total,
+        "alpha": float(alpha),
+    }
+    return {"items": items, "distractors": distractors, "histogram": histogram, "summary": summary}
+
+
+def load_answers(db, subject, set_number, status=None):
+    """Tải map answers của mọi bài nộp của 1 đề (chỉ trường answers)"""
+    query = db.collection("submissions")\
+        .where("subject", "==", subject)\
+        .where("set_number", "==", set_number)
+    if status:
+        query = query.where("status", "==", status)
+    docs = query.select(["answers"]).stream()
+    return [(d.to_dict() or {}).get("answers") or {} for d in docs]
+
+
+def analyze_exam(db, subject, set_number, status=None, bins=10):
+    """Tải và phân tích 1 đề, trả về kết quả analyze() (None nếu chưa có bài nộp)"""
+    answers = load_answers(db, subject, set_number, status)
+    if not answers:
+        return None
+    questions = QuestionCache.get(db, subject, set_number)
+    question_options = {q['id']: q.get('options') or [] for q in questions}
+    return analyze(ItemMatrix.from_answers(answers, question_options), bins=bins)
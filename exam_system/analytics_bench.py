@@ -0,0 +1,101 @@
+"""
+Benchmark phân tích câu hỏi: analytics (pyarrow/NumPy) so với vòng lặp Python thuần
+
+Sinh dữ liệu answers giả lập (như bài nộp thật) rồi đo thời gian dựng ma trận và tính chỉ số.
+
+Ví dụ:
+    cd exam_system
+    python analytics_bench.py --submissions 100000 --questions 20 --essays 2
+"""
+import argparse
+import random
+import statistics
+import time
+
+from analytics import ItemMatrix, analyze
+
+OPTIONS = ["A", "B", "C", "D"]
+
+
+def generate(submissions, questions, essays, seed=0):
+    """Sinh list map answers: năng lực học sinh ngẫu nhiên, câu sau khó hơn câu trước"""
+    rng = random.Random(seed)
+    answers_list = []
+    for _ in range(submissions):
+        ability = rng.random()
+        answers = {}
+        for j in range(questions):
+            correct = rng.random() < ability * (1.2 - j / questions)
+            choice = "A" if correct else rng.choice(OPTIONS[1:])
+            answers[f"q{j:03d}"] = {
+                "question_content": f"Câu hỏi {j}", "type": "Trắc nghiệm (MC)",
+                "max_score": 1.0, "score": 1.0 if correct else 0.0, "teacher_comment": "",
+                "student_choice": choice, "correct_choice": "A",
+            }
+        for j in range(questions, questions + essays):
+            answers[f"q{j:03d}"] = {
+                "question_content": f"Câu tự luận {j}", "type": "Tự luận (Essay)",
+                "max_score": 2.0, "score": round(ability * 2 * 4) / 4, "teacher_comment": "",
+                "student_text": "Bài làm " * 20,
+            }
+        answers_list.append(answers)
+    return answers_list
+
+
+def analyze_python(answers_list):
+    """Cách làm bằng vòng lặp Python (để so sánh): độ khó, độ phân biệt, lựa chọn, alpha"""
+    qids = sorted({qid for answers in answers_list for qid in answers})
+    totals = [sum(a.get("score", 0) for a in answers.values()) for answers in answers_list]
+    order = sorted(range(len(answers_list)), key=lambda i: totals[i])
+    group = max(1, round(len(order) * 0.27))
+    lower, upper = order[:group], order[-group:]
+
+    result = {}
+    item_vars = []
+    for qid in qids:
+        ratios, choices = [], {}
+        for answers in answers_list:
+            ans = answers.get(qid)
+            ratios.append(ans["score"] / ans.get("max_score", 1) if ans else 0.0)
+            if ans and ans.get("student_choice") is not None:
+                choices[ans["student_choice"]] = choices.get(ans["student_choice"], 0) + 1
+        discrimination = sum(ratios[i] for i in upper) / group - sum(ratios[i] for i in lower) / group
+        result[qid] = (statistics.fmean(ratios), discrimination, choices)
+        item_vars.append(statistics.variance(
+            [answers[qid]["score"] if qid in answers else 0.0 for answers in answers_list]
+        ))
+    k = len(qids)
+    alpha = k / (k - 1) * (1 - sum(item_vars) / statistics.variance(totals))
+    return result, alpha
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark phân tích câu hỏi")
+    parser.add_argument("--submissions", type=int, default=100000)
+    parser.add_argument("--questions", type=int, default=20, help="Số câu trắc nghiệm")
+    parser.add_argument("--essays", type=int, default=2, help="Số câu tự luận")
+    parser.add_argument("--skip-python", action="store_true", help="Không chạy bản vòng lặp Python")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    answers_list = generate(args.submissions, args.questions, args.essays)
+    print(f"Sinh {len(answers_list)} bài nộp: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    matrix = ItemMatrix.from_answers(answers_list)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    result = analyze(matrix)
+    analysed = time.perf_counter() - start
+    print(f"analytics: dựng ma trận {built:.2f}s + tính chỉ số {analysed:.3f}s = {built + analysed:.2f}s"
+          f" (alpha={result['summary']['alpha']:.3f})")
+
+    if not args.skip_python:
+        start = time.perf_counter()
+        _, alpha = analyze_python(answers_list)
+        elapsed = time.perf_counter() - start
+        print(f"Vòng lặp Python: {elapsed:.2f}s (alpha={alpha:.3f}) -> nhanh hơn {elapsed / (built + analysed):.1f} lần")
+
+
+if __name__ == "__main__":
+    main()
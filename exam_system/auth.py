@@ -6,24 +6,11 @@ import hashlib
 import time
 import re
 import logging
-import os
-from datetime import datetime
+from log_setup import setup_logging
+from models import UserRepository
 
-# Cấu hình logging
-log_dir = "logs"
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-log_file = os.path.join(log_dir, f"auth_{datetime.now().strftime('%Y%m%d')}.log")
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+# Cấu hình logging (ghi qua hàng đợi, không chặn luồng xử lý đăng nhập)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -51,26 +38,21 @@ class AuthManager:
             logger.warning(f"🚫 Quá nhiều lần thử đăng nhập từ: {username}")
             return False, "🚫 Quá nhiều lần thử. Chờ 5 phút."
         
-        # Tìm giáo viên trong collection "users"
+        # Tìm giáo viên qua chỉ mục username
         logger.info(f"🔍 Tìm kiếm giáo viên trong 'users'")
-        user_docs = db.collection("users")\
-            .where("username", "==", username)\
-            .where("role", "==", "teacher")\
-            .limit(1)\
-            .stream()
-        
-        user_docs_list = list(user_docs)
-        if not user_docs_list:
+        doc_id, teacher_data = UserRepository(db).find_by_username(username, "teacher")
+        
+        if not teacher_data:
             st.session_state['login_attempts'].append(current_time)
             logger.warning(f"❌ Giáo viên không tồn tại: {username}")
             return False, "❌ Tên đăng nhập không đúng!"
         
-        teacher_doc = user_docs_list[0]
-        teacher_data = teacher_doc.to_dict()
-        doc_id = teacher_doc.id
-        
         logger.info(f"✓ Tìm thấy giáo viên: {doc_id}")
         
+        if teacher_data.get('is_active') is False:
+            logger.warning(f"🔒 Tài khoản đã bị khóa: {doc_id}")
+            return False, "🔒 Tài khoản đã bị khóa!"
+        
         # Kiểm tra mật khẩu
         input_hash = hashlib.sha256(password.encode()).hexdigest()
         stored_password_hash = teacher_data.get('password_hash', '').strip() if teacher_data.get('password_hash') else ''
@@ -163,16 +145,8 @@ class AuthManager:
         # Nếu không tìm thấy, tìm bằng Username
         if not student_data:
             logger.info(f"🔍 Tìm kiếm bằng username: {input_text}")
-            docs = db.collection("users")\
-                .where("username", "==", input_text)\
-                .where("role", "==", "student")\
-                .limit(1)\
-                .stream()
-            docs_list = list(docs)
-            if docs_list:
-                doc = docs_list[0]
-                student_data = doc.to_dict()
-                doc_id = doc.id
+            doc_id, student_data = UserRepository(db).find_by_username(input_text, "student")
+            if student_data:
                 logger.info(f"✓ Tìm thấy HS bằng username: {doc_id}")
             else:
                 logger.warning(f"✗ Không tìm thấy username: {input_text}")
@@ -182,6 +156,10 @@ class AuthManager:
             logger.error(f"❌ Tài khoản không tồn tại: {input_text}")
             return False, "❌ Mã HS hoặc tên đăng nhập không tồn tại!"
         
+        if student_data.get('is_active') is False:
+            logger.warning(f"🔒 Tài khoản đã bị khóa: {doc_id}")
+            return False, "🔒 Tài khoản đã bị khóa!"
+        
         # Kiểm tra mật khẩu
         input_hash = hashlib.sha256(password.encode()).hexdigest()
         stored_password_hash = student_data.get('password_hash', '').strip() if student_data.get('password_hash') else ''
@@ -189,7 +167,6 @@ class AuthManager:
         
         logger.debug(f"📋 Dữ liệu tài khoản:")
         logger.debug(f"   - Doc ID: {doc_id}")
-        logger.debug(f"   - Toàn bộ keys: {list(student_data.keys())}")
         logger.debug(f"   - Có password_hash: {bool(stored_password_hash)}")
         logger.debug(f"   - Có password: {bool(stored_password)}")
         
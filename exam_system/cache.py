@@ -0,0 +1,57 @@
+"""
+Cache dùng chung cho toàn bộ process (mọi session Streamlit)
+"""
+import threading
+from cachetools import TTLCache
+
+
+class QuestionCache:
+    """Cache bộ câu hỏi theo (môn, mã đề), dùng chung cho tất cả học sinh"""
+
+    TTL_SECONDS = 300
+    _cache = TTLCache(maxsize=256, ttl=TTL_SECONDS)
+    _lock = threading.Lock()
+    _key_locks = {}
+
+    @staticmethod
+    def _key_lock(key):
+        with QuestionCache._lock:
+            return QuestionCache._key_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def get(db, subject, set_number):
+        """Lấy câu hỏi của đề thi, chỉ đọc Firestore khi cache trống/hết hạn"""
+        key = (subject, set_number)
+        with QuestionCache._lock:
+            questions = QuestionCache._cache.get(key)
+        if questions is not None:
+            return questions
+
+        # Khóa theo từng đề: 400 HS mở cùng lúc thì chỉ 1 người đọc DB
+        with QuestionCache._key_lock(key):
+            with QuestionCache._lock:
+                questions = QuestionCache._cache.get(key)
+            if questions is not None:
+                return questions
+
+            docs = db.collection("questions")\
+                .where("subject", "==", subject)\
+                .where("set_number", "==", set_number)\
+                .stream()
+            questions = [d.to_dict() | {"id": d.id} for d in docs]
+
+            with QuestionCache._lock:
+                QuestionCache._cache[key] = questions
+            return questions
+
+    @staticmethod
+    def invalidate(subject, set_number):
+        """Xóa cache của một đề (gọi sau khi tạo/sửa câu hỏi)"""
+        with QuestionCache._lock:
+            QuestionCache._cache.pop((subject, set_number), None)
+
+    @staticmethod
+    def clear():
+        """Xóa toàn bộ cache"""
+        with QuestionCache._lock:
+            QuestionCache._cache.clear()
@@ -11,6 +11,8 @@ from components.teacher.question_form import QuestionCreationForm
 from components.teacher.question_edit import QuestionEditForm
 from components.teacher.grading import GradingInterface
 from components.teacher.user_management import UserManagementPanel
+from components.teacher.bulk_import import BulkImportPanel
+from components.teacher.analytics_panel import ExamAnalyticsPanel
 
 # Student components
 from components.student.exam_form import StudentExamForm
@@ -23,6 +25,8 @@ __all__ = [
     'QuestionEditForm',
     'GradingInterface',
     'UserManagementPanel',
+    'BulkImportPanel',
+    'ExamAnalyticsPanel',
     'StudentExamForm',
     'ResultView',
 ]
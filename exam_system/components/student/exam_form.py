@@ -3,7 +3,10 @@ import streamlit as st
 import time
 from firebase_admin import firestore
 from config import get_db
-from utils import FileUtils, InputValidator
+from cache import QuestionCache
+from models import SubmissionRepository
+from scoring import AnswerKey, CHOICE_TYPES, total_score
+from utils import FileUtils, InputValidator, RecordingUploader
 from audio_recorder_streamlit import audio_recorder
 
 class StudentExamForm:
@@ -34,21 +37,19 @@ class StudentExamForm:
 
         st.divider()
 
-        # 3. Tải câu hỏi (Logic cache giữ nguyên)
-        exam_key = f"questions_{subject}_{set_num}"
-        if exam_key not in st.session_state:
-            docs = db.collection("questions")\
-                .where("subject", "==", subject)\
-                .where("set_number", "==", set_num)\
-                .stream()
-            st.session_state[exam_key] = [d.to_dict() | {"id": d.id} for d in docs]
-        
-        questions = st.session_state[exam_key]
+        # 3. Tải câu hỏi (cache dùng chung cho cả lớp, không lưu theo session)
+        questions = QuestionCache.get(db, subject, set_num)
 
         if not questions:
             st.info("📭 Hiện chưa có câu hỏi nào cho đề thi này.")
             return
 
+        # Ký URL cho toàn bộ media của đề một lượt (dùng lại URL đã ký ở các lần rerun)
+        # Ảnh dùng biến thể nhỏ nhất đủ cho khung rộng 400px thay vì ảnh gốc
+        media_urls = FileUtils.get_signed_urls(
+            [FileUtils.pick_image(q, 400) for q in questions] + [q.get('audio_path') for q in questions]
+        )
+
         # 4. Form làm bài
         with st.form("exam_submission_form"):
             user_answers = {}
@@ -57,12 +58,10 @@ class StudentExamForm:
                 st.markdown(f"#### Câu {idx + 1}:")
                 
                 # Media
-                if q.get('image_path'):
-                    img_url = FileUtils.get_signed_url(q['image_path'])
-                    if img_url: st.image(img_url, width=400)
-                if q.get('audio_path'):
-                    aud_url = FileUtils.get_signed_url(q['audio_path'])
-                    if aud_url: st.audio(aud_url)
+                img_url = media_urls.get(FileUtils.pick_image(q, 400))
+                if img_url: st.image(img_url, width=400)
+                aud_url = media_urls.get(q.get('audio_path'))
+                if aud_url: st.audio(aud_url)
 
                 st.write(q.get('content', ''))
                 
@@ -70,7 +69,7 @@ class StudentExamForm:
                 q_type = q.get('type')
 
                 # Inputs
-                if q_type in ["Trắc nghiệm (MC)", "Nghe (Listening)"]:
+                if q_type in CHOICE_TYPES:
                     user_answers[qid] = st.radio("Chọn đáp án:", q.get('options', []), key=f"ans_{qid}", index=None)
                 elif q_type == "Tự luận (Essay)":
                     user_answers[qid] = st.text_area("Bài làm:", key=f"ans_{qid}")
@@ -79,7 +78,11 @@ class StudentExamForm:
                     audio_bytes = audio_recorder(text="", icon_size="2x", key=f"rec_{qid}")
                     if audio_bytes:
                         st.audio(audio_bytes, format="audio/wav")
-                        user_answers[qid] = audio_bytes
+                        # Upload ngay ở nền, chỉ giữ lại đường dẫn file
+                        try:
+                            user_answers[qid] = RecordingUploader.submit(student_id, subject, set_num, qid, audio_bytes)
+                        except ValueError as e:
+                            st.error(f"❌ {e}")
 
                 st.markdown("---")
 
@@ -89,19 +92,21 @@ class StudentExamForm:
 
     @staticmethod
     def _check_duplicate(db, student_id, subject, set_num):
-        docs = db.collection("submissions")\
-            .where("student_id", "==", student_id)\
-            .where("subject", "==", subject)\
-            .where("set_number", "==", set_num)\
-            .limit(1).stream()
-        return len(list(docs)) > 0
+        # Cache kết quả theo session: mỗi đề chỉ đọc DB 1 lần
+        cache = st.session_state.setdefault('submitted_exams', {})
+        doc_id = SubmissionRepository.make_id(student_id, subject, set_num)
+        if doc_id not in cache:
+            cache[doc_id] = SubmissionRepository(db).check_duplicate(student_id, subject, set_num)
+        return cache[doc_id]
 
     @staticmethod
     def _handle_submission(db, student_id, student_info, subject, set_num, questions, user_answers):
         # (Logic xử lý nộp bài giữ nguyên, chỉ thay đổi tham số đầu vào)
         with st.spinner("Đang nộp bài..."):
             final_answers_data = {}
-            total_score = 0.0
+            recordings = {}
+            # Chấm theo đúng bộ câu hỏi học sinh đã làm (cache có thể đã tải lại từ lúc hiện đề)
+            answer_key = AnswerKey.compile(questions)
             
             for q in questions:
                 qid = q['id']
@@ -111,55 +116,64 @@ class StudentExamForm:
                 ans_data = {
                     "question_content": q.get('content'),
                     "type": q_type,
-                    "max_score": 1.0,
+                    "max_score": answer_key.max_score(qid),
                     "score": 0.0,
                     "teacher_comment": ""
                 }
+                if q.get('image_path'):
+                    # Ảnh thu nhỏ để giáo viên xem lại đề khi chấm
+                    ans_data["question_image"] = FileUtils.pick_image(q, 200)
 
-                if q_type in ["Trắc nghiệm (MC)", "Nghe (Listening)"]:
+                if q_type in CHOICE_TYPES:
                     ans_data["student_choice"] = user_input
                     ans_data["correct_choice"] = q.get("correct_answer")
-                    if user_input == q.get("correct_answer"):
-                        ans_data["score"] = 1.0
-                        total_score += 1.0
+                    ans_data["score"] = answer_key.score_choice(qid, user_input)
                 
                 elif q_type == "Tự luận (Essay)":
                     ans_data["student_text"] = InputValidator.sanitize(user_input) if user_input else ""
                 
                 elif q_type == "Nói (Speaking)":
                     if user_input:
-                        import io
-                        class BytesFile:
-                            def __init__(self, data, name):
-                                self.getvalue = lambda: data
-                                self.name = name
-                                self.type = "audio/wav"
-                                self.size = len(data)
-                        
-                        file_obj = BytesFile(user_input, f"{student_id}_{qid}.wav")
-                        path = FileUtils.upload_to_storage(file_obj, "submission_recordings")
-                        ans_data["audio_path"] = path
+                        ans_data["audio_path"] = user_input
+                        recordings[user_input] = qid
 
                 final_answers_data[qid] = ans_data
 
+            # Bài nói đã được upload ở nền từ lúc ghi âm, chỉ cần chờ các file còn dở
+            if recordings:
+                metadata, errors = RecordingUploader.wait(list(recordings))
+                if errors:
+                    failed_qids = {recordings[path] for path in errors}
+                    failed = [str(idx + 1) for idx, q in enumerate(questions) if q['id'] in failed_qids]
+                    st.error(f"❌ Không tải được file ghi âm câu {', '.join(failed)}. Vui lòng nộp lại.")
+                    return
+                # Thời lượng, dung lượng trước/sau khi thu gọn và đường dẫn thực sự đã lưu (.mp3 hoặc .wav)
+                for path, info in metadata.items():
+                    final_answers_data[recordings[path]].update(info)
+
+            total = total_score(final_answers_data)
             submission_payload = {
                 "student_id": student_id, # Dùng ID đã fix
                 "student_name": student_info.get('full_name', 'Học sinh'),
                 "subject": subject,
                 "set_number": set_num,
                 "submitted_at": firestore.SERVER_TIMESTAMP,
+                "updated_at": firestore.SERVER_TIMESTAMP,
                 "status": "pending",
-                "final_score": total_score,
+                "final_score": total,
                 "answers": final_answers_data
             }
             
-            db.collection("submissions").add(submission_payload)
+            created = SubmissionRepository(db).create(submission_payload)
+            st.session_state.setdefault('submitted_exams', {})[
+                SubmissionRepository.make_id(student_id, subject, set_num)
+            ] = True
+            if not created:
+                st.warning(f"⚠️ Bạn đã hoàn thành bài thi môn {subject} - Đề {set_num} rồi!")
+                return
             
             st.balloons()
-            st.success(f"🎉 Nộp bài thành công! Điểm trắc nghiệm: {total_score}")
-            
-            if f"questions_{subject}_{set_num}" in st.session_state:
-                del st.session_state[f"questions_{subject}_{set_num}"]
+            st.success(f"🎉 Nộp bài thành công! Điểm trắc nghiệm: {total}")
             
             time.sleep(2)
             st.rerun()
\ No newline at end of file
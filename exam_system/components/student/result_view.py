@@ -3,31 +3,37 @@ Giao diện xem kết quả thi (Advanced Dashboard)
 """
 import streamlit as st
 import pandas as pd
+from datetime import datetime, timezone
 from config import get_db
+from models import SubmissionRepository
+from scoring import CHOICE_TYPES
 from utils import FileUtils
-from firebase_admin import firestore
 
 class ResultView:
+    EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    
     @staticmethod
     def render(student_info):
         st.subheader(f"📊 Hồ Sơ Học Tập: {student_info.get('full_name')}")
         db = get_db()
-        # .order_by("submitted_at", direction=firestore.Query.DESCENDING)\
-        # 1. TẢI DỮ LIỆU
-        submissions_ref = db.collection("submissions")\
-            .where("student_id", "==", student_info['student_code'])\
-            .stream()
-            
-        submissions = [d.to_dict() | {"id": d.id} for d in submissions_ref]
+        # 1. TẢI DỮ LIỆU (chỉ tải phần thay đổi kể từ lần đồng bộ trước)
+        cache = ResultView._sync(db, student_info['student_code'])
+        submissions = list(cache['docs'].values())
         
         if not submissions:
             st.info("👋 Bạn chưa có bài thi nào. Hãy vào mục 'Làm bài thi' để bắt đầu nhé!")
             return
 
         # 2. BỘ LỌC & THỐNG KÊ (DASHBOARD)
-        # Chuyển đổi sang DataFrame để dễ tính toán
-        df = pd.DataFrame(submissions)
-        df['score_display'] = df['final_score'].fillna(0) # Xử lý bài chưa chấm
+        # DataFrame được dựng lại chỉ khi dữ liệu thay đổi
+        if cache['df'] is None:
+            df = pd.DataFrame(
+                [{k: s.get(k) for k in ("id", "subject", "set_number", "status", "final_score")} for s in submissions]
+            )
+            df['score_display'] = df['final_score'].fillna(0) # Xử lý bài chưa chấm
+            cache['df'] = df
+            cache['views'] = {}
+        df = cache['df']
         
         # Bộ lọc Sidebar (hoặc Top bar)
         col_filter1, col_filter2 = st.columns(2)
@@ -36,48 +42,93 @@ class ResultView:
         with col_filter2:
             selected_status = st.selectbox("📌 Trạng thái:", ["Tất cả", "graded", "pending"], format_func=lambda x: "Đã chấm" if x == "graded" else "Chờ chấm" if x == "pending" else "Tất cả")
 
-        # Áp dụng lọc
-        filtered_df = df.copy()
-        filtered_data = submissions
-        
-        if selected_subject != "Tất cả":
-            filtered_df = filtered_df[filtered_df['subject'] == selected_subject]
-            filtered_data = [s for s in filtered_data if s['subject'] == selected_subject]
-            
-        if selected_status != "Tất cả":
-            filtered_df = filtered_df[filtered_df['status'] == selected_status]
-            filtered_data = [s for s in filtered_data if s['status'] == selected_status]
+        # Áp dụng lọc (kết quả được cache theo bộ lọc)
+        view_key = (selected_subject, selected_status)
+        if view_key not in cache['views']:
+            cache['views'][view_key] = ResultView._build_view(df, cache['docs'], selected_subject, selected_status)
+        view = cache['views'][view_key]
+        filtered_data = view['data']
 
         # --- METRICS SECTION ---
         st.markdown("### 📈 Tổng quan")
         m1, m2, m3 = st.columns(3)
         with m1:
-            st.metric("Tổng số bài thi", len(filtered_df))
+            st.metric("Tổng số bài thi", view['total'])
         with m2:
-            avg_score = filtered_df[filtered_df['status'] == 'graded']['final_score'].mean()
+            avg_score = view['avg_score']
             st.metric("Điểm trung bình", f"{avg_score:.2f}" if pd.notna(avg_score) else "N/A")
         with m3:
-            completed = len(filtered_df[filtered_df['status'] == 'graded'])
-            st.metric("Đã hoàn thành chấm", f"{completed}/{len(filtered_df)}")
+            st.metric("Đã hoàn thành chấm", f"{view['completed']}/{view['total']}")
 
         # --- CHART SECTION ---
-        if not filtered_df.empty and selected_status != "pending":
+        if view['total'] and selected_status != "pending":
             st.markdown("##### Biểu đồ điểm số")
-            chart_data = filtered_df[filtered_df['status'] == 'graded'][['subject', 'set_number', 'final_score']]
+            chart_data = view['chart']
             if not chart_data.empty:
-                chart_data['Exam Label'] = chart_data['subject'] + " - Đề " + chart_data['set_number'].astype(str)
-                st.bar_chart(chart_data.set_index('Exam Label')['final_score'], color="#4CAF50")
+                st.bar_chart(chart_data, color="#4CAF50")
 
         st.divider()
 
         # 3. CHI TIẾT TỪNG BÀI THI
         st.markdown("### 📑 Chi tiết bài làm")
         
+        # Ký trước URL ghi âm của mọi bài đang hiển thị (dùng lại ở các lần rerun)
+        audio_urls = FileUtils.get_signed_urls([
+            ans.get('audio_path')
+            for sub in filtered_data
+            for ans in sub.get('answers', {}).values()
+        ])
+        
         for sub in filtered_data:
-            ResultView._render_submission_card(sub)
+            ResultView._render_submission_card(sub, audio_urls)
+
+    @staticmethod
+    def _sync(db, student_id):
+        """
+        Đồng bộ bài thi của học sinh vào cache theo session.
+        Lần đầu tải toàn bộ, các lần sau chỉ tải bài có updated_at mới hơn mốc đã lưu.
+        """
+        cache = st.session_state.get('result_cache')
+        if not cache or cache['student_id'] != student_id:
+            docs = SubmissionRepository(db).list_by_student(student_id)
+            cache = {"student_id": student_id, "docs": {}, "watermark": None, "df": None, "views": {}}
+            st.session_state['result_cache'] = cache
+        else:
+            docs = SubmissionRepository(db).list_by_student(student_id, updated_after=cache['watermark'])
+        
+        if docs:
+            for doc in docs:
+                cache['docs'][doc['id']] = doc
+            cache['df'] = None
+        
+        stamps = [d['updated_at'] for d in cache['docs'].values() if d.get('updated_at')]
+        # Bài cũ chưa có updated_at: chỉ theo dõi các bài có updated_at từ nay về sau
+        cache['watermark'] = max(stamps) if stamps else ResultView.EPOCH
+        return cache
+    
+    @staticmethod
+    def _build_view(df, docs, selected_subject, selected_status):
+        """Tính dữ liệu đã lọc, chỉ số và biểu đồ cho 1 bộ lọc"""
+        filtered_df = df
+        if selected_subject != "Tất cả":
+            filtered_df = filtered_df[filtered_df['subject'] == selected_subject]
+        if selected_status != "Tất cả":
+            filtered_df = filtered_df[filtered_df['status'] == selected_status]
+        
+        graded = filtered_df[filtered_df['status'] == 'graded']
+        chart_data = graded[['subject', 'set_number', 'final_score']].copy()
+        chart_data['Exam Label'] = chart_data['subject'] + " - Đề " + chart_data['set_number'].astype(str)
+        
+        return {
+            "data": [docs[i] for i in filtered_df['id']],
+            "total": len(filtered_df),
+            "avg_score": graded['final_score'].mean(),
+            "completed": len(graded),
+            "chart": chart_data.set_index('Exam Label')['final_score'],
+        }
 
     @staticmethod
-    def _render_submission_card(submission):
+    def _render_submission_card(submission, audio_urls):
         """Hiển thị Card chi tiết cho từng bài thi"""
         status = submission.get('status')
         score = submission.get('final_score', 0)
@@ -118,10 +169,10 @@ class ResultView:
             
             for qid in sorted_qids:
                 ans = answers[qid]
-                ResultView._render_question_detail(qid, ans, status)
+                ResultView._render_question_detail(qid, ans, status, audio_urls, submission.get('id', ''))
 
     @staticmethod
-    def _render_question_detail(qid, ans, status):
+    def _render_question_detail(qid, ans, status, audio_urls, submission_id=''):
         """Render từng câu hỏi kèm feedback"""
         q_type = ans.get('type', 'Unknown')
         student_score = ans.get('score', 0)
@@ -149,17 +200,17 @@ class ResultView:
             
             with col_cont:
                 # 1. Hiển thị nội dung trả lời
-                if q_type in ["Trắc nghiệm (MC)", "Nghe (Listening)"]:
+                if q_type in CHOICE_TYPES:
                     st.write(f"Bạn chọn: **{ans.get('student_choice')}**")
                     if status == 'graded':
                         st.write(f"Đáp án đúng: `{ans.get('correct_choice')}`")
                 
                 elif q_type == "Tự luận (Essay)":
-                    st.text_area("Bài làm:", value=ans.get('student_text', ''), disabled=True, height=100)
+                    st.text_area("Bài làm:", value=ans.get('student_text', ''), disabled=True, height=100, key=f"result_{submission_id}_{qid}")
                 
                 elif q_type == "Nói (Speaking)":
                     if ans.get('audio_path'):
-                        url = FileUtils.get_signed_url(ans.get('audio_path'))
+                        url = audio_urls.get(ans.get('audio_path'))
                         if url: 
                             st.audio(url)
                             st.caption("File ghi âm của bạn")
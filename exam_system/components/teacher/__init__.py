@@ -2,10 +2,14 @@ from .question_form import QuestionCreationForm
 from .question_edit import QuestionEditForm
 from .grading import GradingInterface
 from .user_management import UserManagementPanel
+from .bulk_import import BulkImportPanel
+from .analytics_panel import ExamAnalyticsPanel
 
 __all__ = [
     'QuestionCreationForm',
     'QuestionEditForm',
     'GradingInterface',
-    'UserManagementPanel'
+    'UserManagementPanel',
+    'BulkImportPanel',
+    'ExamAnalyticsPanel'
 ]
@@ -0,0 +1,101 @@
+"""Thống kê đề thi: phân tích câu hỏi trên toàn bộ bài nộp"""
+import streamlit as st
+import pandas as pd
+from config import get_db
+from models import ExamStatsRepository
+from analytics import analyze_exam
+
+class ExamAnalyticsPanel:
+    @staticmethod
+    def render():
+        st.subheader("📈 Thống Kê Đề Thi")
+        c1, c2, c3 = st.columns(3)
+        with c1: subject = st.selectbox("Môn:", ["Toán", "Tiếng Việt", "Tiếng Anh"], key="stats_sub")
+        with c2: set_num = st.selectbox("Đề:", [1, 2, 3], key="stats_set")
+        with c3: status = st.selectbox("Bài nộp:", ["Tất cả", "graded"], key="stats_status",
+                                       format_func=lambda s: "Đã chấm" if s == "graded" else s)
+
+        ExamAnalyticsPanel._render_overview(subject, set_num)
+
+        st.write("#### Phân tích chi tiết")
+        st.caption("Tải toàn bộ bài nộp của đề để tính độ khó, độ phân biệt và phân tích lựa chọn.")
+        if st.button("📊 Phân tích", key="stats_run"):
+            with st.spinner("Đang tải và phân tích bài nộp..."):
+                st.session_state['exam_stats'] = analyze_exam(
+                    get_db(), subject, set_num, None if status == "Tất cả" else status
+                )
+                st.session_state['exam_stats_key'] = (subject, set_num, status)
+
+        if st.session_state.get('exam_stats_key') != (subject, set_num, status):
+            return
+        result = st.session_state.get('exam_stats')
+        if not result:
+            st.info("Chưa có bài nộp nào cho đề này.")
+            return
+
+        summary = result['summary']
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Số bài nộp", summary['submissions'])
+        m2.metric("Điểm TB", f"{summary['mean']:.2f} / {summary['max_total']:g}")
+        m3.metric("Độ lệch chuẩn", f"{summary['std']:.2f}")
+        m4.metric("Độ tin cậy (α)", "-" if summary['alpha'] != summary['alpha'] else f"{summary['alpha']:.2f}")
+
+        st.write("##### Phân bố tổng điểm")
+        st.bar_chart(result['histogram'].set_index("range"))
+
+        st.write("##### Chỉ số từng câu")
+        st.caption("Độ khó: tỉ lệ điểm đạt được (càng cao càng dễ). "
+                   "Độ phân biệt: chênh lệch giữa nhóm 27% cao nhất và thấp nhất (< 0.2 nên xem lại câu hỏi).")
+        items = result['items'].rename(columns={
+            "qid": "Câu", "type": "Loại", "answered": "Số bài làm", "difficulty": "Độ khó",
+            "discrimination": "Độ phân biệt", "item_total_corr": "Tương quan câu-tổng",
+            "correct_answer": "Đáp án",
+        })
+        st.dataframe(items.round(3), use_container_width=True, hide_index=True)
+
+        if result['distractors']:
+            st.write("##### Phân tích lựa chọn (câu trắc nghiệm)")
+            qid = st.selectbox("Câu:", list(result['distractors'].keys()), key="stats_qid")
+            distractor = result['distractors'][qid].rename(columns={
+                "option": "Lựa chọn", "count": "Số lượt", "share": "Tỉ lệ",
+                "upper": "Nhóm cao", "lower": "Nhóm thấp", "is_correct": "Đúng",
+            })
+            st.dataframe(distractor.round(3), use_container_width=True, hide_index=True)
+
+    @staticmethod
+    def _render_overview(subject, set_num):
+        """Tổng quan từ thống kê gộp của đề (không quét bài nộp)"""
+        repo = ExamStatsRepository(get_db())
+        stats = repo.get(subject, set_num)
+
+        head, action = st.columns([3, 1])
+        with head: st.write("#### Tổng quan")
+        with action:
+            if st.button("♻️ Tính lại", key="stats_rebuild", help="Tính lại thống kê từ toàn bộ bài nộp"):
+                with st.spinner("Đang tính lại..."):
+                    count = repo.rebuild(subject, set_num)
+                st.success(f"Đã tính lại từ {count} bài nộp")
+                stats = repo.get(subject, set_num)
+
+        if not stats or not stats['count']:
+            st.info("Đề này chưa có bài nộp.")
+            return
+
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Số bài nộp", stats['count'])
+        m2.metric("Đã chấm", stats['graded'])
+        m3.metric("Điểm TB", f"{stats['mean']:.2f}")
+        m4.metric("Độ lệch chuẩn", f"{stats['std']:.2f}")
+
+        c1, c2 = st.columns(2)
+        with c1:
+            hist = pd.DataFrame(
+                [(int(b), n) for b, n in stats['hist'].items()], columns=["Điểm", "Số bài"]
+            ).sort_values("Điểm")
+            st.bar_chart(hist.set_index("Điểm"))
+        with c2:
+            correct = pd.DataFrame(
+                [(qid, n / stats['count']) for qid, n in sorted(stats['correct'].items())],
+                columns=["Câu", "Tỉ lệ đạt điểm tối đa"]
+            )
+            st.dataframe(correct.round(3), use_container_width=True, hide_index=True)
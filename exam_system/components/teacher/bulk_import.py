@@ -0,0 +1,67 @@
+"""Nhập câu hỏi hàng loạt"""
+import streamlit as st
+import pandas as pd
+from config import get_db
+from importer import QuestionImporter, COLUMNS
+
+class BulkImportPanel:
+    @staticmethod
+    def render():
+        st.subheader("📥 Nhập Câu Hỏi Hàng Loạt")
+        st.caption(
+            f"Các cột: {', '.join(COLUMNS)}. Lựa chọn cách nhau dấu phẩy; "
+            "cột image/audio ghi tên file nằm trong file zip media."
+        )
+        st.download_button(
+            "📄 Tải file mẫu (CSV)", QuestionImporter.template_csv(),
+            file_name="mau_cau_hoi.csv", mime="text/csv"
+        )
+
+        with st.form("bulk_import_form"):
+            questions_file = st.file_uploader("File câu hỏi (CSV/XLSX/JSON)", type=["csv", "xlsx", "json"])
+            media_zip = st.file_uploader("File zip media (không bắt buộc)", type=["zip"])
+            dry_run = st.checkbox("Chỉ kiểm tra, chưa ghi (dry-run)", value=True)
+            submitted = st.form_submit_button("Nhập", type="primary")
+
+        if submitted:
+            if not questions_file:
+                st.error("Chưa chọn file câu hỏi")
+                return
+
+            importer = QuestionImporter(get_db())
+            try:
+                rows = importer.read_rows(questions_file)
+                media, media_errors = importer.read_media(media_zip)
+            except ValueError as e:
+                st.error(str(e))
+                return
+
+            progress_bar = st.progress(0.0, text="Đang nhập...")
+            with st.spinner("Đang kiểm tra và nhập..."):
+                report = importer.run(
+                    rows, media, media_errors, dry_run=dry_run,
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Đã ghi {done}/{total} câu")
+                )
+            progress_bar.empty()
+            st.session_state['bulk_import_report'] = report | {"dry_run": dry_run}
+
+        report = st.session_state.get('bulk_import_report')
+        if report:
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Tổng số dòng", report['total'])
+            c2.metric("Hợp lệ", report['valid'])
+            c3.metric("Đã tạo", report['created'])
+            c4.metric("Dòng lỗi", len(report['errors']))
+
+            if report['dry_run']:
+                st.info(f"🔎 Dry-run: {report['valid']}/{report['total']} dòng hợp lệ, chưa ghi gì. Bỏ chọn dry-run để nhập.")
+            elif report['created']:
+                st.success(f"✅ Đã tạo {report['created']} câu hỏi, upload {report['media_uploaded']} file media.")
+
+            if report['errors']:
+                errors_df = pd.DataFrame(report['errors']).rename(columns={"row": "Dòng", "error": "Lỗi"})
+                st.dataframe(errors_df, use_container_width=True, hide_index=True)
+                st.download_button(
+                    "📥 Tải báo cáo lỗi", errors_df.to_csv(index=False).encode("utf-8-sig"),
+                    file_name="loi_nhap_cau_hoi.csv", mime="text/csv"
+                )
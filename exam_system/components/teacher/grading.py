@@ -2,13 +2,19 @@
 import streamlit as st
 import time
 from config import get_db
+from models import SubmissionRepository
+from scoring import CHOICE_TYPES, total_score
 from utils import FileUtils
+from .question_grading import QuestionGrading
 
 class GradingInterface:
+    PAGE_SIZE = 20
+    
     @staticmethod
     def render():
         st.subheader("💯 Chấm Bài")
         db = get_db()
+        repo = SubmissionRepository(db)
         
         # Bộ lọc
         col1, col2, col3 = st.columns(3)
@@ -16,20 +22,24 @@ class GradingInterface:
         with col2: filter_set = st.selectbox("Mã đề:", [1, 2, 3], key="grade_set")
         with col3: filter_status = st.selectbox("Trạng thái:", ["Tất cả", "pending", "graded"], key="grade_status")
         
+        mode = st.radio("Chế độ chấm:", ["Theo bài nộp", "Theo câu hỏi"], horizontal=True, key="grade_mode")
+        if mode == "Theo câu hỏi":
+            # Chấm 1 câu cho cả lớp, lưu cả trang 1 lần (bộ lọc trạng thái không áp dụng)
+            QuestionGrading.render(filter_subject, filter_set)
+            return
+        
         if st.button("🔄 Tải bài nộp"):
-            query = db.collection("submissions")\
-                .where("subject", "==", filter_subject)\
-                .where("set_number", "==", filter_set)\
-                .limit(100)
-            
-            if filter_status != "Tất cả":
-                query = query.where("status", "==", filter_status)
+            st.session_state['grading_filter'] = (
+                filter_subject, filter_set, None if filter_status == "Tất cả" else filter_status
+            )
+            # Mỗi phần tử là cursor để tải trang tương ứng (trang đầu không cần cursor)
+            st.session_state['grading_cursors'] = [None]
+            st.session_state['grading_details'] = {}
+            GradingInterface._load_page(repo)
             
-            docs = query.stream()
-            st.session_state['grading_list'] = [d.to_dict() | {"id": d.id} for d in docs]
-            
-        if st.session_state.get('grading_list'):
+        if 'grading_list' in st.session_state:
             subs = st.session_state['grading_list']
+            GradingInterface._render_pager(repo)
             
             if not subs:
                 st.info("Không tìm thấy bài thi nào.")
@@ -38,14 +48,23 @@ class GradingInterface:
                 selected_label = st.selectbox("Chọn bài thi cần chấm:", list(options_map.keys()))
                 selected_sub = subs[options_map[selected_label]]
                 sub_id = selected_sub['id']
-                answers = selected_sub.get('answers', {})
+                
+                # Chỉ tải toàn bộ answers khi mở bài cụ thể
+                details = st.session_state.setdefault('grading_details', {})
+                if sub_id not in details:
+                    details[sub_id] = repo.get(sub_id) or {}
+                answers = details[sub_id].get('answers', {})
                 
                 st.divider()
                 st.markdown(f"### 📝 Đang chấm: {selected_sub['student_name']}")
                 st.caption(f"Thời gian nộp: {selected_sub.get('submitted_at', 'N/A')}")
                 
+                audio_urls = FileUtils.get_signed_urls(
+                    [a.get('audio_path') for a in answers.values()] + [a.get('question_image') for a in answers.values()]
+                )
+                
                 with st.form(f"grading_form_{sub_id}"):
-                    total_new_score = 0.0
+                    grades = {}  # Điểm/lời phê mới, so sánh với answers đã tải để chỉ lưu phần thay đổi
                     sorted_qids = sorted(answers.keys())
                     
                     for qid in sorted_qids:
@@ -53,15 +72,18 @@ class GradingInterface:
                         q_type = ans.get('type', 'Unknown')
                         
                         st.markdown(f"**Câu hỏi ({q_type}):** {ans.get('question_content', 'Không có nội dung')}")
+                        image_url = audio_urls.get(ans.get('question_image'))
+                        if image_url:
+                            st.image(image_url, width=200)
                         
                         # TRẮC NGHIỆM
-                        if q_type in ["Trắc nghiệm (MC)", "Nghe (Listening)"]:
+                        if q_type in CHOICE_TYPES:
                             col_a, col_b = st.columns(2)
                             with col_a: st.write(f"HS chọn: **{ans.get('student_choice')}**")
                             with col_b: st.write(f"Đáp án đúng: `{ans.get('correct_choice')}`")
                             
                             new_score = st.number_input(f"Điểm câu {qid}:", value=float(ans.get('score', 0)), step=0.25, key=f"score_{qid}")
-                            ans['score'] = new_score
+                            grades[qid] = {"score": new_score}
                         
                         # TỰ LUẬN
                         elif q_type == "Tự luận (Essay)":
@@ -73,16 +95,17 @@ class GradingInterface:
                             with c_comment:
                                 comment = st.text_input("Lời phê:", value=ans.get('teacher_comment', ''), key=f"cmt_{qid}")
                             
-                            ans['score'] = new_score
-                            ans['teacher_comment'] = comment
+                            grades[qid] = {"score": new_score, "teacher_comment": comment}
                         
                         # NÓI (SPEAKING)
                         elif q_type == "Nói (Speaking)":
                             audio_path = ans.get('audio_path')
                             if audio_path:
-                                audio_url = FileUtils.get_signed_url(audio_path)
+                                audio_url = audio_urls.get(audio_path)
                                 if audio_url:
                                     st.audio(audio_url)
+                                    if ans.get('audio_duration'):
+                                        st.caption(f"Thời lượng: {ans['audio_duration']} giây")
                                 else:
                                     st.error("File lỗi hoặc đã bị xóa.")
                             else:
@@ -94,23 +117,57 @@ class GradingInterface:
                             with c_comment:
                                 comment = st.text_input("Nhận xét phát âm/ngữ pháp:", value=ans.get('teacher_comment', ''), key=f"cmt_{qid}")
                             
-                            ans['score'] = new_score
-                            ans['teacher_comment'] = comment
+                            grades[qid] = {"score": new_score, "teacher_comment": comment}
                         
-                        total_new_score += ans['score']
                         st.markdown("---")
                     
+                    total_new_score = total_score(answers, grades)
                     st.subheader(f"📊 Tổng điểm: {total_new_score}")
                     
                     if st.form_submit_button("Lưu Kết Quả Chấm", type="primary"):
                         with st.spinner("Đang lưu điểm số..."):
-                            db.collection("submissions").document(sub_id).update({
-                                "answers": answers,
-                                "final_score": total_new_score,
-                                "status": "graded"
-                            })
-                            st.success(f"Đã chấm xong cho {selected_sub['student_name']}! Điểm: {total_new_score}")
+                            changes = {
+                                qid: {k: v for k, v in fields.items() if answers[qid].get(k) != v}
+                                for qid, fields in grades.items()
+                            }
+                            changes = {qid: fields for qid, fields in changes.items() if fields}
+                            graded = repo.save_grades(sub_id, changes)
+                            st.success(f"Đã chấm xong cho {selected_sub['student_name']}! Điểm: {graded['final_score']}")
+                            # Bản vừa đọc trong transaction (gồm cả điểm người khác vừa chấm)
+                            details[sub_id] = graded
                             selected_sub['status'] = 'graded'
-                            selected_sub['final_score'] = total_new_score
+                            selected_sub['final_score'] = graded['final_score']
                             time.sleep(1)
                             st.rerun()
+    
+    @staticmethod
+    def _load_page(repo):
+        """Tải trang hiện tại (trang cuối trong danh sách cursor)"""
+        subject, set_num, status = st.session_state['grading_filter']
+        cursors = st.session_state['grading_cursors']
+        items, last_doc = repo.list_summaries(
+            subject, set_num, status,
+            page_size=GradingInterface.PAGE_SIZE,
+            start_after=cursors[-1]
+        )
+        st.session_state['grading_list'] = items
+        st.session_state['grading_next_cursor'] = last_doc if len(items) == GradingInterface.PAGE_SIZE else None
+    
+    @staticmethod
+    def _render_pager(repo):
+        """Nút chuyển trang dùng cursor Firestore"""
+        cursors = st.session_state['grading_cursors']
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("⬅️ Trang trước", disabled=len(cursors) <= 1, key="grade_prev"):
+                cursors.pop()
+                GradingInterface._load_page(repo)
+                st.rerun()
+        with col_page:
+            st.caption(f"Trang {len(cursors)} · {len(st.session_state['grading_list'])} bài")
+        with col_next:
+            next_cursor = st.session_state.get('grading_next_cursor')
+            if st.button("Trang sau ➡️", disabled=next_cursor is None, key="grade_next"):
+                cursors.append(next_cursor)
+                GradingInterface._load_page(repo)
+                st.rerun()
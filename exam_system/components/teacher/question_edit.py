@@ -2,7 +2,10 @@
 import streamlit as st
 import time
 from config import get_db
+from cache import QuestionCache
 from utils import FileUtils, InputValidator
+from regrade import RegradeJob
+from scoring import CHOICE_TYPES, parse_partial_credit, format_partial_credit, question_max_score
 
 class QuestionEditForm:
     @staticmethod
@@ -18,6 +21,24 @@ class QuestionEditForm:
             docs = db.collection("questions").where("subject", "==", find_sub).where("set_number", "==", find_set).stream()
             st.session_state['edit_list'] = [d.to_dict() | {"id": d.id} for d in docs]
             
+        if st.session_state.get('regrade_result'):
+            st.info(st.session_state.pop('regrade_result'))
+        # Job chấm lại đang chạy ở nền, hoặc bị ngắt giữa chừng (khởi động lại server, lỗi mạng...)
+        active = []
+        for job in RegradeJob(get_db()).list_running(find_sub, find_set):
+            if RegradeJob.is_active(job['id']):
+                active.append(job['id'])
+                continue
+            c_info, c_btn = st.columns([3, 1])
+            with c_info:
+                st.warning(f"⏸️ Chấm lại theo đáp án '{job['correct_answer']}' chưa xong ({job.get('processed', 0)} bài đã duyệt)")
+            with c_btn:
+                if st.button("▶️ Chạy tiếp", key=f"regrade_{job['id']}"):
+                    QuestionEditForm._start_regrade(job['id'])
+                    st.rerun()
+        if active:
+            QuestionEditForm._render_regrade_progress(active)
+            
         if st.session_state.get('edit_list'):
             q_list = st.session_state['edit_list']
             label_map = {f"({q['type']}) {q['content'][:40]}...": i for i, q in enumerate(q_list)}
@@ -29,9 +50,19 @@ class QuestionEditForm:
                 old_opts = ", ".join(q_data.get('options', []))
                 new_opts_str = st.text_input("Các lựa chọn (cách nhau dấu phẩy):", value=old_opts)
                 new_correct = st.text_input("Đáp án đúng:", value=q_data.get('correct_answer', ''))
+                c_max, c_partial = st.columns([1, 3])
+                with c_max:
+                    new_max = st.number_input("Điểm tối đa:", min_value=0.25, value=question_max_score(q_data), step=0.25)
+                with c_partial:
+                    new_partial_str = st.text_input(
+                        "Điểm một phần (vd: B=0.5):", value=format_partial_credit(q_data.get('partial_credit'))
+                    )
                 
                 st.markdown("##### 📂 Cập nhật file (Bỏ qua nếu không muốn đổi)")
                 if q_data.get('image_path'):
+                    thumb_url = FileUtils.get_signed_url(FileUtils.pick_image(q_data, 200))
+                    if thumb_url:
+                        st.image(thumb_url, width=200)
                     st.caption(f"Ảnh hiện tại: {q_data['image_path']}")
                 new_image = st.file_uploader("Thay ảnh mới (JPG/PNG):", type=["jpg", "png", "jpeg"], key="edit_img")
                 
@@ -41,17 +72,25 @@ class QuestionEditForm:
                 
                 if st.form_submit_button("Lưu Thay Đổi", type="primary"):
                     db = get_db()
+                    try:
+                        new_partial = parse_partial_credit(new_partial_str)
+                    except ValueError as e:
+                        st.error(str(e))
+                        return
                     update_data = {
                         "content": InputValidator.sanitize(new_content, 1000),
                         "options": [x.strip() for x in new_opts_str.split(",")] if new_opts_str else [],
-                        "correct_answer": new_correct
+                        "correct_answer": new_correct,
+                        "max_score": new_max,
+                        "partial_credit": new_partial
                     }
                     
                     with st.spinner("Đang cập nhật..."):
                         if new_image:
-                            new_img_path = FileUtils.upload_to_storage(new_image, "question_images")
+                            new_img_path, new_img_variants = FileUtils.upload_image(new_image, "question_images")
                             if new_img_path:
                                 update_data["image_path"] = new_img_path
+                                update_data["image_variants"] = new_img_variants
                         
                         if new_audio:
                             new_aud_path = FileUtils.upload_to_storage(new_audio, "question_audio")
@@ -59,8 +98,45 @@ class QuestionEditForm:
                                 update_data["audio_path"] = new_aud_path
                         
                         db.collection("questions").document(q_data['id']).update(update_data)
+                        # Bỏ tham chiếu tới media cũ (blob chỉ bị xóa khi không còn câu nào dùng)
+                        if "image_path" in update_data:
+                            FileUtils.release(q_data.get('image_path'), question_id=q_data['id'])
+                        if "audio_path" in update_data:
+                            FileUtils.release(q_data.get('audio_path'))
+                        QuestionCache.invalidate(q_data.get('subject', find_sub), q_data.get('set_number', find_set))
+                        
+                        # Đổi đáp án/thang điểm: chấm lại các bài đã nộp
+                        rescored = (new_correct, new_max, new_partial) != (
+                            q_data.get('correct_answer'), question_max_score(q_data), q_data.get('partial_credit') or {}
+                        )
+                        if q_data.get('type') in CHOICE_TYPES and rescored:
+                            RegradeJob(db).start(q_data | update_data)
+                            QuestionEditForm._start_regrade(q_data['id'])
                         st.success("✅ Đã sửa thành công! Vui lòng bấm 'Tìm kiếm' lại để thấy thay đổi.")
                         if 'edit_list' in st.session_state:
                             del st.session_state['edit_list']
                         time.sleep(1)
                         st.rerun()
+
+    @staticmethod
+    def _start_regrade(question_id):
+        """Chạy job ở nền, kết quả hiện khi job xong (kể cả sau khi chuyển trang)"""
+        RegradeJob(get_db()).run_in_background(question_id)
+        st.session_state.setdefault('regrade_watch', set()).add(question_id)
+
+    @staticmethod
+    @st.fragment(run_every=2)
+    def _render_regrade_progress(question_ids):
+        """Tiến độ các job đang chạy ở nền, tự cập nhật mà không chạy lại cả trang"""
+        repo = RegradeJob(get_db())
+        for question_id in question_ids:
+            job = repo.get(question_id) or {}
+            done, total = job.get('processed', 0), job.get('total', 0)
+            if job.get('status') == "done" or not RegradeJob.is_active(question_id):
+                if job.get('status') == "done" and question_id in st.session_state.get('regrade_watch', set()):
+                    st.session_state['regrade_watch'].discard(question_id)
+                    st.session_state['regrade_result'] = f"🔁 Đã chấm lại: {job['changed']}/{job['processed']} bài thay đổi điểm."
+                # Có job vừa dừng: chạy lại cả trang để bỏ thanh tiến độ (và hiện nút chạy tiếp nếu bị lỗi)
+                st.rerun()
+            st.progress(min(done / total, 1.0) if total else 0.0,
+                        text=f"🔁 Đang chấm lại bài đã nộp: đã duyệt {done}/{max(total, done)} bài")
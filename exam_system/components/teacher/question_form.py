@@ -2,7 +2,9 @@
 import streamlit as st
 from firebase_admin import firestore
 from config import get_db
+from cache import QuestionCache
 from utils import FileUtils, InputValidator
+from scoring import CHOICE_TYPES, QUESTION_TYPES, parse_partial_credit
 
 class QuestionCreationForm:
     @staticmethod
@@ -12,34 +14,56 @@ class QuestionCreationForm:
             c1, c2, c3 = st.columns(3)
             with c1: subject = st.selectbox("Môn thi:", ["Toán", "Tiếng Việt", "Tiếng Anh"])
             with c2: set_num = st.selectbox("Mã đề:", [1, 2, 3])
-            with c3: q_type = st.selectbox("Loại câu:", ["Trắc nghiệm (MC)", "Nghe (Listening)", "Nói (Speaking)", "Tự luận (Essay)"])
+            with c3: q_type = st.selectbox("Loại câu:", QUESTION_TYPES)
             
             content = st.text_area("Đề bài:", max_chars=1000)
             col_up1, col_up2 = st.columns(2)
-            with col_up1: image_file = st.file_uploader("📷 Hình ảnh", type=["jpg", "png"])
+            with col_up1: image_file = st.file_uploader("📷 Hình ảnh", type=["jpg", "jpeg", "png"])
             with col_up2: audio_file = st.file_uploader("🎧 Audio", type=["mp3", "wav"]) if q_type in ["Nghe (Listening)", "Trắc nghiệm (MC)"] else None
             
             options = []
             correct_ans = ""
-            if q_type in ["Trắc nghiệm (MC)", "Nghe (Listening)"]:
+            partial_str = ""
+            max_score = st.number_input("Điểm tối đa:", min_value=0.25, value=1.0, step=0.25)
+            if q_type in CHOICE_TYPES:
                 opts_str = st.text_input("Các lựa chọn (cách nhau dấu phẩy):")
                 if opts_str: options = [InputValidator.sanitize(x.strip()) for x in opts_str.split(",")]
                 correct_ans = st.selectbox("Đáp án đúng:", options if options else ["Chưa nhập"])
+                partial_str = st.text_input("Điểm một phần (không bắt buộc, vd: B=0.5, C=0.25):")
             
             if st.form_submit_button("Lưu Câu Hỏi", type="primary"):
                 if not content.strip():
                     st.error("Thiếu nội dung câu hỏi")
                     return
+                try:
+                    partial_credit = parse_partial_credit(partial_str)
+                except ValueError as e:
+                    st.error(str(e))
+                    return
+                unknown = [o for o in partial_credit if o not in options]
+                if unknown:
+                    st.error(f"Lựa chọn {', '.join(unknown)} không có trong các lựa chọn")
+                    return
                 
                 with st.spinner("Đang lưu..."):
                     db = get_db()
-                    img_path = FileUtils.upload_to_storage(image_file, "question_images")
+                    img_path, img_variants = FileUtils.upload_image(image_file, "question_images")
                     aud_path = FileUtils.upload_to_storage(audio_file, "question_audio")
                     
-                    db.collection("questions").add({
-                        "subject": subject, "set_number": set_num, "type": q_type,
-                        "content": InputValidator.sanitize(content, 1000), "options": options,
-                        "correct_answer": correct_ans, "image_path": img_path, "audio_path": aud_path,
-                        "created_at": firestore.SERVER_TIMESTAMP
-                    })
+                    try:
+                        db.collection("questions").add({
+                            "subject": subject, "set_number": set_num, "type": q_type,
+                            "content": InputValidator.sanitize(content, 1000), "options": options,
+                            "correct_answer": correct_ans, "image_path": img_path, "audio_path": aud_path,
+                            "image_variants": img_variants,
+                            "max_score": max_score, "partial_credit": partial_credit,
+                            "created_at": firestore.SERVER_TIMESTAMP
+                        })
+                    except Exception as e:
+                        # Câu hỏi không được tạo: trả lại tham chiếu media vừa upload
+                        FileUtils.release(img_path)
+                        FileUtils.release(aud_path)
+                        st.error(f"Lỗi lưu câu hỏi: {e}")
+                        return
+                    QuestionCache.invalidate(subject, set_num)
                     st.success("✅ Đã tạo câu hỏi!")
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""Chấm theo câu hỏi: 1 câu trên nhiều bài nộp, lưu cả trang trong 1 lần ghi"""
+import streamlit as st
+from config import get_db
+from cache import QuestionCache
+from models import SubmissionRepository
+from scoring import CHOICE_TYPES, MANUAL_TYPES, question_max_score
+from utils import FileUtils
+
+
+class QuestionGrading:
+    PAGE_SIZE = 30
+
+    @staticmethod
+    def render(subject, set_num):
+        db = get_db()
+        repo = SubmissionRepository(db)
+        questions = QuestionCache.get(db, subject, set_num)
+        if not questions:
+            st.info("Đề này chưa có câu hỏi.")
+            return
+
+        labels = [f"Câu {i + 1} ({q.get('type')}): {(q.get('content') or '')[:50]}" for i, q in enumerate(questions)]
+        # Mặc định mở câu tự luận/nói đầu tiên
+        default = next((i for i, q in enumerate(questions) if q.get('type') in MANUAL_TYPES), 0)
+        idx = st.selectbox("Câu hỏi:", range(len(questions)), index=default,
+                           format_func=lambda i: labels[i], key="bq_question")
+        question = questions[idx]
+        qid = question['id']
+
+        view = (subject, set_num, qid)
+        if st.session_state.get('bq_view') != view:
+            st.session_state['bq_view'] = view
+            st.session_state['bq_cursors'] = [None]
+            QuestionGrading._load_page(repo)
+
+        hide_graded = st.checkbox("Ẩn bài đã chấm câu này", key="bq_hide_graded")
+        QuestionGrading._render_pager(repo)
+
+        rows = st.session_state['bq_list']
+        if hide_graded:
+            rows = [r for r in rows if not QuestionGrading._is_graded(r, qid)]
+        if not rows:
+            st.info("Không có bài nộp nào cần chấm ở trang này.")
+            return
+
+        media_urls = FileUtils.get_signed_urls([(r.get('answers', {}).get(qid) or {}).get('audio_path') for r in rows])
+        manual_qids = [q['id'] for q in questions if q.get('type') in MANUAL_TYPES]
+        max_score = question_max_score(question)
+
+        with st.form(f"bq_form_{subject}_{set_num}_{qid}"):
+            st.markdown(f"**Đề bài:** {question.get('content', '')}")
+            grades = []
+            for row in rows:
+                ans = row.get('answers', {}).get(qid) or {}
+                sub_id = row['id']
+                c_name, c_answer, c_score, c_comment = st.columns([2, 4, 1, 3])
+                with c_name:
+                    graded = QuestionGrading._is_graded(row, qid)
+                    st.write(f"{'✅' if graded else '⏳'} **{row.get('student_name', '')}**")
+                    st.caption(row.get('student_id', ''))
+                with c_answer:
+                    QuestionGrading._render_answer(ans, media_urls, sub_id)
+                if not ans:
+                    # Không có gì để chấm: không hiện ô điểm, không đưa vào lần lưu
+                    st.markdown("---")
+                    continue
+                with c_score:
+                    score = st.number_input(
+                        "Điểm", min_value=0.0, max_value=max_score,
+                        value=min(float(ans.get('score', 0)), max_score),
+                        step=0.25, key=f"bq_score_{sub_id}_{qid}"
+                    )
+                with c_comment:
+                    comment = st.text_input("Lời phê", value=ans.get('teacher_comment', ''), key=f"bq_cmt_{sub_id}_{qid}")
+                    # Dòng không sửa gì chỉ tính là đã chấm khi giáo viên xác nhận (điểm mặc định 0 chưa phải điểm chấm)
+                    confirmed = not graded and st.checkbox("Xác nhận điểm", key=f"bq_ok_{sub_id}_{qid}")
+                fields = {"score": score, "teacher_comment": comment}
+                changes = {k: v for k, v in fields.items() if ans.get(k, 0.0 if k == "score" else "") != v}
+                if changes or confirmed:
+                    grades.append((row, changes))
+                st.markdown("---")
+
+            if st.form_submit_button("💾 Lưu các bài đã chấm", type="primary"):
+                with st.spinner("Đang lưu..."):
+                    updated = repo.save_question_grades(subject, set_num, qid, grades, manual_qids)
+                by_id = {u['id']: u for u in updated}
+                st.session_state['bq_list'] = [by_id.get(r['id'], r) for r in st.session_state['bq_list']]
+                # Danh sách ở chế độ chấm từng bài cần tải lại để thấy điểm mới
+                st.session_state.pop('grading_details', None)
+                st.success(f"✅ Đã lưu điểm câu này cho {len(updated)} bài.")
+
+    @staticmethod
+    def _is_graded(row, qid):
+        return qid in (row.get('graded_qids') or []) or row.get('status') == "graded"
+
+    @staticmethod
+    def _render_answer(ans, media_urls, sub_id):
+        q_type = ans.get('type')
+        if not ans:
+            st.warning("Bài nộp không có câu này.")
+        elif q_type in CHOICE_TYPES:
+            st.write(f"HS chọn: **{ans.get('student_choice')}** · Đáp án: `{ans.get('correct_choice')}`")
+        elif q_type == "Nói (Speaking)":
+            audio_url = media_urls.get(ans.get('audio_path'))
+            if audio_url:
+                st.audio(audio_url)
+                if ans.get('audio_duration'):
+                    st.caption(f"Thời lượng: {ans['audio_duration']} giây")
+            else:
+                st.warning("Học sinh không ghi âm câu này." if not ans.get('audio_path') else "File lỗi hoặc đã bị xóa.")
+        else:
+            st.text_area("Bài làm", value=ans.get('student_text', ''), disabled=True,
+                         label_visibility="collapsed", key=f"bq_view_{sub_id}")
+
+    @staticmethod
+    def _load_page(repo):
+        subject, set_num, qid = st.session_state['bq_view']
+        items, last_doc = repo.list_answers(
+            subject, set_num, qid,
+            page_size=QuestionGrading.PAGE_SIZE,
+            start_after=st.session_state['bq_cursors'][-1]
+        )
+        st.session_state['bq_list'] = items
+        st.session_state['bq_next_cursor'] = last_doc if len(items) == QuestionGrading.PAGE_SIZE else None
+
+    @staticmethod
+    def _render_pager(repo):
+        cursors = st.session_state['bq_cursors']
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("⬅️ Trang trước", disabled=len(cursors) <= 1, key="bq_prev"):
+                cursors.pop()
+                QuestionGrading._load_page(repo)
+                st.rerun()
+        with col_page:
+            st.caption(f"Trang {len(cursors)} · {len(st.session_state['bq_list'])} bài")
+        with col_next:
+            next_cursor = st.session_state.get('bq_next_cursor')
+            if st.button("Trang sau ➡️", disabled=next_cursor is None, key="bq_next"):
+                cursors.append(next_cursor)
+                QuestionGrading._load_page(repo)
+                st.rerun()
@@ -1,7 +1,11 @@
 """Quản lý tài khoản"""
 import streamlit as st
 import hashlib
+import pandas as pd
+from google.api_core.exceptions import AlreadyExists
 from config import get_db
+from models import UserRepository
+from roster import RosterImporter, COLUMNS as ROSTER_COLUMNS
 from utils import InputValidator
 
 class UserManagementPanel:
@@ -11,15 +15,20 @@ class UserManagementPanel:
         db = get_db()
         
         # Tabs
-        tab1, tab2, tab3 = st.tabs(["➕ Tạo Tài Khoản", "📋 Danh Sách Tài Khoản", "⚙️ Thay Đổi Mật Khẩu"])
+        tab1, tab2, tab3, tab4 = st.tabs([
+            "➕ Tạo Tài Khoản", "📥 Nhập Danh Sách Lớp", "📋 Danh Sách Tài Khoản", "⚙️ Thay Đổi Mật Khẩu"
+        ])
         
         with tab1:
             UserManagementPanel._create_account(db)
         
         with tab2:
-            UserManagementPanel._list_accounts(db)
+            UserManagementPanel._import_roster(db)
         
         with tab3:
+            UserManagementPanel._list_accounts(db)
+        
+        with tab4:
             UserManagementPanel._change_password(db)
     
     @staticmethod
@@ -67,46 +76,180 @@ class UserManagementPanel:
                             "subjects": [s.strip() for s in subjects.split(",")]
                         }
                     
-                    db.collection("users").document(user_id).set(user_data)
+                    UserRepository(db).create(user_id, user_data)
                     st.success(f"✅ Tạo tài khoản {user_id} thành công!")
+                except AlreadyExists:
+                    st.error(f"❌ Tên đăng nhập '{user_data['username']}' đã được dùng cho một tài khoản {role} khác")
                 except Exception as e:
                     st.error(f"❌ Lỗi: {str(e)}")
     
+    @staticmethod
+    def _import_roster(db):
+        """Tab tạo tài khoản học sinh hàng loạt từ CSV"""
+        st.write("#### 📥 Nhập Danh Sách Lớp")
+        st.caption(
+            f"Các cột: {', '.join(ROSTER_COLUMNS)} (chỉ full_name bắt buộc). "
+            "Dòng thiếu mã sẽ được cấp mã HS trống; thiếu mật khẩu sẽ được tạo ngẫu nhiên."
+        )
+        st.download_button(
+            "📄 Tải file mẫu (CSV)", RosterImporter.template_csv(),
+            file_name="mau_danh_sach_lop.csv", mime="text/csv"
+        )
+        
+        with st.form("import_roster_form"):
+            roster_file = st.file_uploader("Danh sách lớp (CSV)", type=["csv"])
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                default_class = st.text_input("Lớp mặc định:", placeholder="4A")
+            with col2:
+                digits = st.selectbox("Số chữ số của mã HS:", [3, 4, 5, 6], index=1)
+            with col3:
+                start_number = st.number_input("Cấp mã từ số:", min_value=1, value=1, step=1)
+            dry_run = st.checkbox("Chỉ kiểm tra, chưa tạo (dry-run)", value=True)
+            submitted = st.form_submit_button("✅ Nhập Danh Sách", type="primary")
+        
+        if submitted:
+            if not roster_file:
+                st.error("⚠️ Chưa chọn file")
+                return
+            importer = RosterImporter(db)
+            try:
+                rows = importer.read_rows(roster_file)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            with st.spinner("Đang kiểm tra và tạo tài khoản..."):
+                report = importer.run(
+                    rows, InputValidator.sanitize(default_class, 20), digits, int(start_number), dry_run
+                )
+            st.session_state['roster_report'] = report | {"dry_run": dry_run}
+        
+        report = st.session_state.get('roster_report')
+        if report:
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Tổng số dòng", report['total'])
+            c2.metric("Hợp lệ", report['valid'])
+            c3.metric("Đã tạo", report['created'])
+            c4.metric("Dòng lỗi/trùng", len(report['errors']))
+            
+            if report['dry_run']:
+                st.info(f"🔎 Dry-run: {report['valid']}/{report['total']} dòng sẵn sàng tạo. Bỏ chọn dry-run để tạo.")
+            elif report['created']:
+                st.success(f"✅ Đã tạo {report['created']} tài khoản")
+                credentials = pd.DataFrame(report['credentials'])
+                st.download_button(
+                    "📥 Tải danh sách tài khoản (kèm mật khẩu tạo tự động)",
+                    credentials.to_csv(index=False).encode("utf-8-sig"),
+                    file_name="tai_khoan_hoc_sinh.csv", mime="text/csv"
+                )
+            
+            if report['errors']:
+                errors_df = pd.DataFrame(report['errors']).rename(columns={"row": "Dòng", "error": "Lỗi"})
+                st.dataframe(errors_df, use_container_width=True, hide_index=True)
+    
     @staticmethod
     def _list_accounts(db):
-        """Tab danh sách tài khoản"""
+        """Tab danh sách tài khoản (phân trang bằng cursor, chỉ tải các trường hiển thị)"""
         st.write("#### 📋 Danh Sách Tài Khoản")
+        repo = UserRepository(db)
         
-        role_filter = st.selectbox("Lọc theo vai trò:", ["Tất cả", "student", "teacher"])
+        with st.expander("🔧 Chỉ mục tên đăng nhập"):
+            st.caption("Ghi chỉ mục cho các tài khoản tạo trước khi có chỉ mục để đăng nhập chỉ cần 1 lần đọc.")
+            if st.button("Cập nhật chỉ mục", key="users_backfill_index"):
+                with st.spinner("Đang cập nhật..."):
+                    written = repo.backfill_index()
+                st.success(f"✅ Đã ghi {written} chỉ mục")
         
-        if st.button("🔄 Tải danh sách"):
-            if role_filter == "Tất cả":
-                users = db.collection("users").stream()
-            else:
-                users = db.collection("users").where("role", "==", role_filter).stream()
+        with st.form("list_accounts_filter"):
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                role_filter = st.selectbox("Lọc theo vai trò:", ["Tất cả", "student", "teacher"])
+            with col2:
+                search = st.text_input("Tìm theo mã hoặc tên đăng nhập (bắt đầu bằng):", placeholder="HS00 hoặc nguyen")
+            with col3:
+                page_size = st.selectbox("Số dòng/trang:", [25, 50, 100], index=1)
             
-            user_list = [{"id": doc.id, **doc.to_dict()} for doc in users]
-            st.session_state['user_list'] = user_list
+            if st.form_submit_button("🔄 Tải danh sách"):
+                st.session_state['user_list_filter'] = (
+                    None if role_filter == "Tất cả" else role_filter,
+                    InputValidator.sanitize(search, 50),
+                    page_size
+                )
+                st.session_state['user_list_cursors'] = [None]
+                UserManagementPanel._load_user_page(repo)
         
-        if st.session_state.get('user_list'):
-            users = st.session_state['user_list']
-            
-            # Hiển thị bảng
-            for user in users:
-                col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
-                
-                with col1:
-                    st.write(f"**{user['id']}**")
-                with col2:
-                    st.write(f"👤 {user['full_name']}")
-                with col3:
-                    role_badge = "🎓" if user['role'] == "student" else "👨‍🏫"
-                    st.write(f"{role_badge} {user['username']}")
-                with col4:
-                    if st.button("🗑️", key=f"del_{user['id']}"):
-                        db.collection("users").document(user['id']).delete()
-                        st.success(f"Đã xóa {user['id']}")
-                        st.rerun()
+        if 'user_list' not in st.session_state:
+            return
+        
+        users = st.session_state['user_list']
+        cursors = st.session_state['user_list_cursors']
+        
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("⬅️ Trang trước", disabled=len(cursors) <= 1, key="users_prev"):
+                cursors.pop()
+                UserManagementPanel._load_user_page(repo)
+                st.rerun()
+        with col_page:
+            st.caption(f"Trang {len(cursors)} · {len(users)} tài khoản")
+        with col_next:
+            next_cursor = st.session_state.get('user_list_next_cursor')
+            if st.button("Trang sau ➡️", disabled=next_cursor is None, key="users_next"):
+                cursors.append(next_cursor)
+                UserManagementPanel._load_user_page(repo)
+                st.rerun()
+        
+        if not users:
+            st.info("Không tìm thấy tài khoản nào.")
+            return
+        
+        # 1 bảng duy nhất cho cả trang thay vì mỗi tài khoản một hàng widget
+        table = pd.DataFrame([{
+            "Mã": u['id'],
+            "Họ tên": u.get('full_name', ''),
+            "Tên đăng nhập": u.get('username', ''),
+            "Vai trò": "🎓 student" if u.get('role') == "student" else "👨‍🏫 teacher",
+            "Lớp": (u.get('metadata') or {}).get('class', ''),
+            "Hoạt động": u.get('is_active', True) is not False,
+        } for u in users])
+        event = st.dataframe(
+            table, use_container_width=True, hide_index=True,
+            on_select="rerun", selection_mode="multi-row", key="user_table"
+        )
+        selected = [users[i] for i in event.selection.rows]
+        
+        st.caption(f"Đã chọn {len(selected)} tài khoản")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("🔒 Khóa", disabled=not selected, key="users_deactivate"):
+                repo.set_active_many([u['id'] for u in selected], False)
+                UserManagementPanel._after_bulk_action(repo, f"Đã khóa {len(selected)} tài khoản")
+        with col2:
+            if st.button("🔓 Mở khóa", disabled=not selected, key="users_activate"):
+                repo.set_active_many([u['id'] for u in selected], True)
+                UserManagementPanel._after_bulk_action(repo, f"Đã mở khóa {len(selected)} tài khoản")
+        with col3:
+            confirm = st.checkbox("Xác nhận xóa", key="users_confirm_delete")
+            if st.button("🗑️ Xóa", disabled=not (selected and confirm), key="users_delete"):
+                repo.delete_many([(u['id'], u.get('username'), u.get('role')) for u in selected])
+                UserManagementPanel._after_bulk_action(repo, f"Đã xóa {len(selected)} tài khoản")
+    
+    @staticmethod
+    def _load_user_page(repo):
+        """Tải trang hiện tại (trang cuối trong danh sách cursor)"""
+        role, search, page_size = st.session_state['user_list_filter']
+        cursors = st.session_state['user_list_cursors']
+        items, last_doc = repo.list_page(role, search, page_size=page_size, start_after=cursors[-1])
+        st.session_state['user_list'] = items
+        st.session_state['user_list_next_cursor'] = last_doc if len(items) == page_size else None
+    
+    @staticmethod
+    def _after_bulk_action(repo, message):
+        """Tải lại trang hiện tại sau khi khóa/xóa hàng loạt"""
+        UserManagementPanel._load_user_page(repo)
+        st.session_state.pop('user_table', None)
+        st.toast(f"✅ {message}")
+        st.rerun()
     
     @staticmethod
     def _change_password(db):
@@ -1,12 +1,32 @@
 """
 Cấu hình Firebase và các services
 """
+import os
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 
+# Backend dữ liệu: "firebase" (mặc định) hoặc "memory" (giả lập trong bộ nhớ để load test)
+BACKEND = os.environ.get("KIWI_BACKEND", "firebase")
+# Độ trễ giả lập mỗi RPC của backend "memory" (ms)
+BACKEND_LATENCY_MS = float(os.environ.get("KIWI_BACKEND_LATENCY_MS", "0"))
+BACKEND_JITTER_MS = float(os.environ.get("KIWI_BACKEND_JITTER_MS", "0"))
+# Ghi lại mọi RPC tới backend để xem trong trang debug
+TRACE_ENABLED = os.environ.get("KIWI_TRACE", "0") == "1"
+
+# Logging
+LOG_DIR = os.environ.get("KIWI_LOG_DIR", "logs")
+LOG_LEVEL = os.environ.get("KIWI_LOG_LEVEL", "INFO").upper()
+# Tỉ lệ giữ lại log DEBUG (1.0 = giữ hết) khi LOG_LEVEL=DEBUG
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("KIWI_LOG_DEBUG_SAMPLE", "0.1"))
+# Xoay file khi vượt dung lượng này (MB) hoặc khi sang ngày mới
+LOG_MAX_MB = int(os.environ.get("KIWI_LOG_MAX_MB", "20"))
+LOG_BACKUP_COUNT = int(os.environ.get("KIWI_LOG_BACKUPS", "30"))
+
 def init_firebase():
     """Khởi tạo Firebase một lần duy nhất"""
+    if BACKEND == "memory":
+        return
     if not firebase_admin._apps:
         key_dict = dict(st.secrets["firebase"])
         cred = credentials.Certificate(key_dict)
@@ -16,8 +36,24 @@ def init_firebase():
 
 def get_db():
     """Lấy Firestore client"""
-    return firestore.client()
+    if BACKEND == "memory":
+        from memory_backend import get_memory_db
+        db = get_memory_db(BACKEND_LATENCY_MS, BACKEND_JITTER_MS)
+    else:
+        db = firestore.client()
+    if TRACE_ENABLED:
+        from tracing import wrap_db
+        db = wrap_db(db)
+    return db
 
 def get_storage():
     """Lấy Storage bucket"""
-    return storage.bucket()
\ No newline at end of file
+    if BACKEND == "memory":
+        from memory_backend import get_memory_bucket
+        bucket = get_memory_bucket(BACKEND_LATENCY_MS, BACKEND_JITTER_MS)
+    else:
+        bucket = storage.bucket()
+    if TRACE_ENABLED:
+        from tracing import wrap_storage
+        bucket = wrap_storage(bucket)
+    return bucket
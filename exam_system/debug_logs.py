@@ -3,7 +3,11 @@ Trang debug để xem logs
 """
 import streamlit as st
 import os
-from datetime import datetime
+from config import LOG_DIR
+from log_index import LEVELS, get_index, search, RangeReader
+
+# Streamlit giữ toàn bộ nội dung file tải về trong bộ nhớ trước khi gửi, nên giới hạn dung lượng mỗi lần tải
+MAX_DOWNLOAD_MB = 50
 
 st.set_page_config(page_title="Debug Logs", layout="wide")
 
@@ -14,82 +18,131 @@ if not st.session_state.get('teacher_authenticated', False):
     st.warning("⚠️ Chỉ giáo viên mới có thể xem logs")
     st.stop()
 
+# Chi phí backend theo từng rerun (cần chạy app với KIWI_TRACE=1)
+with st.expander("📡 Chi phí Firestore/Storage theo rerun"):
+    import pandas as pd
+    from tracing import load_records
+    
+    records = load_records()
+    if not records:
+        st.info("Chưa có dữ liệu. Chạy app với KIWI_TRACE=1 để ghi lại RPC.")
+    else:
+        rpc_df = pd.DataFrame(records)
+        rpc_df['docs'] = rpc_df['docs'].fillna(0)
+        rpc_df['reads'] = rpc_df['docs'].where((rpc_df['kind'] == 'firestore') & ~rpc_df['write'], 0)
+        rpc_df['writes'] = rpc_df['write'].astype(int)
+        rpc_df['signs'] = (rpc_df['op'] == 'generate_signed_url').astype(int)
+        
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("RPC", len(rpc_df))
+        c2.metric("Document đọc", int(rpc_df['reads'].sum()))
+        c3.metric("Lượt ghi", int(rpc_df['writes'].sum()))
+        c4.metric("Lượt ký URL", int(rpc_df['signs'].sum()))
+        
+        st.markdown("##### Theo collection / thao tác")
+        by_op = rpc_df.groupby(['kind', 'collection', 'op'], dropna=False).agg(
+            calls=('op', 'size'), docs=('docs', 'sum'), latency_ms=('latency_ms', 'sum')
+        ).sort_values('docs', ascending=False)
+        st.dataframe(by_op, use_container_width=True)
+        
+        st.markdown("##### Theo rerun (nặng nhất trước)")
+        by_rerun = rpc_df.groupby(['session', 'rerun']).agg(
+            start=('ts', 'min'), calls=('op', 'size'), reads=('reads', 'sum'),
+            writes=('writes', 'sum'), signs=('signs', 'sum'), latency_ms=('latency_ms', 'sum')
+        ).sort_values('reads', ascending=False)
+        st.dataframe(by_rerun.head(200), use_container_width=True)
+
 # Thư mục logs
-log_dir = "logs"
+log_dir = LOG_DIR
 if not os.path.exists(log_dir):
     st.error("Chưa có logs")
     st.stop()
 
-# Danh sách file logs
-log_files = sorted([f for f in os.listdir(log_dir) if f.endswith('.log')], reverse=True)
+# Danh sách file logs (file đang ghi + các file đã xoay vòng .gz), mới nhất trước
+log_files = sorted(
+    [f for f in os.listdir(log_dir) if f.endswith('.log') or f.endswith('.log.gz')],
+    key=lambda f: os.path.getmtime(os.path.join(log_dir, f)),
+    reverse=True
+)
 
 if not log_files:
     st.info("Chưa có log files")
     st.stop()
 
-# Chọn log file
-selected_file = st.selectbox("Chọn log file:", log_files)
+# Chọn log file (có thể chọn nhiều ngày)
+selected_files = st.multiselect("Chọn log file:", log_files, default=log_files[:1])
 
-if selected_file:
-    log_path = os.path.join(log_dir, selected_file)
-    
-    # Đọc nội dung
-    with open(log_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+if selected_files:
+    # Chỉ mục được cập nhật tăng dần, chỉ đọc phần mới ghi thêm của file
+    indexes = [get_index(os.path.join(log_dir, f)) for f in selected_files]
     
-    # Thống kê
-    lines = content.split('\n')
+    # Thống kê (lấy từ chỉ mục, không quét file)
+    level_counts = {level: sum(i.level_counts()[level] for i in indexes) for level in LEVELS}
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Tổng dòng log", len([l for l in lines if l.strip()]))
+        st.metric("Tổng dòng log", sum(i.line_count for i in indexes))
     
     with col2:
-        error_count = len([l for l in lines if 'ERROR' in l or '❌' in l])
-        st.metric("Lỗi", error_count)
+        st.metric("Lỗi", level_counts["ERROR"] + level_counts["CRITICAL"])
     
     with col3:
-        success_count = len([l for l in lines if 'thành công' in l or '✅' in l])
-        st.metric("Thành công", success_count)
+        st.metric("Cảnh báo", level_counts["WARNING"])
     
     # Filters
     st.subheader("🔎 Lọc logs")
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
-        log_level = st.selectbox("Cấp độ log:", ["Tất cả", "DEBUG", "INFO", "WARNING", "ERROR"])
+        log_level = st.selectbox("Cấp độ log:", ["Tất cả"] + LEVELS)
     
     with col2:
+        days = sorted({d for i in indexes for d in i.available_days()}, reverse=True)
+        log_day = st.selectbox("Ngày:", ["Tất cả"] + days)
+    
+    with col3:
         search_text = st.text_input("Tìm kiếm:", "")
     
-    # Lọc nội dung
-    filtered_lines = []
-    for line in lines:
-        if not line.strip():
-            continue
-        
-        # Lọc theo cấp độ
-        if log_level != "Tất cả" and log_level not in line:
-            continue
-        
-        # Lọc theo text
-        if search_text and search_text.lower() not in line.lower():
-            continue
-        
-        filtered_lines.append(line)
+    level_filter = None if log_level == "Tất cả" else log_level
+    day_filter = None if log_day == "Tất cả" else log_day
     
-    # Hiển thị logs
-    st.subheader(f"📋 Logs ({len(filtered_lines)} dòng)")
+    # Lấy 500 dòng mới nhất thỏa điều kiện (đọc ngược theo chỉ mục, dừng khi đủ)
+    filtered_lines = search(indexes, level=level_filter, day=day_filter, text=search_text, limit=500)
     
-    # Reverse để xem logs mới nhất ở trên
-    log_text = '\n'.join(reversed(filtered_lines[-500:]))  # Hiển thị 500 dòng cuối cùng
+    # Hiển thị logs
+    if search_text:
+        st.subheader(f"📋 Logs ({len(filtered_lines)} dòng mới nhất)")
+    else:
+        total = sum(len(i.select(level_filter, day_filter)) for i in indexes)
+        st.subheader(f"📋 Logs ({total} dòng, hiển thị {len(filtered_lines)} dòng mới nhất)")
     
-    st.code(log_text, language="log")
+    st.code('\n'.join(filtered_lines), language="log")
     
-    # Tải logs
-    st.download_button(
-        label="📥 Tải file log",
-        data=content,
-        file_name=selected_file,
-        mime="text/plain"
-    )
+    # Tải logs: file chỉ được mở và đọc khi bấm nút, tối đa MAX_DOWNLOAD_MB mỗi file
+    st.caption(f"Mỗi lần tải tối đa {MAX_DOWNLOAD_MB} MB. File lớn hơn: chọn 1 ngày để tải từng phần.")
+    for log_file, index in zip(selected_files, indexes):
+        if day_filter:
+            # Đoạn của 1 ngày tính trên nội dung đã giải nén -> tải về dạng .log
+            start, end = index.day_range(day_filter)
+            if start == end:
+                continue
+            file_name = f"{log_file.split('.')[0]}_{day_filter:%Y%m%d}.log"
+            size = end - start
+            reader = lambda path=index.path, start=start, end=end: RangeReader(path, start, end)
+        else:
+            # Cả file: giữ nguyên byte gốc (.log.gz vẫn là file nén)
+            file_name = log_file
+            size = os.path.getsize(index.path)
+            reader = lambda path=index.path: RangeReader(path, decompress=False)
+        
+        if size > MAX_DOWNLOAD_MB * 1024 * 1024:
+            hint = "" if day_filter else ", hãy chọn 1 ngày"
+            st.warning(f"⚠️ {file_name} ({size / 1024 / 1024:.0f} MB) vượt giới hạn tải {MAX_DOWNLOAD_MB} MB{hint}.")
+            continue
+        st.download_button(
+            label=f"📥 Tải {file_name}",
+            data=reader,
+            file_name=file_name,
+            mime="application/gzip" if file_name.endswith(".gz") else "text/plain",
+            key=f"download_{log_file}"
+        )
@@ -0,0 +1,344 @@
+"""
+Nhập ngân hàng câu hỏi hàng loạt từ CSV/XLSX/JSON kèm file zip chứa media
+"""
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from firebase_admin import firestore
+from cache import QuestionCache
+from utils import BytesFile, FileUtils, InputValidator
+from scoring import CHOICE_TYPES, DEFAULT_MAX_SCORE, QUESTION_TYPES, format_partial_credit, parse_partial_credit
+
+SUBJECTS = ["Toán", "Tiếng Việt", "Tiếng Anh"]
+SET_NUMBERS = [1, 2, 3]
+
+# Viết tắt được chấp nhận ở cột type
+TYPE_ALIASES = {
+    "mc": "Trắc nghiệm (MC)",
+    "listening": "Nghe (Listening)",
+    "speaking": "Nói (Speaking)",
+    "essay": "Tự luận (Essay)",
+}
+
+COLUMNS = [
+    "subject", "set_number", "type", "content", "options", "correct_answer", "image", "audio",
+    "max_score", "partial_credit",
+]
+
+IMAGE_TYPES = ["jpg", "jpeg", "png"]
+AUDIO_TYPES = ["mp3", "wav"]
+CONTENT_TYPES = {
+    "jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png",
+    "mp3": "audio/mpeg", "wav": "audio/wav",
+}
+MAX_MEDIA_MB = 3
+
+
+class QuestionImporter:
+    """Đọc, kiểm tra và ghi câu hỏi theo lô (tối đa 500 thao tác mỗi batch Firestore)"""
+
+    BATCH_SIZE = 500
+    UPLOAD_WORKERS = 8
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = "questions"
+
+    # ------------------------
+    # Đọc file
+    # ------------------------
+
+    @staticmethod
+    def read_rows(file_obj):
+        """
+        Đọc file câu hỏi, trả về list (số dòng trong file, dict cột -> giá trị).
+        CSV/XLSX: dòng 1 là tiêu đề. JSON: list object hoặc {"questions": [...]}.
+        """
+        ext = file_obj.name.split(".")[-1].lower()
+        data = file_obj.getvalue()
+
+        if ext == "json":
+            try:
+                items = json.loads(data.decode("utf-8-sig"))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise ValueError(f"File JSON lỗi: {e}") from e
+            if isinstance(items, dict):
+                items = items.get("questions", [])
+            if not isinstance(items, list):
+                raise ValueError("File JSON phải là danh sách câu hỏi")
+            return [(i + 1, item if isinstance(item, dict) else {}) for i, item in enumerate(items)]
+
+        if ext == "csv":
+            df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        elif ext == "xlsx":
+            try:
+                df = pd.read_excel(io.BytesIO(data), dtype=str).fillna("")
+            except ImportError as e:
+                raise ValueError("Cần cài thư viện openpyxl để đọc file XLSX") from e
+        else:
+            raise ValueError("Chỉ chấp nhận: csv, xlsx, json")
+
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        # Dòng dữ liệu đầu tiên là dòng 2 của file (sau tiêu đề)
+        return [(i + 2, row) for i, row in enumerate(df.to_dict("records"))]
+
+    @staticmethod
+    def read_media(zip_obj):
+        """
+        Đọc file zip media, trả về ({tên file: BytesFile}, {tên file: lỗi}).
+        Kiểm tra dung lượng khai báo trước khi giải nén để tránh file zip quá lớn.
+        """
+        media, errors = {}, {}
+        if not zip_obj:
+            return media, errors
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(zip_obj.getvalue()))
+        except zipfile.BadZipFile as e:
+            raise ValueError("File zip media không hợp lệ") from e
+
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = os.path.basename(info.filename)
+                if not name or name.startswith("."):
+                    continue
+                ext = name.split(".")[-1].lower()
+                if ext not in CONTENT_TYPES:
+                    errors[name] = f"Chỉ chấp nhận: {', '.join(CONTENT_TYPES)}"
+                    continue
+                if info.file_size > MAX_MEDIA_MB * 1024 * 1024:
+                    errors[name] = f"File quá {MAX_MEDIA_MB}MB"
+                    continue
+                media[name] = BytesFile(archive.read(info), name, CONTENT_TYPES[ext])
+        return media, errors
+
+    # ------------------------
+    # Kiểm tra
+    # ------------------------
+
+    @staticmethod
+    def _text(value):
+        if value is None:
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip()
+
+    @staticmethod
+    def validate_row(row, media, media_errors):
+        """
+        Kiểm tra 1 dòng theo cùng quy tắc với form tạo câu hỏi.
+        Trả về (question, errors): question là dữ liệu sẽ ghi (chưa có đường dẫn media).
+        """
+        text = QuestionImporter._text
+        errors = []
+
+        subject = text(row.get("subject"))
+        if subject not in SUBJECTS:
+            errors.append(f"Môn '{subject}' không hợp lệ ({', '.join(SUBJECTS)})")
+
+        try:
+            set_number = int(float(text(row.get("set_number"))))
+        except ValueError:
+            set_number = None
+        if set_number not in SET_NUMBERS:
+            errors.append(f"Mã đề '{text(row.get('set_number'))}' không hợp lệ")
+
+        q_type = text(row.get("type"))
+        q_type = TYPE_ALIASES.get(q_type.lower(), q_type)
+        if q_type not in QUESTION_TYPES:
+            errors.append(f"Loại câu '{q_type}' không hợp lệ")
+
+        content = InputValidator.sanitize(text(row.get("content")), 1000)
+        if not content:
+            errors.append("Thiếu nội dung câu hỏi")
+
+        max_score = DEFAULT_MAX_SCORE
+        if text(row.get("max_score")):
+            try:
+                max_score = float(text(row.get("max_score")))
+            except ValueError:
+                max_score = 0
+            if not max_score > 0:
+                errors.append(f"Điểm tối đa '{text(row.get('max_score'))}' không hợp lệ")
+
+        options, correct_answer, partial_credit = [], "", {}
+        if q_type in CHOICE_TYPES:
+            raw_options = row.get("options")
+            if not isinstance(raw_options, list):
+                raw_options = text(raw_options).split(",") if text(raw_options) else []
+            options = [InputValidator.sanitize(text(x)) for x in raw_options]
+            options = [x for x in options if x]
+            correct_answer = InputValidator.sanitize(text(row.get("correct_answer")))
+            if not options:
+                errors.append("Thiếu các lựa chọn")
+            elif correct_answer not in options:
+                errors.append(f"Đáp án '{correct_answer}' không nằm trong các lựa chọn")
+            try:
+                raw_partial = row.get("partial_credit")
+                if isinstance(raw_partial, dict):  # JSON có thể ghi sẵn dạng {lựa chọn: tỉ lệ}
+                    raw_partial = format_partial_credit(raw_partial)
+                partial_credit = parse_partial_credit(text(raw_partial))
+            except ValueError as e:
+                errors.append(str(e))
+            unknown = [o for o in partial_credit if o not in options]
+            if unknown:
+                errors.append(f"Điểm một phần: lựa chọn {', '.join(unknown)} không có trong các lựa chọn")
+
+        image = text(row.get("image"))
+        if image:
+            errors += QuestionImporter._check_media(image, IMAGE_TYPES, media, media_errors)
+        audio = text(row.get("audio"))
+        if audio:
+            if q_type not in CHOICE_TYPES:
+                errors.append("Chỉ câu Trắc nghiệm/Nghe mới có audio")
+            errors += QuestionImporter._check_media(audio, AUDIO_TYPES, media, media_errors)
+
+        question = {
+            "subject": subject, "set_number": set_number, "type": q_type,
+            "content": content, "options": options, "correct_answer": correct_answer,
+            "max_score": max_score, "partial_credit": partial_credit,
+            "image": image or None, "audio": audio or None,
+        }
+        return question, errors
+
+    @staticmethod
+    def _check_media(name, allowed, media, media_errors):
+        if name in media_errors:
+            return [f"{name}: {media_errors[name]}"]
+        if name not in media:
+            return [f"Không tìm thấy '{name}' trong file zip media"]
+        valid, msg = FileUtils.validate_file(media[name], allowed, MAX_MEDIA_MB)
+        return [] if valid else [f"{name}: {msg}"]
+
+    # ------------------------
+    # Nhập
+    # ------------------------
+
+    def run(self, rows, media=None, media_errors=None, dry_run=False, progress=None):
+        """
+        Kiểm tra và (nếu không phải dry_run) upload media + ghi câu hỏi.
+        progress(done, total): gọi sau mỗi batch ghi.
+        Trả về báo cáo: {"total", "valid", "created", "media_uploaded", "errors": [{"row", "error"}]}
+        """
+        media = media or {}
+        media_errors = media_errors or {}
+        report = {"total": len(rows), "valid": 0, "created": 0, "media_uploaded": 0, "errors": []}
+
+        valid = []
+        for row_no, row in rows:
+            question, errors = self.validate_row(row, media, media_errors)
+            if errors:
+                report["errors"].append({"row": row_no, "error": "; ".join(errors)})
+            else:
+                valid.append((row_no, question))
+        report["valid"] = len(valid)
+
+        if dry_run or not valid:
+            return report
+
+        uploaded, upload_errors = self._upload_media(valid, media)
+        report["media_uploaded"] = len(uploaded)
+
+        pending = []
+        for row_no, question in valid:
+            names = [n for n in (question["image"], question["audio"]) if n]
+            failed = [f"{n}: {upload_errors[n]}" for n in names if n in upload_errors]
+            if failed:
+                report["errors"].append({"row": row_no, "error": "Lỗi upload " + "; ".join(failed)})
+                # Trả lại tham chiếu của các file đã upload được cho dòng này (như _write khi batch lỗi)
+                for name in names:
+                    if name in uploaded:
+                        FileUtils.release(uploaded[name][0])
+                continue
+            pending.append((row_no, self._to_document(question, uploaded)))
+
+        report["created"] = self._write(pending, report, progress)
+
+        for exam in {(q["subject"], q["set_number"]) for _, q in pending}:
+            QuestionCache.invalidate(*exam)
+        report["errors"].sort(key=lambda e: e["row"])
+        return report
+
+    def _upload_media(self, valid, media):
+        """
+        Upload song song mỗi file media 1 lần (dù nhiều câu dùng chung), số tham chiếu
+        tăng theo số câu dùng file. Trả về ({tên: (path, variants)}, {tên: lỗi}).
+        """
+        usage = {}
+        for _, question in valid:
+            for name in (question["image"], question["audio"]):
+                if name:
+                    usage[name] = usage.get(name, 0) + 1
+
+        def upload(name):
+            file_obj = media[name]
+            if name.split(".")[-1].lower() in IMAGE_TYPES:
+                return FileUtils._store_image(file_obj, "question_images", retries=2, refs_count=usage[name])
+            return FileUtils._store(file_obj, "question_audio", retries=2, refs_count=usage[name]), None
+
+        uploaded, errors = {}, {}
+        if not usage:
+            return uploaded, errors
+        with ThreadPoolExecutor(max_workers=min(self.UPLOAD_WORKERS, len(usage))) as pool:
+            futures = {name: pool.submit(upload, name) for name in usage}
+            for name, future in futures.items():
+                try:
+                    uploaded[name] = future.result()
+                except Exception as e:
+                    errors[name] = str(e) or type(e).__name__
+        return uploaded, errors
+
+    @staticmethod
+    def _to_document(question, uploaded):
+        image_path, image_variants = uploaded.get(question["image"], (None, None))
+        audio_path, _ = uploaded.get(question["audio"], (None, None))
+        return {
+            "subject": question["subject"], "set_number": question["set_number"],
+            "type": question["type"], "content": question["content"],
+            "options": question["options"], "correct_answer": question["correct_answer"],
+            "max_score": question["max_score"], "partial_credit": question["partial_credit"],
+            "image_path": image_path, "audio_path": audio_path, "image_variants": image_variants,
+            "created_at": firestore.SERVER_TIMESTAMP
+        }
+
+    def _write(self, pending, report, progress=None):
+        """Ghi theo batch, batch lỗi được ghi vào báo cáo và trả lại tham chiếu media"""
+        collection = self.db.collection(self.collection)
+        created = 0
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            chunk = pending[start:start + self.BATCH_SIZE]
+            batch = self.db.batch()
+            for _, data in chunk:
+                batch.set(collection.document(), data)
+            try:
+                batch.commit()
+                created += len(chunk)
+            except Exception as e:
+                for row_no, data in chunk:
+                    report["errors"].append({"row": row_no, "error": f"Lỗi ghi dữ liệu: {e}"})
+                    FileUtils.release(data["image_path"])
+                    FileUtils.release(data["audio_path"])
+            if progress:
+                progress(min(start + self.BATCH_SIZE, len(pending)), len(pending))
+        return created
+
+    @staticmethod
+    def template_csv():
+        """File CSV mẫu để giáo viên điền"""
+        sample = pd.DataFrame([
+            {"subject": "Toán", "set_number": 1, "type": "MC", "content": "1 + 1 = ?",
+             "options": "1, 2, 3, 4", "correct_answer": "2", "image": "", "audio": "",
+             "max_score": 1, "partial_credit": ""},
+            {"subject": "Tiếng Anh", "set_number": 1, "type": "Listening", "content": "Nghe và chọn đáp án",
+             "options": "cat, dog", "correct_answer": "cat", "image": "cat.png", "audio": "cat.mp3",
+             "max_score": 2, "partial_credit": "dog=0.25"},
+            {"subject": "Tiếng Việt", "set_number": 2, "type": "Essay", "content": "Tả con mèo nhà em",
+             "options": "", "correct_answer": "", "image": "", "audio": "",
+             "max_score": 4, "partial_credit": ""},
+        ], columns=COLUMNS)
+        return sample.to_csv(index=False).encode("utf-8-sig")
@@ -0,0 +1,374 @@
+"""
+Load test: mô phỏng nhiều học sinh/giáo viên dùng app cùng lúc qua một server Streamlit thật
+
+Server (`streamlit run main.py` trên backend giả lập trong bộ nhớ) chạy ở process con; mỗi người dùng
+giả lập là 1 kết nối websocket riêng tới server, gửi giá trị widget và nhận phần tử giống như trình duyệt.
+Mỗi phiên là 1 AppSession/ScriptRunner riêng trong server, nên đo được đúng tải khi chạy đồng thời.
+Đi qua đúng các trang thật: đăng nhập (LoginForm) -> làm bài và nộp (student_page) / tải và chấm bài
+(teacher_page).
+
+Ví dụ:
+    cd exam_system
+    python loadtest.py --students 20,50,100 --teachers 2 --concurrency 16 --latency-ms 40
+"""
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+# Phải đặt trước khi server import config để get_db()/get_storage() trả về backend giả lập
+os.environ["KIWI_BACKEND"] = "memory"
+
+APP_DIR = Path(__file__).parent
+MAIN_SCRIPT = str(APP_DIR / "main.py")
+SUBJECT = "Toán"
+SET_NUMBER = 1
+PASSWORD = "matkhau123"
+
+
+def seed(db, students, teachers, mc_questions=20, essay_questions=2):
+    """Tạo dữ liệu mẫu: tài khoản HS/GV và 1 đề thi"""
+    from models import UserRepository
+
+    users = UserRepository(db)
+    password_hash = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    for i in range(1, students + 1):
+        code = f"HS{i:04d}"
+        users.create(code, {
+            "username": f"hocsinh{i:04d}", "password_hash": password_hash, "role": "student",
+            "full_name": f"Học Sinh {i}", "is_active": True, "metadata": {"class": "4A"},
+        })
+    for i in range(1, teachers + 1):
+        users.create(f"GV{i:03d}", {
+            "username": f"giaovien{i:03d}", "password_hash": password_hash, "role": "teacher",
+            "full_name": f"Giáo Viên {i}", "is_active": True, "metadata": {"subjects": [SUBJECT]},
+        })
+
+    questions = db.collection("questions")
+    for i in range(mc_questions):
+        questions.document(f"q{i:03d}").set({
+            "subject": SUBJECT, "set_number": SET_NUMBER, "type": "Trắc nghiệm (MC)",
+            "content": f"Câu hỏi trắc nghiệm {i}", "options": ["A", "B", "C", "D"],
+            "correct_answer": "A", "image_path": None, "audio_path": None,
+        })
+    for i in range(essay_questions):
+        questions.document(f"q{mc_questions + i:03d}").set({
+            "subject": SUBJECT, "set_number": SET_NUMBER, "type": "Tự luận (Essay)",
+            "content": f"Câu hỏi tự luận {i}", "options": [], "correct_answer": "",
+            "image_path": None, "audio_path": None,
+        })
+
+
+# ---------------------------------------------------------------- Server (process con)
+
+def _serve(port, control):
+    """
+    Process con: luồng chính chạy server Streamlit, luồng phụ nhận lệnh điều khiển qua Pipe
+    (tạo dữ liệu, đo số RPC và bộ nhớ) trên cùng backend giả lập mà các phiên đang dùng.
+    """
+    sys.path.insert(0, str(APP_DIR))
+    from streamlit.web import bootstrap
+
+    threading.Thread(target=_control_loop, args=(control,), daemon=True).start()
+    options = {"server_port": port, "server_headless": True, "browser_gatherUsageStats": False,
+               "server_fileWatcherType": "none", "logger_level": "error"}
+    bootstrap.load_config_options(options)
+    bootstrap.run(MAIN_SCRIPT, False, [], options)
+
+
+def _control_loop(control):
+    import tracemalloc
+    from config import get_db, get_storage
+
+    db, bucket = get_db(), get_storage()
+    baseline = 0
+    while True:
+        command, args = control.recv()
+        if command == "seed":
+            db.clear()
+            bucket.clear()
+            seed(db, *args)
+            db.reset_stats()
+            bucket.reset_stats()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            control.send(None)
+        elif command == "stats":
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+            control.send((dict(db.stats), dict(bucket.stats), retained))
+
+
+class Server:
+    """Server Streamlit chạy trong process riêng"""
+
+    def __init__(self, latency_ms=None, timeout=60):
+        if latency_ms is not None:
+            os.environ["KIWI_BACKEND_LATENCY_MS"] = str(latency_ms)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"ws://127.0.0.1:{self.port}/_stcore/stream"
+        self.control, child = multiprocessing.Pipe()
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=_serve, args=(self.port, child), daemon=True
+        )
+        self.process.start()
+        self._wait_ready(timeout)
+
+    def _wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.process.is_alive():
+                raise RuntimeError("Server Streamlit đã dừng khi khởi động")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise TimeoutError("Server Streamlit không khởi động kịp")
+
+    def call(self, command, *args):
+        self.control.send((command, args))
+        return self.control.recv()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(10)
+
+
+# ---------------------------------------------------------------- Phiên người dùng (websocket)
+
+class Session:
+    """
+    Một người dùng giả lập: 1 kết nối websocket, ghi lại thời gian của mỗi lần bấm/rerun.
+    Giữ giá trị các widget đã nhập và gửi lại mỗi lần rerun như trình duyệt.
+    """
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.ws = None
+        self.elements = {}  # delta_path -> Element của lần chạy gần nhất
+        self.values = {}  # widget id -> WidgetState đã đặt
+        self.latencies = []
+        self.error = None
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+        self.ws = await asyncio.wait_for(websocket_connect(self.url), self.timeout)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    async def run(self, trigger=None):
+        """Gửi giá trị widget (và nút vừa bấm), chờ tới khi script chạy xong hẳn (kể cả st.rerun())"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        live = {w.id for w in self.widgets()}
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        for widget_id, state in self.values.items():
+            if not live or widget_id in live:
+                msg.rerun_script.widget_states.widgets.add().CopyFrom(state)
+        if trigger is not None:
+            msg.rerun_script.widget_states.widgets.add(id=trigger.id, trigger_value=True)
+
+        start = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        await asyncio.wait_for(self._receive(), self.timeout)
+        self.latencies.append(time.perf_counter() - start)
+
+        errors = [e.exception for e in self.elements.values() if e.WhichOneof("type") == "exception"]
+        if errors:
+            raise RuntimeError(f"{errors[0].type}: {errors[0].message}")
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise ConnectionError("Server đã đóng kết nối")
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.elements = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self.elements[tuple(msg.metadata.delta_path)] = msg.delta.new_element
+            elif kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    def widgets(self, kind=None):
+        for element in self.elements.values():
+            element_type = element.WhichOneof("type")
+            if kind is None or element_type == kind:
+                widget = getattr(element, element_type)
+                if getattr(widget, "id", ""):
+                    yield widget
+
+    def widget(self, kind, key):
+        return next(w for w in self.widgets(kind) if w.id.endswith(f"-{key}"))
+
+    def button(self, label_prefix):
+        return next((b for b in self.widgets("button") if b.label.startswith(label_prefix)), None)
+
+    def set_text(self, widget, value):
+        self.values[widget.id] = self._state(widget.id, string_value=value)
+
+    def set_index(self, widget, index):
+        self.values[widget.id] = self._state(widget.id, int_value=index)
+
+    @staticmethod
+    def _state(widget_id, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        return WidgetState(id=widget_id, **value)
+
+
+async def student_flow(session, index):
+    """Đăng nhập -> chọn đề -> trả lời -> nộp bài"""
+    await session.run()
+    session.set_text(session.widget("text_input", "std_user"), f"HS{index:04d}")
+    session.set_text(session.widget("text_input", "std_pass"), PASSWORD)
+    await session.run(session.widget("button", "btn_std_login"))
+
+    for radio in session.widgets("radio"):
+        if radio.id.rsplit("-", 1)[-1].startswith("ans_"):
+            session.set_index(radio, index % len(radio.options))
+    for area in session.widgets("text_area"):
+        if area.id.rsplit("-", 1)[-1].startswith("ans_"):
+            session.set_text(area, f"Bài làm của học sinh {index}")
+    await session.run(session.button("✅ NỘP BÀI THI"))
+
+
+async def teacher_flow(session, index, grades=3):
+    """Đăng nhập -> tải danh sách bài nộp -> chấm vài bài"""
+    await session.run()
+    session.set_text(session.widget("text_input", "teach_user"), f"giaovien{index:03d}")
+    session.set_text(session.widget("text_input", "teach_pass"), PASSWORD)
+    await session.run(session.widget("button", "btn_teach_login"))
+    await session.run(session.button("🔄 Tải bài nộp"))
+
+    for _ in range(grades):
+        save = session.button("Lưu Kết Quả Chấm")
+        if save is None:
+            break
+        await session.run(save)
+
+
+async def _run_sessions(server, jobs, concurrency, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+    sessions = [Session(server.url, timeout) for _ in jobs]
+
+    async def execute(session, flow, index):
+        async with semaphore:
+            try:
+                await session.connect()
+                await flow(session, index)
+            except Exception as e:
+                session.error = f"{type(e).__name__}: {e}"
+
+    start = time.perf_counter()
+    await asyncio.gather(*(execute(s, flow, i) for s, (flow, i) in zip(sessions, jobs)))
+    wall = time.perf_counter() - start
+
+    # Đo trước khi ngắt kết nối để bộ nhớ còn gồm session_state của mọi phiên
+    stats = server.call("stats")
+    for session in sessions:
+        session.close()
+    return sessions, wall, stats
+
+
+def run_round(server, students, teachers, concurrency, timeout):
+    """Chạy 1 vòng với `students` HS và `teachers` GV, trả về số liệu tổng hợp"""
+    server.call("seed", students, teachers)
+
+    jobs = [(student_flow, i) for i in range(1, students + 1)]
+    jobs += [(teacher_flow, i) for i in range(1, teachers + 1)]
+
+    sessions, wall, (db_stats, bucket_stats, retained) = asyncio.run(
+        _run_sessions(server, jobs, concurrency, timeout)
+    )
+
+    latencies = sorted(t for s in sessions for t in s.latencies)
+    reads = db_stats.get("docs_read", 0)
+    writes = db_stats.get("docs_written", 0)
+    rpcs = sum(v for k, v in db_stats.items() if k not in ("docs_read", "docs_written"))
+    return {
+        "students": students,
+        "teachers": teachers,
+        "sessions": len(sessions),
+        "errors": [s.error for s in sessions if s.error],
+        "wall_s": wall,
+        "reruns": len(latencies),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "rpcs_per_session": rpcs / len(sessions),
+        "reads_per_session": reads / len(sessions),
+        "writes_per_session": writes / len(sessions),
+        "storage_ops": sum(bucket_stats.values()),
+        "kb_per_session": retained / 1024 / len(sessions),
+    }
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def print_report(rows):
+    header = (f"{'HS':>5} {'GV':>3} {'rerun':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'RPC/ss':>7} {'đọc/ss':>7} {'ghi/ss':>7} {'KB/ss':>8} {'lỗi':>4} {'tổng s':>7}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['students']:>5} {r['teachers']:>3} {r['reruns']:>6} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['rpcs_per_session']:>7.1f} "
+              f"{r['reads_per_session']:>7.1f} {r['writes_per_session']:>7.1f} "
+              f"{r['kb_per_session']:>8.1f} {len(r['errors']):>4} {r['wall_s']:>7.1f}")
+    for r in rows:
+        for error in sorted(set(r['errors']))[:5]:
+            print(f"[{r['students']} HS] {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test hệ thống thi qua server Streamlit thật")
+    parser.add_argument("--students", default="10,50,100",
+                        help="Danh sách số học sinh cho từng vòng, cách nhau dấu phẩy")
+    parser.add_argument("--teachers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Số phiên chạy đồng thời")
+    parser.add_argument("--latency-ms", type=float, default=None,
+                        help="Độ trễ giả lập mỗi RPC (ghi đè KIWI_BACKEND_LATENCY_MS)")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="Thời gian tối đa cho 1 lần rerun (giây)")
+    args = parser.parse_args()
+
+    server = Server(args.latency_ms, args.timeout)
+    try:
+        rows = []
+        for students in [int(n) for n in args.students.split(",") if n.strip()]:
+            rows.append(run_round(server, students, args.teachers, args.concurrency, args.timeout))
+            print_report(rows[-1:])
+            print()
+        print_report(rows)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
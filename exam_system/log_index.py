@@ -0,0 +1,264 @@
+"""
+Chỉ mục file log: vị trí (byte offset) của từng dòng kèm cấp độ và ngày
+
+Chỉ mục được lưu cạnh file log (<file>.idx.npz) và cập nhật tăng dần: mỗi lần mở
+chỉ đọc phần mới ghi thêm vào file. Nhờ đó có thể lọc theo cấp độ/ngày, đếm số dòng
+và lấy các dòng mới nhất mà không phải đọc toàn bộ file vào bộ nhớ.
+"""
+import gzip
+import io
+import os
+import re
+import threading
+from collections import deque
+from datetime import date
+
+import numpy as np
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+# Mã cấp độ: 0 = không xác định, 1.. = theo LEVELS
+LEVEL_CODES = {name.encode(): i + 1 for i, name in enumerate(LEVELS)}
+
+_LINE_RE = re.compile(rb"^(\d{4})-(\d{2})-(\d{2}) [\d:,]+ - .*? - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - ")
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def is_compressed(path):
+    return path.endswith(".gz")
+
+
+def _open_binary(path):
+    return gzip.open(path, "rb") if is_compressed(path) else open(path, "rb")
+
+
+class LogIndex:
+    """Chỉ mục của 1 file log (.log hoặc .log.gz đã xoay vòng)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.sidecar = path + ".idx.npz"
+        self.source_id = 0      # inode của file, đổi khi file bị xoay vòng
+        self.source_size = 0    # Kích thước file (nén) lúc lập chỉ mục
+        self.indexed_bytes = 0  # Đã lập chỉ mục tới byte này (dữ liệu đã giải nén)
+        self.offsets = np.empty(0, dtype=np.uint64)
+        self.levels = np.empty(0, dtype=np.uint8)
+        self.days = np.empty(0, dtype=np.int32)
+        self._last_level = 0
+        self._last_day = 0
+        self._lock = threading.Lock()
+        self._load_sidecar()
+
+    def _load_sidecar(self):
+        if not os.path.exists(self.sidecar):
+            return
+        try:
+            with np.load(self.sidecar) as data:
+                meta = data["meta"]
+                (self.source_id, self.source_size, self.indexed_bytes,
+                 self._last_level, self._last_day) = (int(x) for x in meta)
+                self.offsets = data["offsets"]
+                self.levels = data["levels"]
+                self.days = data["days"]
+        except Exception:
+            self._reset()
+
+    def _save_sidecar(self):
+        tmp = self.sidecar + ".tmp.npz"
+        meta = np.array(
+            [self.source_id, self.source_size, self.indexed_bytes, self._last_level, self._last_day],
+            dtype=np.int64
+        )
+        np.savez(tmp, meta=meta, offsets=self.offsets, levels=self.levels, days=self.days)
+        os.replace(tmp, self.sidecar)
+
+    def _reset(self):
+        self.source_id = self.source_size = self.indexed_bytes = 0
+        self._last_level = self._last_day = 0
+        self.offsets = np.empty(0, dtype=np.uint64)
+        self.levels = np.empty(0, dtype=np.uint8)
+        self.days = np.empty(0, dtype=np.int32)
+
+    def refresh(self):
+        """Cập nhật chỉ mục với phần mới của file, trả về self"""
+        with self._lock:
+            stat = os.stat(self.path)
+            size = stat.st_size
+            if stat.st_ino != self.source_id or size < self.source_size:
+                # File mới (sau khi xoay vòng) hoặc bị ghi đè -> lập chỉ mục lại từ đầu
+                self._reset()
+            elif size == self.source_size:
+                return self
+            elif is_compressed(self.path):
+                # File .gz đã xoay vòng không được ghi thêm, lập lại toàn bộ nếu thay đổi
+                self._reset()
+
+            self._index_from(self.indexed_bytes)
+            self.source_id = stat.st_ino
+            self.source_size = size
+            self._save_sidecar()
+        return self
+
+    def _index_from(self, start):
+        offsets, levels, days = [], [], []
+        level, day = self._last_level, self._last_day
+        position = start
+
+        with _open_binary(self.path) as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Dòng đang ghi dở, để lần sau
+                match = _LINE_RE.match(line)
+                if match:
+                    y, m, d, name = match.groups()
+                    day = date(int(y), int(m), int(d)).toordinal()
+                    level = LEVEL_CODES[name]
+                # Dòng không có header (traceback...) thuộc về bản ghi phía trên
+                offsets.append(position)
+                levels.append(level)
+                days.append(day)
+                position += len(line)
+
+        self.offsets = np.concatenate([self.offsets, np.array(offsets, dtype=np.uint64)])
+        self.levels = np.concatenate([self.levels, np.array(levels, dtype=np.uint8)])
+        self.days = np.concatenate([self.days, np.array(days, dtype=np.int32)])
+        self.indexed_bytes = position
+        self._last_level, self._last_day = level, day
+
+    # ------------------------
+    # Truy vấn
+    # ------------------------
+
+    @property
+    def line_count(self):
+        return len(self.offsets)
+
+    def level_counts(self):
+        """Số dòng theo cấp độ: {"INFO": 120, ...}"""
+        counts = np.bincount(self.levels, minlength=len(LEVELS) + 1)
+        return {name: int(counts[i + 1]) for i, name in enumerate(LEVELS)}
+
+    def available_days(self):
+        return [date.fromordinal(int(d)) for d in np.unique(self.days) if d > 0]
+
+    def select(self, level=None, day=None):
+        """Offset của các dòng thỏa cấp độ/ngày (theo thứ tự trong file)"""
+        mask = np.ones(len(self.offsets), dtype=bool)
+        if level:
+            mask &= self.levels == LEVEL_CODES[level.encode()]
+        if day:
+            mask &= self.days == day.toordinal()
+        return self.offsets[mask]
+
+    def iter_lines(self, offsets):
+        """Đọc lần lượt các dòng tại các offset (tăng dần); với file .gz chỉ giải nén 1 lượt từ đầu tới cuối"""
+        with _open_binary(self.path) as f:
+            for offset in offsets:
+                f.seek(int(offset))
+                yield f.readline().decode("utf-8", errors="replace").rstrip("\n")
+
+    def read_lines(self, offsets):
+        """Đọc các dòng tại các offset (tăng dần), trả về list chuỗi"""
+        return list(self.iter_lines(offsets))
+
+    def day_range(self, day):
+        """Khoảng byte [start, end) chứa các dòng của 1 ngày"""
+        positions = np.nonzero(self.days == day.toordinal())[0]
+        if not len(positions):
+            return 0, 0
+        start = int(self.offsets[positions[0]])
+        last = positions[-1] + 1
+        end = int(self.offsets[last]) if last < len(self.offsets) else self.indexed_bytes
+        return start, end
+
+
+def get_index(path):
+    """Chỉ mục (dùng chung cho cả process) của file log, đã cập nhật phần mới"""
+    with _lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = LogIndex(path)
+    return index.refresh()
+
+
+def search(indexes, level=None, day=None, text=None, limit=500, chunk=2000):
+    """
+    Tìm các dòng mới nhất thỏa điều kiện trên nhiều file (file mới nhất trước).
+    Đọc ngược theo từng nhóm `chunk` dòng ứng viên và dừng khi đủ `limit` dòng.
+    File .gz không tua ngược được (mỗi lần seek lùi phải giải nén lại từ đầu) nên được đọc xuôi
+    1 lượt, chỉ giữ lại các dòng khớp cuối cùng.
+    """
+    needle = text.lower() if text else None
+    results = []
+    for index in indexes:
+        candidates = index.select(level, day)
+        if is_compressed(index.path):
+            matches = deque(maxlen=limit - len(results))
+            matches.extend(line for line in index.iter_lines(candidates)
+                           if not needle or needle in line.lower())
+            results.extend(reversed(matches))
+            continue
+        end = len(candidates)
+        while end > 0 and len(results) < limit:
+            start = max(0, end - chunk)
+            lines = index.read_lines(candidates[start:end])
+            for line in reversed(lines):
+                if needle and needle not in line.lower():
+                    continue
+                results.append(line)
+                if len(results) >= limit:
+                    break
+            end = start
+        if len(results) >= limit:
+            break
+    return results
+
+
+class RangeReader(io.RawIOBase):
+    """
+    File-like chỉ đọc đoạn [start, end) của file log, mở file ở lần đọc đầu tiên và đọc dần theo yêu cầu.
+    decompress=False: đọc byte gốc của file (file .gz giữ nguyên dạng nén); khi đó start/end tính trên file gốc.
+    """
+
+    def __init__(self, path, start=0, end=None, decompress=True):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.decompress = decompress
+        self._file = None
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Chỉ hỗ trợ seek từ đầu đoạn")
+        self._pos = offset
+        if self._file is not None:
+            self._file.seek(self.start + offset)
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._file is None:
+            self._file = _open_binary(self.path) if self.decompress else open(self.path, "rb")
+            self._file.seek(self.start + self._pos)
+        size = len(buffer) if self.end is None else min(len(buffer), self.end - self.start - self._pos)
+        data = self._file.read(size) if size > 0 else b""
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
@@ -0,0 +1,133 @@
+"""
+Cấu hình logging không chặn: ghi qua hàng đợi, xoay vòng file theo ngày/dung lượng, nén gzip
+"""
+import atexit
+import glob
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import threading
+from datetime import datetime
+
+from config import LOG_DIR, LOG_LEVEL, LOG_DEBUG_SAMPLE_RATE, LOG_MAX_MB, LOG_BACKUP_COUNT
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listeners = {}
+_lock = threading.Lock()
+
+
+class DebugSampler(logging.Filter):
+    """Chỉ giữ lại một phần log DEBUG (rate=0.1 -> 10%), các cấp khác giữ nguyên"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class CompressingRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    Xoay file khi sang ngày mới hoặc khi vượt dung lượng, file cũ được nén .gz
+    File cũ có dạng <tên>_<YYYYMMDD_HHMMSS><đuôi>.gz, giữ tối đa backup_count file.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, when="midnight", backupCount=backup_count,
+                         encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+        self.prefix, self.ext = os.path.splitext(self.baseFilename)
+        self.namer = self._name_rotated
+        self.rotator = self._compress
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def _name_rotated(self, default_name):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = f"{self.prefix}_{stamp}{self.ext}.gz"
+        counter = 1
+        while os.path.exists(name):
+            name = f"{self.prefix}_{stamp}_{counter}{self.ext}.gz"
+            counter += 1
+        return name
+
+    @staticmethod
+    def _compress(source, dest):
+        if not os.path.exists(source):
+            return
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def getFilesToDelete(self):
+        rotated = sorted(glob.glob(f"{glob.escape(self.prefix)}_*{self.ext}.gz"), key=os.path.getmtime)
+        if len(rotated) <= self.backupCount:
+            return []
+        expired = rotated[:len(rotated) - self.backupCount]
+        # Xóa kèm file chỉ mục (log_index) của các file cũ
+        return expired + [f"{name}.idx.npz" for name in expired if os.path.exists(f"{name}.idx.npz")]
+
+
+def _start_listener(name, handlers):
+    """Gắn QueueHandler cho logger `name`, việc ghi thật chạy ở thread của QueueListener"""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    _listeners[name] = listener
+    return logging.handlers.QueueHandler(log_queue)
+
+
+def setup_logging():
+    """Cấu hình root logger một lần cho cả process (gọi lại nhiều lần không sao)"""
+    with _lock:
+        if "root" in _listeners:
+            return
+        os.makedirs(LOG_DIR, exist_ok=True)
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        file_handler = CompressingRotatingFileHandler(
+            os.path.join(LOG_DIR, "auth.log"), LOG_MAX_MB * 1024 * 1024, LOG_BACKUP_COUNT
+        )
+        stream_handler = logging.StreamHandler()
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+
+        queue_handler = _start_listener("root", [file_handler, stream_handler])
+        queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(queue_handler)
+
+
+def file_logger(name, filename, max_mb=LOG_MAX_MB):
+    """Logger riêng ghi nguyên văn message vào `filename` (không lẫn vào log chung)"""
+    with _lock:
+        logger = logging.getLogger(name)
+        if name in _listeners:
+            return logger
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+
+        handler = CompressingRotatingFileHandler(filename, max_mb * 1024 * 1024, LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(_start_listener(name, [handler]))
+        return logger
@@ -5,7 +5,7 @@ import sys
 from pathlib import Path
 
 import streamlit as st
-from config import init_firebase
+from config import init_firebase, TRACE_ENABLED
 from components.common.login import LoginForm
 
 # Add parent directory to path to import pages module
@@ -14,6 +14,9 @@ from pages import teacher_page, student_page
 
 # Khởi tạo
 init_firebase()
+if TRACE_ENABLED:
+    from tracing import begin_rerun
+    begin_rerun()
 st.set_page_config(
     page_title="Hệ Thống Thi Trực Tuyến",
     layout="wide",
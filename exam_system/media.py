@@ -0,0 +1,236 @@
+"""
+Xử lý media trước khi upload:
+- Ảnh câu hỏi: xoay theo EXIF, bỏ metadata, tạo các bản thu nhỏ
+- Bài nói: chuyển mono, hạ sample rate, cắt khoảng lặng, nén MP3
+"""
+import io
+import struct
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    import soundfile
+except ImportError:  # Không có soundfile: bài nói được lưu dạng WAV (không nén)
+    soundfile = None
+
+
+class ImageProcessor:
+    """Chuẩn hóa ảnh upload và tạo các biến thể theo kích thước hiển thị"""
+
+    # Tên biến thể -> cạnh dài tối đa (px), sắp xếp từ nhỏ tới lớn
+    VARIANTS = {"thumb": 200, "display": 800}
+    VARIANT_FORMAT = "WEBP"
+    VARIANT_QUALITY = 80
+    VARIANT_EXT = "webp"
+    VARIANT_TYPE = "image/webp"
+
+    # Định dạng lưu bản gốc (đã bỏ EXIF) theo đuôi file
+    ORIGINAL_FORMATS = {
+        "jpg": ("JPEG", "image/jpeg"),
+        "jpeg": ("JPEG", "image/jpeg"),
+        "png": ("PNG", "image/png"),
+    }
+
+    @staticmethod
+    def _open(data):
+        """Giải mã ảnh và xoay đúng chiều theo EXIF Orientation"""
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise ValueError("File ảnh không hợp lệ") from e
+        return ImageOps.exif_transpose(image)
+
+    @staticmethod
+    def _encode(image, fmt, **params):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, **params)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _strip(image, fmt):
+        """Chuyển về mode phù hợp với định dạng (JPEG không có kênh alpha)"""
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            return image.convert("RGB")
+        if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            return image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        return image
+
+    @staticmethod
+    def process(data, ext):
+        """
+        Trả về (original, variants):
+        - original: (bytes, content_type) ảnh gốc đã xoay và bỏ EXIF, giữ nguyên kích thước
+        - variants: {tên: (bytes, content_type, width, height)} các bản thu nhỏ WEBP
+        Biến thể không lớn hơn ảnh gốc; ảnh nhỏ hơn ngưỡng chỉ được đổi định dạng.
+        """
+        image = ImageProcessor._open(data)
+        fmt, content_type = ImageProcessor.ORIGINAL_FORMATS.get(ext, ("PNG", "image/png"))
+
+        # Lưu lại không kèm exif/icc/xmp -> metadata (GPS, thiết bị...) bị loại bỏ
+        original = ImageProcessor._strip(image, fmt)
+        params = {"quality": 90, "optimize": True} if fmt == "JPEG" else {"optimize": True}
+        original_bytes = ImageProcessor._encode(original, fmt, **params)
+
+        variants = {}
+        source = ImageProcessor._strip(image, ImageProcessor.VARIANT_FORMAT)
+        if source.mode == "P":
+            source = source.convert("RGBA")
+        for name, max_side in ImageProcessor.VARIANTS.items():
+            resized = source.copy()
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+            encoded = ImageProcessor._encode(
+                resized, ImageProcessor.VARIANT_FORMAT,
+                quality=ImageProcessor.VARIANT_QUALITY, method=4
+            )
+            variants[name] = (encoded, ImageProcessor.VARIANT_TYPE, resized.width, resized.height)
+
+        return (original_bytes, content_type), variants
+
+
+class AudioProcessor:
+    """
+    Thu gọn file ghi âm WAV trước khi lưu: chuyển mono, đưa về tần số lấy mẫu cho giọng nói,
+    cắt khoảng lặng đầu/cuối rồi nén MP3 (phát được trên mọi trình duyệt, kể cả Safari cũ).
+    Thiếu soundfile hoặc libsndfile không mã hóa được MP3 thì ghi lại PCM 16-bit.
+    """
+
+    TARGET_RATE = 16000       # Đủ cho giọng nói (băng thông ~8 kHz), là 1 tần số MP3 (MPEG-2) hỗ trợ
+    FORMAT, SUBTYPE = "MP3", "MPEG_LAYER_III"
+    CONTENT_TYPE = "audio/mpeg"
+    COMPRESSION_LEVEL = 0.9   # 0 = bitrate cao nhất, 1 = file nhỏ nhất; 0.9 ~ 22 kbps với 16 kHz mono
+    EXTENSIONS = {"audio/mpeg": "mp3", "audio/wav": "wav"}
+    FRAME_SECONDS = 0.02      # Độ dài khung khi đo năng lượng
+    SILENCE_RMS = 0.01        # Cùng ngưỡng mặc định với audio_recorder
+    PADDING_SECONDS = 0.15    # Giữ lại một đoạn ngắn trước/sau tiếng nói
+
+    @staticmethod
+    def _read_wav(data):
+        """Đọc WAV (PCM 8/16/24/32-bit hoặc float) -> (mảng float32 [mẫu, kênh], sample rate)"""
+        if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("Không phải file WAV")
+
+        fmt = None
+        samples = None
+        pos = 12
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            size = int.from_bytes(data[pos + 4:pos + 8], "little")
+            body = data[pos + 8:pos + 8 + size]
+            if chunk_id == b"fmt ":
+                tag, channels, rate = struct.unpack("<HHI", body[:8])
+                bits = struct.unpack("<H", body[14:16])[0]
+                if tag == 0xFFFE and len(body) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE: định dạng thật nằm ở đầu SubFormat GUID
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk_id == b"data":
+                samples = body
+            pos += 8 + size + (size & 1)
+
+        if fmt is None or samples is None:
+            raise ValueError("File WAV thiếu dữ liệu")
+
+        tag, channels, rate, bits = fmt
+        width = bits // 8
+        if not channels or not width:
+            raise ValueError("File WAV không hợp lệ")
+        usable = len(samples) - len(samples) % (width * channels)
+        raw = np.frombuffer(samples[:usable], dtype=np.uint8)
+
+        if tag == 3 and bits in (32, 64):
+            audio = raw.view("<f4" if bits == 32 else "<f8").astype(np.float32)
+        elif tag == 1 and bits == 8:
+            audio = (raw.astype(np.float32) - 128) / 128
+        elif tag == 1 and bits == 16:
+            audio = raw.view("<i2").astype(np.float32) / 32768
+        elif tag == 1 and bits == 24:
+            triples = raw.reshape(-1, 3).astype(np.int32)
+            values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+            values = np.where(values & 0x800000, values - 0x1000000, values)
+            audio = values.astype(np.float32) / 8388608
+        elif tag == 1 and bits == 32:
+            audio = raw.view("<i4").astype(np.float32) / 2147483648
+        else:
+            raise ValueError(f"Định dạng WAV chưa hỗ trợ (format={tag}, bits={bits})")
+
+        return audio.reshape(-1, channels), rate
+
+    @staticmethod
+    def _write_wav(audio, rate):
+        """Ghi mảng float mono thành WAV PCM 16-bit"""
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        header = b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVE"
+        header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16)
+        header += b"data" + struct.pack("<I", len(pcm))
+        return header + pcm
+
+    @staticmethod
+    def _encode(audio, rate):
+        """Mảng float mono -> (bytes, content type): MP3 nếu mã hóa được, không thì WAV PCM 16-bit"""
+        if soundfile is not None and len(audio):
+            buffer = io.BytesIO()
+            try:
+                soundfile.write(buffer, np.clip(audio, -1.0, 1.0), rate, format=AudioProcessor.FORMAT,
+                                subtype=AudioProcessor.SUBTYPE, compression_level=AudioProcessor.COMPRESSION_LEVEL)
+                return buffer.getvalue(), AudioProcessor.CONTENT_TYPE
+            except RuntimeError:
+                pass  # libsndfile của hệ thống build không kèm bộ mã hóa MP3
+        return AudioProcessor._write_wav(audio, rate), "audio/wav"
+
+    @staticmethod
+    def extension(content_type):
+        """Đuôi file theo content type thực sự được lưu"""
+        return AudioProcessor.EXTENSIONS.get(content_type, "wav")
+
+    @staticmethod
+    def _resample(audio, rate, target):
+        """
+        Đưa về `target` Hz: hạ tần số thì lọc thông thấp (windowed-sinc) trước,
+        rồi nội suy tuyến tính (MP3 chỉ nhận một số tần số nên bản ghi tần số thấp cũng được nâng lên)
+        """
+        if rate == target or not len(audio):
+            return audio, rate
+        filtered = audio
+        if rate > target:
+            cutoff = 0.45 * target / rate
+            taps = np.arange(-32, 33)
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+            filtered = np.convolve(audio, kernel / kernel.sum(), mode="same")
+        length = int(len(audio) * target / rate)
+        positions = np.arange(length) * (rate / target)
+        return np.interp(positions, np.arange(len(audio)), filtered).astype(np.float32), target
+
+    @staticmethod
+    def _trim(audio, rate):
+        """Cắt khoảng lặng đầu/cuối theo năng lượng RMS từng khung"""
+        frame = max(1, int(rate * AudioProcessor.FRAME_SECONDS))
+        count = len(audio) // frame
+        if not count:
+            return audio
+        frames = audio[:count * frame].reshape(count, frame)
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        voiced = np.nonzero(rms >= AudioProcessor.SILENCE_RMS)[0]
+        if not len(voiced):
+            return audio  # Toàn khoảng lặng: giữ nguyên để giáo viên vẫn nghe được
+        padding = int(rate * AudioProcessor.PADDING_SECONDS)
+        start = max(0, voiced[0] * frame - padding)
+        end = min(len(audio), (voiced[-1] + 1) * frame + padding)
+        return audio[start:end]
+
+    @staticmethod
+    def compact(data):
+        """
+        Trả về (bytes, content type, metadata) với metadata gồm:
+        audio_duration (giây, sau khi cắt), audio_original_bytes, audio_stored_bytes
+        """
+        audio, rate = AudioProcessor._read_wav(data)
+        mono = audio.mean(axis=1) if audio.shape[1] > 1 else audio[:, 0]
+        mono, rate = AudioProcessor._resample(mono, rate, AudioProcessor.TARGET_RATE)
+        mono = AudioProcessor._trim(mono, rate)
+        compacted, content_type = AudioProcessor._encode(mono, rate)
+        return compacted, content_type, {
+            "audio_duration": round(len(mono) / rate, 2) if rate else 0.0,
+            "audio_original_bytes": len(data),
+            "audio_stored_bytes": len(compacted),
+        }
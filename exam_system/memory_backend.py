@@ -0,0 +1,646 @@
+"""
+Backend giả lập Firestore/Storage trong bộ nhớ (dùng cho load test, benchmark)
+
+Chỉ hỗ trợ phần API mà ứng dụng đang dùng: collection, document, where,
+order_by, select, limit, start_after, stream, get, add, set, update, create,
+delete, batch, transaction (dùng được với firestore.transactional), get_all và blob (upload/download/exists/delete/signed URL).
+Mỗi lần gọi "ra mạng" đều chờ thêm độ trễ cấu hình được để mô phỏng Firebase thật.
+"""
+import copy
+import functools
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+try:
+    from google.cloud.firestore_v1 import transforms as _transforms
+except ImportError:  # Cho phép chạy benchmark khi không cài firebase
+    _transforms = None
+
+try:
+    from google.api_core.exceptions import AlreadyExists, NotFound
+except ImportError:
+    class AlreadyExists(Exception):
+        pass
+
+    class NotFound(Exception):
+        pass
+
+
+DOCUMENT_ID = "__name__"
+_DELETE = object()
+
+
+class Latency:
+    """Độ trễ giả lập cho mỗi RPC (ms), có dao động ngẫu nhiên"""
+
+    def __init__(self, mean_ms=0.0, jitter_ms=0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    def sleep(self):
+        if self.mean_ms <= 0 and self.jitter_ms <= 0:
+            return
+        delay = self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+# ========================
+# Tiện ích xử lý field path và giá trị đặc biệt
+# ========================
+
+def _split_path(path):
+    """Tách field path 'a.b' hoặc '`a.b`.c' thành danh sách phần tử"""
+    if isinstance(path, (list, tuple)):
+        return list(path)
+    if hasattr(path, "parts"):
+        return list(path.parts)
+    parts, buf, quoted = [], "", False
+    for ch in path:
+        if ch == "`":
+            quoted = not quoted
+        elif ch == "." and not quoted:
+            parts.append(buf)
+            buf = ""
+        else:
+            buf += ch
+    parts.append(buf)
+    return parts
+
+
+def _get_field(data, path):
+    node = data
+    for part in _split_path(path):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
+
+
+def _set_field(data, parts, value):
+    node = data
+    for part in parts[:-1]:
+        if not isinstance(node.get(part), dict):
+            node[part] = {}
+        node = node[part]
+    if value is _DELETE:
+        node.pop(parts[-1], None)
+    else:
+        node[parts[-1]] = value
+
+
+def _resolve(value, current=None):
+    """Thay các giá trị đặc biệt (SERVER_TIMESTAMP, Increment...) bằng giá trị thật"""
+    if isinstance(value, dict):
+        return {k: _resolve(v, (current or {}).get(k) if isinstance(current, dict) else None)
+                for k, v in value.items()}
+    if _transforms is None:
+        return copy.deepcopy(value)
+    if value is _transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if value is _transforms.DELETE_FIELD:
+        return _DELETE
+    if isinstance(value, _transforms.Increment):
+        return (current or 0) + value.value
+    if isinstance(value, _transforms.ArrayUnion):
+        base = list(current or [])
+        return base + [v for v in value.values if v not in base]
+    if isinstance(value, _transforms.ArrayRemove):
+        return [v for v in (current or []) if v not in value.values]
+    return copy.deepcopy(value)
+
+
+def _merge(target, data):
+    """Gộp dict lồng nhau (set(..., merge=True))"""
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            resolved = _resolve(value, target.get(key))
+            if resolved is _DELETE:
+                target.pop(key, None)
+            else:
+                target[key] = resolved
+
+
+def _sort_key(value):
+    """Thứ tự giữa các kiểu dữ liệu gần giống Firestore"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _compare(op, left, right):
+    if op == "==":
+        return left == right
+    if op == "!=":
+        return left is not None and left != right
+    if op == "in":
+        return left in right
+    if op == "not-in":
+        return left is not None and left not in right
+    if op == "array_contains":
+        return isinstance(left, list) and right in left
+    if op == "array_contains_any":
+        return isinstance(left, list) and any(v in left for v in right)
+    if left is None:
+        return False
+    a, b = _sort_key(left), _sort_key(right)
+    if a[0] != b[0]:
+        return False
+    return {"<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+
+
+# ========================
+# Firestore
+# ========================
+
+class MemorySnapshot:
+    """Tương đương DocumentSnapshot"""
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        return copy.deepcopy(_get_field(self._data or {}, field_path))
+
+
+class MemoryDocument:
+    """Tương đương DocumentReference"""
+
+    def __init__(self, db, collection_path, doc_id):
+        self._db = db
+        self._collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    @property
+    def parent(self):
+        return MemoryCollection(self._db, self._collection_path)
+
+    def collection(self, name):
+        return MemoryCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        self._db._rpc("get")
+        with self._db._lock:
+            data = self._db._docs(self._collection_path).get(self.id)
+            self._db.stats["docs_read"] += 1
+            return MemorySnapshot(self, copy.deepcopy(data))
+
+    def set(self, document_data, merge=False):
+        self._db._rpc("set")
+        with self._db._lock:
+            self._db._apply(("set", self, document_data, merge))
+
+    def create(self, document_data):
+        self._db._rpc("create")
+        with self._db._lock:
+            self._db._apply(("create", self, document_data, False))
+
+    def update(self, field_updates):
+        self._db._rpc("update")
+        with self._db._lock:
+            self._db._apply(("update", self, field_updates, False))
+
+    def delete(self):
+        self._db._rpc("delete")
+        with self._db._lock:
+            self._db._apply(("delete", self, None, False))
+
+
+class MemoryQuery:
+    """Tương đương Query, các phương thức trả về query mới (bất biến)"""
+
+    def __init__(self, db, collection_path, filters=(), orders=(), fields=None,
+                 limit=None, offset=0, cursor=None):
+        self._db = db
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._fields = fields
+        self._limit = limit
+        self._offset = offset
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders, "fields": self._fields,
+            "limit": self._limit, "offset": self._offset, "cursor": self._cursor,
+        }
+        state.update(changes)
+        return MemoryQuery(self._db, self._collection_path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((_field_name(field_path), op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((_field_name(field_path), direction),))
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy(offset=num_to_skip)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def _value(self, doc_id, data, field):
+        return doc_id if field == DOCUMENT_ID else _get_field(data, field)
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            if field == DOCUMENT_ID and isinstance(value, MemoryDocument):
+                value = value.id
+            if not _compare(op, self._value(doc_id, data, field), value):
+                return False
+        return True
+
+    def _orders_with_id(self):
+        orders = list(self._orders)
+        if not any(field == DOCUMENT_ID for field, _ in orders):
+            direction = orders[-1][1] if orders else "ASCENDING"
+            orders.append((DOCUMENT_ID, direction))
+        return orders
+
+    def _compare_rows(self, left, right, orders):
+        for index, (_, direction) in enumerate(orders):
+            a, b = _sort_key(left[index]), _sort_key(right[index])
+            if a != b:
+                result = -1 if a < b else 1
+                return -result if direction == "DESCENDING" else result
+        return 0
+
+    def _run(self):
+        orders = self._orders_with_id()
+        with self._db._lock:
+            rows = [
+                (tuple(self._value(doc_id, data, f) for f, _ in orders), doc_id, data)
+                for doc_id, data in self._db._docs(self._collection_path).items()
+                if self._matches(doc_id, data)
+            ]
+        rows.sort(key=functools.cmp_to_key(lambda a, b: self._compare_rows(a[0], b[0], orders)))
+
+        if self._cursor is not None:
+            if isinstance(self._cursor, MemorySnapshot):
+                cursor = tuple(
+                    self._cursor.id if f == DOCUMENT_ID else _get_field(self._cursor._data or {}, f)
+                    for f, _ in orders
+                )
+                rows = [r for r in rows if self._compare_rows(r[0], cursor, orders) > 0]
+            else:
+                cursor = tuple(self._cursor.get(f) for f, _ in self._orders)
+                width = len(cursor)
+                rows = [r for r in rows if self._compare_rows(r[0][:width], cursor, orders[:width]) > 0]
+
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        results = []
+        for _, doc_id, data in rows:
+            if self._fields is not None:
+                projected = {}
+                for field in self._fields:
+                    value = _get_field(data, field)
+                    if value is not None:
+                        _set_field(projected, _split_path(field), copy.deepcopy(value))
+                data = projected
+            else:
+                data = copy.deepcopy(data)
+            results.append(MemorySnapshot(MemoryDocument(self._db, self._collection_path, doc_id), data))
+        return results
+
+    def stream(self, transaction=None):
+        self._db._rpc("query")
+        results = self._run()
+        with self._db._lock:
+            self._db.stats["docs_read"] += max(len(results), 1)
+        return iter(results)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class MemoryCollection(MemoryQuery):
+    """Tương đương CollectionReference"""
+
+    def __init__(self, db, path):
+        super().__init__(db, path)
+        self.id = path.rsplit("/", 1)[-1]
+        self.path = path
+
+    def document(self, document_id=None):
+        return MemoryDocument(self._db, self.path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.now(timezone.utc), ref
+
+
+class MemoryWriteBatch:
+    """Tương đương WriteBatch: ghi nguyên khối khi commit"""
+
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set", reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._ops.append(("create", reference, document_data, False))
+
+    def update(self, reference, field_updates):
+        self._ops.append(("update", reference, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self):
+        self._db._rpc("commit")
+        with self._db._lock:
+            # Kiểm tra trước để lỗi không làm batch bị ghi dở dang
+            for op, ref, _, _ in self._ops:
+                exists = ref.id in self._db._docs(ref._collection_path)
+                if op == "create" and exists:
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+                if op == "update" and not exists:
+                    raise NotFound(f"No document to update: {ref.path}")
+            for op in self._ops:
+                self._db._apply(op)
+        ops, self._ops = self._ops, []
+        return ops
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    """
+    Tương đương Transaction: giữ lock của db từ lúc bắt đầu tới commit/rollback,
+    nên phần đọc-rồi-ghi bên trong chạy tuần tự với mọi thao tác khác (không cần thử lại).
+    Có các hàm _begin/_commit/_rollback mà firestore.transactional gọi.
+    """
+
+    def __init__(self, db, max_attempts=5, read_only=False):
+        super().__init__(db)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+
+    def _clean_up(self):
+        self._ops = []
+
+    def _begin(self, retry_id=None):
+        self._db._lock.acquire()
+        self._id = uuid.uuid4().hex
+
+    def _commit(self):
+        try:
+            return self.commit()
+        finally:
+            self._release()
+
+    def _rollback(self):
+        self._ops = []
+        self._release()
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self._db._lock.release()
+
+
+class MemoryFirestore:
+    """Firestore client giả lập, dữ liệu nằm trong dict của process"""
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.stats = Counter()
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _rpc(self, op):
+        with self._lock:
+            self.stats[op] += 1
+        self.latency.sleep()
+
+    def _docs(self, collection_path):
+        return self._collections.setdefault(collection_path, {})
+
+    def _apply(self, write):
+        """Thực hiện 1 thao tác ghi (đã giữ lock)"""
+        op, ref, data, merge = write
+        docs = self._docs(ref._collection_path)
+        current = docs.get(ref.id)
+
+        if op == "create":
+            if current is not None:
+                raise AlreadyExists(f"Document already exists: {ref.path}")
+            docs[ref.id] = _resolve(data)
+        elif op == "set":
+            if merge and current is not None:
+                _merge(current, data)
+            else:
+                target = {}
+                _merge(target, data)
+                docs[ref.id] = target
+        elif op == "update":
+            if current is None:
+                raise NotFound(f"No document to update: {ref.path}")
+            for path, value in data.items():
+                parts = _split_path(path)
+                _set_field(current, parts, _resolve(value, _get_field(current, parts)))
+        elif op == "delete":
+            docs.pop(ref.id, None)
+        self.stats["docs_written"] += 1
+
+    def collection(self, collection_path):
+        return MemoryCollection(self, collection_path)
+
+    def document(self, document_path):
+        collection_path, doc_id = document_path.rsplit("/", 1)
+        return MemoryDocument(self, collection_path, doc_id)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return MemoryTransaction(self, **kwargs)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._rpc("get_all")
+        with self._lock:
+            for ref in references:
+                self.stats["docs_read"] += 1
+                data = self._docs(ref._collection_path).get(ref.id)
+                yield MemorySnapshot(ref, copy.deepcopy(data))
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    def clear(self):
+        """Xóa toàn bộ dữ liệu và thống kê"""
+        with self._lock:
+            self._collections.clear()
+            self.stats.clear()
+
+
+def _field_name(field_path):
+    """Chuẩn hóa field path (chuỗi hoặc FieldPath) thành chuỗi"""
+    if isinstance(field_path, str):
+        return field_path
+    if hasattr(field_path, "to_api_repr"):
+        return field_path.to_api_repr()
+    return str(field_path)
+
+
+# ========================
+# Storage
+# ========================
+
+class MemoryBlob:
+    """Tương đương storage.Blob"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def size(self):
+        entry = self.bucket._blobs.get(self.name)
+        return len(entry[0]) if entry else None
+
+    @property
+    def content_type(self):
+        entry = self.bucket._blobs.get(self.name)
+        return entry[1] if entry else None
+
+    def upload_from_string(self, data, content_type="application/octet-stream"):
+        self.bucket._rpc("upload")
+        if isinstance(data, str):
+            data = data.encode()
+        with self.bucket._lock:
+            self.bucket._blobs[self.name] = (bytes(data), content_type)
+            self.bucket.stats["bytes_uploaded"] += len(data)
+
+    def download_as_bytes(self):
+        self.bucket._rpc("download")
+        with self.bucket._lock:
+            entry = self.bucket._blobs.get(self.name)
+        if entry is None:
+            raise NotFound(f"No such object: {self.name}")
+        return entry[0]
+
+    def exists(self):
+        self.bucket._rpc("exists")
+        with self.bucket._lock:
+            return self.name in self.bucket._blobs
+
+    def delete(self):
+        self.bucket._rpc("delete")
+        with self.bucket._lock:
+            if self.bucket._blobs.pop(self.name, None) is None:
+                raise NotFound(f"No such object: {self.name}")
+
+    def generate_signed_url(self, version="v4", expiration=900, **kwargs):
+        # Ký URL là thao tác cục bộ (RSA), không tốn RPC nhưng vẫn được đếm
+        with self.bucket._lock:
+            self.bucket.stats["sign"] += 1
+        expires = int(time.time() + (expiration.total_seconds() if hasattr(expiration, "total_seconds") else expiration))
+        return f"memory://{self.bucket.name}/{self.name}?expires={expires}"
+
+
+class MemoryBucket:
+    """Storage bucket giả lập"""
+
+    def __init__(self, name="memory-bucket", latency=None):
+        self.name = name
+        self.latency = latency or Latency()
+        self.stats = Counter()
+        self._blobs = {}
+        self._lock = threading.RLock()
+
+    def _rpc(self, op):
+        with self._lock:
+            self.stats[op] += 1
+        self.latency.sleep()
+
+    def blob(self, blob_name):
+        return MemoryBlob(self, blob_name)
+
+    def get_blob(self, blob_name):
+        return MemoryBlob(self, blob_name) if self.blob(blob_name).exists() else None
+
+    def list_blobs(self, prefix=""):
+        self._rpc("list")
+        with self._lock:
+            names = sorted(n for n in self._blobs if n.startswith(prefix))
+        return [MemoryBlob(self, n) for n in names]
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    def clear(self):
+        """Xóa toàn bộ file và thống kê"""
+        with self._lock:
+            self._blobs.clear()
+            self.stats.clear()
+
+
+# ========================
+# Singleton cho cả process
+# ========================
+
+_db = None
+_bucket = None
+_init_lock = threading.Lock()
+
+
+def get_memory_db(latency_ms=0.0, jitter_ms=0.0):
+    """Firestore giả lập dùng chung cho cả process"""
+    global _db
+    with _init_lock:
+        if _db is None:
+            _db = MemoryFirestore(Latency(latency_ms, jitter_ms))
+        return _db
+
+
+def get_memory_bucket(latency_ms=0.0, jitter_ms=0.0):
+    """Storage bucket giả lập dùng chung cho cả process"""
+    global _bucket
+    with _init_lock:
+        if _bucket is None:
+            _bucket = MemoryBucket(latency=Latency(latency_ms, jitter_ms))
+        return _bucket
@@ -1,9 +1,19 @@
 """
 Data models và database repositories
 """
+import hashlib
+import math
+import random
+import re
+import threading
+import time
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.field_path import FieldPath
+from scoring import total_score
 
 @dataclass
 class Question:
@@ -16,6 +26,9 @@ class Question:
     correct_answer: str
     image_path: Optional[str] = None
     audio_path: Optional[str] = None
+    image_variants: Optional[dict] = None
+    max_score: float = 1.0
+    partial_credit: Optional[dict] = None
     
     def to_dict(self):
         return {
@@ -27,6 +40,9 @@ class Question:
             "correct_answer": self.correct_answer,
             "image_path": self.image_path,
             "audio_path": self.audio_path,
+            "image_variants": self.image_variants,
+            "max_score": self.max_score,
+            "partial_credit": self.partial_credit or {},
             "created_at": firestore.SERVER_TIMESTAMP
         }
 
@@ -52,6 +68,556 @@ class QuestionRepository:
         return [{"id": doc.id, **doc.to_dict()} for doc in docs]
 
 
+class UserRepository:
+    """
+    Thao tác với tài khoản, kèm chỉ mục usernames/{vai trò}:{username} -> mã người dùng
+    (học sinh và giáo viên được trùng tên đăng nhập, trong cùng vai trò thì không)
+    """
+    
+    INDEX_COLLECTION = "usernames"
+    # Các trường hiển thị ở danh sách (không tải password_hash)
+    DISPLAY_FIELDS = ["username", "full_name", "role", "is_active", "email", "metadata"]
+    WRITE_BATCH_SIZE = 500
+    
+    # Cache chỉ mục dùng chung cho cả process: khóa chỉ mục -> mã người dùng
+    _index_cache = {}
+    _lock = threading.Lock()
+    
+    def __init__(self, db):
+        self.db = db
+        self.collection = "users"
+    
+    @staticmethod
+    def index_key(username, role):
+        """Khóa chỉ mục "vai trò:username" (None nếu username không dùng được làm document ID)"""
+        name = (username or "").strip().lower()
+        if not name or not role or "/" in name or name in (".", ".."):
+            return None
+        return f"{role}:{name}"
+    
+    def get(self, user_id):
+        """Lấy tài khoản theo mã (1 lần đọc document)"""
+        doc = self.db.collection(self.collection).document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+    
+    def find_by_username(self, username, role):
+        """
+        Tìm tài khoản theo username và vai trò, trả về (mã người dùng, dữ liệu) hoặc (None, None).
+        Khi cache chỉ mục đã có thì chỉ tốn 1 lần đọc document.
+        """
+        key = self.index_key(username, role)
+        if key:
+            with UserRepository._lock:
+                user_id = UserRepository._index_cache.get(key)
+            if user_id is None:
+                index_doc = self.db.collection(self.INDEX_COLLECTION).document(key).get()
+                user_id = index_doc.to_dict().get("user_id") if index_doc.exists else None
+            
+            if user_id:
+                data = self.get(user_id)
+                # Bỏ qua chỉ mục cũ (tài khoản đã xóa hoặc đổi username/vai trò)
+                if data and self.index_key(data.get("username"), data.get("role")) == key:
+                    self._remember(key, user_id)
+                    return user_id, data
+                self._forget(key)
+        
+        # Tài khoản tạo trước khi có chỉ mục (chưa chạy backfill_index): tìm bằng query rồi bổ sung chỉ mục.
+        # Username được lưu dạng viết thường nên query theo dạng chuẩn hóa như khóa chỉ mục,
+        # sau đó mới thử đúng chuỗi đã nhập (tài khoản cũ tạo tay có chữ hoa)
+        docs = []
+        for name in dict.fromkeys([(username or "").strip().lower(), (username or "").strip()]):
+            docs = list(self.db.collection(self.collection)\
+                .where("username", "==", name)\
+                .where("role", "==", role)\
+                .limit(1)\
+                .stream())
+            if docs:
+                break
+        if not docs:
+            return None, None
+        
+        doc = docs[0]
+        if key:
+            self.db.collection(self.INDEX_COLLECTION).document(key).set({"user_id": doc.id, "role": role})
+            self._remember(key, doc.id)
+        return doc.id, doc.to_dict()
+    
+    def create(self, user_id, user_data):
+        """
+        Tạo/ghi đè tài khoản và chỉ mục username trong cùng 1 batch.
+        AlreadyExists nếu username đã thuộc về tài khoản khác cùng vai trò (kể cả khi tài khoản đó
+        vừa được tạo ở phiên khác: chỉ mục mới được ghi bằng create).
+        Ghi đè làm đổi username/vai trò thì chỉ mục cũ của tài khoản bị xóa trong cùng batch.
+        """
+        batch = self.db.batch()
+        user_ref = self.db.collection(self.collection).document(user_id)
+        key = self.index_key(user_data.get("username"), user_data.get("role"))
+        old = user_ref.get()
+        old_data = old.to_dict() if old.exists else {}
+        old_key = self.index_key(old_data.get("username"), old_data.get("role"))
+        if old_key and old_key != key:
+            old_index = self.db.collection(self.INDEX_COLLECTION).document(old_key)
+            old_entry = old_index.get()
+            if old_entry.exists and old_entry.to_dict().get("user_id") == user_id:
+                batch.delete(old_index)
+        batch.set(user_ref, user_data)
+        if key:
+            index_ref = self.db.collection(self.INDEX_COLLECTION).document(key)
+            index_doc = index_ref.get()
+            owner = index_doc.to_dict().get("user_id") if index_doc.exists else None
+            if owner and owner != user_id and self.get(owner):
+                raise AlreadyExists(f"Tên đăng nhập '{user_data.get('username')}' đã được dùng")
+            entry = {"user_id": user_id, "role": user_data.get("role")}
+            if index_doc.exists:
+                # Chỉ mục của chính tài khoản này (ghi đè) hoặc của tài khoản đã bị xóa
+                batch.set(index_ref, entry)
+            else:
+                batch.create(index_ref, entry)
+        batch.commit()
+        if old_key and old_key != key:
+            self._forget(old_key)
+        if key:
+            self._remember(key, user_id)
+    
+    def existing_ids(self, user_ids, chunk_size=500):
+        """Các mã người dùng đã tồn tại trong `user_ids` (đọc theo lô bằng get_all)"""
+        return self._existing(self.collection, list(dict.fromkeys(user_ids)), chunk_size)
+    
+    def taken_usernames(self, usernames, role, chunk_size=500):
+        """Các username (viết thường) đã có trong chỉ mục của vai trò `role`"""
+        keys = [k for k in dict.fromkeys(self.index_key(u, role) for u in usernames) if k]
+        return {key.split(":", 1)[1] for key in self._existing(self.INDEX_COLLECTION, keys, chunk_size)}
+    
+    def _existing(self, collection, doc_ids, chunk_size):
+        found = set()
+        ref = self.db.collection(collection)
+        for start in range(0, len(doc_ids), chunk_size):
+            refs = [ref.document(doc_id) for doc_id in doc_ids[start:start + chunk_size]]
+            found.update(doc.id for doc in self.db.get_all(refs) if doc.exists)
+        return found
+    
+    def create_many(self, users, batch_size=250):
+        """
+        Tạo nhiều tài khoản mới (không ghi đè), mỗi tài khoản gồm document users + usernames.
+        users: list (user_id, user_data). Trả về (danh sách mã đã tạo, {mã: lỗi}).
+        Batch lỗi (vd. trùng mã do người khác vừa tạo) được thử lại từng tài khoản để tách lỗi.
+        """
+        created, errors = [], {}
+        for start in range(0, len(users), batch_size):
+            chunk = users[start:start + batch_size]
+            batch = self.db.batch()
+            for user_id, user_data in chunk:
+                self._add_create(batch, user_id, user_data)
+            try:
+                batch.commit()
+                created += [user_id for user_id, _ in chunk]
+            except Exception:
+                for user_id, user_data in chunk:
+                    single = self.db.batch()
+                    self._add_create(single, user_id, user_data)
+                    try:
+                        single.commit()
+                        created.append(user_id)
+                    except AlreadyExists:
+                        errors[user_id] = "Mã người dùng hoặc tên đăng nhập đã tồn tại"
+                    except Exception as e:
+                        errors[user_id] = str(e) or type(e).__name__
+        
+        for user_id, user_data in users:
+            key = self.index_key(user_data.get("username"), user_data.get("role"))
+            if key and user_id not in errors:
+                self._remember(key, user_id)
+        return created, errors
+    
+    def _add_create(self, batch, user_id, user_data):
+        batch.create(self.db.collection(self.collection).document(user_id), user_data)
+        key = self.index_key(user_data.get("username"), user_data.get("role"))
+        if key:
+            batch.create(
+                self.db.collection(self.INDEX_COLLECTION).document(key),
+                {"user_id": user_id, "role": user_data.get("role")}
+            )
+    
+    def list_page(self, role=None, search=None, page_size=50, start_after=None):
+        """
+        Lấy 1 trang tài khoản (chỉ DISPLAY_FIELDS), trả về (danh sách, cursor cho trang sau).
+        search: tiền tố mã (HS../GV..) hoặc tiền tố tên đăng nhập.
+        """
+        collection = self.db.collection(self.collection)
+        query = collection
+        if role:
+            query = query.where("role", "==", role)
+        
+        search = (search or "").strip()
+        if search and re.match(r"^(HS|GV)\d*$", search, re.IGNORECASE):
+            # Tìm theo mã: khoảng document ID [prefix, prefix + \uf8ff)
+            prefix = search.upper()
+            document_id = FieldPath.document_id()
+            query = query.where(document_id, ">=", collection.document(prefix))\
+                .where(document_id, "<", collection.document(prefix + "\uf8ff"))\
+                .order_by(document_id)
+        elif search:
+            prefix = search.lower()
+            query = query.where("username", ">=", prefix)\
+                .where("username", "<", prefix + "\uf8ff")\
+                .order_by("username")
+        else:
+            query = query.order_by(FieldPath.document_id())
+        
+        query = query.select(self.DISPLAY_FIELDS).limit(page_size)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        
+        docs = list(query.stream())
+        items = [d.to_dict() | {"id": d.id} for d in docs]
+        return items, (docs[-1] if docs else None)
+    
+    def delete_many(self, users):
+        """Xóa nhiều tài khoản theo batch. users: list (user_id, username, role). Trả về số tài khoản đã xóa"""
+        per_batch = self.WRITE_BATCH_SIZE // 2  # Mỗi tài khoản: users + usernames
+        deleted = 0
+        for start in range(0, len(users), per_batch):
+            chunk = users[start:start + per_batch]
+            batch = self.db.batch()
+            for user_id, username, role in chunk:
+                batch.delete(self.db.collection(self.collection).document(user_id))
+                key = self.index_key(username, role)
+                if key:
+                    batch.delete(self.db.collection(self.INDEX_COLLECTION).document(key))
+            batch.commit()
+            deleted += len(chunk)
+            for _, username, role in chunk:
+                key = self.index_key(username, role)
+                if key:
+                    self._forget(key)
+        return deleted
+    
+    def set_active_many(self, user_ids, active):
+        """Khóa/mở khóa nhiều tài khoản theo batch, trả về số tài khoản đã cập nhật"""
+        updated = 0
+        for start in range(0, len(user_ids), self.WRITE_BATCH_SIZE):
+            chunk = user_ids[start:start + self.WRITE_BATCH_SIZE]
+            batch = self.db.batch()
+            for user_id in chunk:
+                batch.update(self.db.collection(self.collection).document(user_id), {"is_active": active})
+            batch.commit()
+            updated += len(chunk)
+        return updated
+    
+    def delete(self, user_id, username=None, role=None):
+        """Xóa tài khoản và chỉ mục username"""
+        batch = self.db.batch()
+        batch.delete(self.db.collection(self.collection).document(user_id))
+        key = self.index_key(username, role)
+        if key:
+            batch.delete(self.db.collection(self.INDEX_COLLECTION).document(key))
+        batch.commit()
+        if key:
+            self._forget(key)
+    
+    def backfill_index(self, page_size=250):
+        """
+        Ghi chỉ mục cho mọi tài khoản (tài khoản tạo trước khi có chỉ mục hoặc theo khóa cũ chỉ có
+        username) và xóa khóa cũ. Không ghi đè chỉ mục đang trỏ tới tài khoản khác.
+        Duyệt users theo document ID, mỗi trang 1 batch. Trả về số chỉ mục đã ghi.
+        """
+        users = self.db.collection(self.collection)
+        index = self.db.collection(self.INDEX_COLLECTION)
+        document_id = FieldPath.document_id()
+        written, last_doc = 0, None
+        while True:
+            query = users.order_by(document_id).select(["username", "role"]).limit(page_size)
+            if last_doc is not None:
+                query = query.start_after(last_doc)
+            docs = list(query.stream())
+            if not docs:
+                break
+            last_doc = docs[-1]
+            
+            wanted = {}
+            for doc in docs:
+                data = doc.to_dict() or {}
+                key = self.index_key(data.get("username"), data.get("role"))
+                if key and key not in wanted:
+                    wanted[key] = (doc.id, data)
+            existing = {d.id: d.to_dict() for d in self.db.get_all([index.document(k) for k in wanted]) if d.exists}
+            
+            batch = self.db.batch()
+            for key, (user_id, data) in wanted.items():
+                if key not in existing:
+                    batch.create(index.document(key), {"user_id": user_id, "role": data.get("role")})
+                    written += 1
+            # Khóa cũ chỉ có username (trước khi chỉ mục tách theo vai trò); khóa mới luôn có ":"
+            for legacy in {key.split(":", 1)[1] for key in wanted} - set(wanted):
+                if ":" not in legacy:
+                    batch.delete(index.document(legacy))
+            batch.commit()
+        return written
+    
+    @staticmethod
+    def _remember(key, user_id):
+        with UserRepository._lock:
+            UserRepository._index_cache[key] = user_id
+    
+    @staticmethod
+    def _forget(key):
+        with UserRepository._lock:
+            UserRepository._index_cache.pop(key, None)
+
+
+class MediaRefRepository:
+    """
+    Số tham chiếu của file media lưu theo hash nội dung (media_refs/{đường dẫn})
+    File dùng chung giữa nhiều câu hỏi/đề chỉ bị xóa khi không còn tham chiếu nào.
+    Khi bỏ tham chiếu cuối, document chuyển sang trạng thái deleting (refs = 0) cho tới khi blob đã bị xóa
+    (finish_release); acquire gặp trạng thái này thì chờ xóa xong rồi để nơi gọi upload lại.
+    """
+    
+    DELETE_TIMEOUT = 30   # Giây: quá thời gian này vẫn deleting thì coi như lần xóa đã bị ngắt giữa chừng
+    WAIT_SECONDS = 0.2    # Khoảng chờ giữa các lần thử acquire khi file đang bị xóa
+    _BUSY = object()
+    
+    def __init__(self, db):
+        self.db = db
+        self.collection = "media_refs"
+    
+    @staticmethod
+    def doc_id(path):
+        # Document ID không được chứa "/"
+        return path.replace("/", "|")
+    
+    def _ref(self, path):
+        return self.db.collection(self.collection).document(self.doc_id(path))
+    
+    def get(self, path):
+        doc = self._ref(path).get()
+        return doc.to_dict() if doc.exists else None
+    
+    @staticmethod
+    def _stale(data):
+        deleting_at = data.get("deleting_at")
+        if not isinstance(deleting_at, datetime):
+            return True
+        return datetime.now(timezone.utc) - deleting_at > timedelta(seconds=MediaRefRepository.DELETE_TIMEOUT)
+    
+    def acquire(self, path, count=1):
+        """
+        Tăng số tham chiếu thêm `count` trong 1 transaction.
+        Trả về dữ liệu của file nếu đang được dùng; None nếu chưa có (document vừa được tạo với refs = count),
+        khi đó nơi gọi phải upload blob rồi ghi thông tin bằng describe().
+        File đang bị xóa (deleting) thì chờ lần xóa xong rồi coi như chưa có, để blob được upload lại
+        sau khi đã bị xóa chứ không trỏ câu hỏi vào blob sắp mất.
+        """
+        ref = self._ref(path)
+        
+        @firestore.transactional
+        def increment(transaction):
+            doc = ref.get(transaction=transaction)
+            data = doc.to_dict() if doc.exists else None
+            if data and data.get("deleting"):
+                if not self._stale(data):
+                    return self._BUSY
+                data = None  # Lần xóa trước bị ngắt giữa chừng: tạo lại từ đầu
+            if data is None:
+                transaction.set(ref, {"path": path, "refs": count, "updated_at": firestore.SERVER_TIMESTAMP})
+                return None
+            transaction.update(ref, {"refs": data.get("refs", 0) + count, "updated_at": firestore.SERVER_TIMESTAMP})
+            return data
+        
+        while True:
+            data = increment(self.db.transaction())
+            if data is not self._BUSY:
+                return data
+            time.sleep(self.WAIT_SECONDS)
+    
+    def describe(self, path, info):
+        """Ghi thông tin file sau khi upload xong: content_type, size, variants..."""
+        self._ref(path).update(dict(info) | {"updated_at": firestore.SERVER_TIMESTAMP})
+    
+    def retain(self, path, question_id):
+        """
+        Giữ tham chiếu của câu question_id thay vì bỏ (bài nộp của câu vẫn hiển thị file).
+        Bài nộp không bị xóa nên tham chiếu được giữ luôn; retained_for ghi lại các câu này
+        để có thể bỏ tham chiếu sau nếu bài nộp của câu bị xóa.
+        """
+        self._ref(path).update({
+            "retained_for": firestore.ArrayUnion([question_id]),
+            "updated_at": firestore.SERVER_TIMESTAMP,
+        })
+    
+    def release(self, path, count=1):
+        """
+        Giảm số tham chiếu đi `count` trong 1 transaction. Trả về dữ liệu của file nếu không còn ai dùng,
+        None nếu vẫn còn tham chiếu, file đang được xóa ở nơi khác hoặc file không được quản lý
+        (upload trước khi có media_refs).
+        Khi trả về dữ liệu, document đã chuyển sang deleting: nơi gọi xóa blob rồi gọi finish_release().
+        Trong lúc đó acquire đồng thời sẽ chờ, nên không có câu hỏi nào trỏ vào blob đang bị xóa.
+        """
+        # Mỗi lần gọi tạo hàm transactional mới: đối tượng này giữ trạng thái retry của 1 transaction
+        @firestore.transactional
+        def decrement(transaction, ref):
+            doc = ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            data = doc.to_dict()
+            if data.get("deleting"):
+                return None
+            refs = data.get("refs", 0) - count
+            if refs > 0:
+                transaction.update(ref, {"refs": refs, "updated_at": firestore.SERVER_TIMESTAMP})
+                return None
+            transaction.update(ref, {
+                "refs": 0, "deleting": True,
+                "deleting_at": firestore.SERVER_TIMESTAMP, "updated_at": firestore.SERVER_TIMESTAMP,
+            })
+            return data
+        
+        return decrement(self.db.transaction(), self._ref(path))
+    
+    def finish_release(self, path):
+        """Xóa document sau khi blob đã bị xóa (trừ khi acquire đã tạo lại vì lần xóa này quá hạn)"""
+        @firestore.transactional
+        def remove(transaction, ref):
+            doc = ref.get(transaction=transaction)
+            if doc.exists and doc.to_dict().get("deleting"):
+                transaction.delete(ref)
+        
+        remove(self.db.transaction(), self._ref(path))
+
+
+class ExamStatsRepository:
+    """
+    Thống kê gộp của từng đề: exam_stats/{môn}_{đề}/shards/{0..SHARDS-1}
+    Mỗi lần nộp/chấm bài cộng dồn (Increment) vào 1 shard ngẫu nhiên, trong cùng batch với bài nộp,
+    nên tổng quan của đề chỉ cần đọc SHARDS document thay vì quét toàn bộ submissions.
+    """
+    
+    SHARDS = 10
+    
+    def __init__(self, db):
+        self.db = db
+        self.collection = "exam_stats"
+    
+    @staticmethod
+    def doc_id(subject, set_number):
+        return f"{subject}_{set_number}"
+    
+    def _shards(self, subject, set_number):
+        return self.db.collection(self.collection)\
+            .document(self.doc_id(subject, set_number))\
+            .collection("shards")
+    
+    @staticmethod
+    def bucket(score):
+        """Nhóm điểm của histogram: phần nguyên của tổng điểm"""
+        return str(max(0, math.floor(score or 0)))
+    
+    @staticmethod
+    def contribution(submission, sign=1):
+        """Phần đóng góp của 1 bài nộp vào thống kê (sign=-1 để trừ ra)"""
+        score = float(submission.get("final_score") or 0)
+        return {
+            "count": sign,
+            "graded": sign if submission.get("status") == "graded" else 0,
+            "score_sum": sign * score,
+            "score_sq_sum": sign * score * score,
+            "hist": {ExamStatsRepository.bucket(score): sign},
+            # Câu đạt điểm tối đa
+            "correct": {
+                qid: sign for qid, ans in (submission.get("answers") or {}).items()
+                if ans.get("score", 0) >= ans.get("max_score", 1)
+            },
+        }
+    
+    @staticmethod
+    def _accumulate(target, data):
+        """Cộng dồn dict số (lồng nhau) data vào target"""
+        for key, value in data.items():
+            if isinstance(value, dict):
+                ExamStatsRepository._accumulate(target.setdefault(key, {}), value)
+            elif isinstance(value, (int, float)):
+                target[key] = target.get(key, 0) + value
+        return target
+    
+    @staticmethod
+    def _increments(delta):
+        """Đổi dict chênh lệch sang Increment, bỏ các giá trị 0"""
+        result = {}
+        for key, value in delta.items():
+            if isinstance(value, dict):
+                nested = ExamStatsRepository._increments(value)
+                if nested:
+                    result[key] = nested
+            elif value:
+                result[key] = firestore.Increment(value)
+        return result
+    
+    def record(self, batch, subject, set_number, old=None, new=None):
+        """
+        Thêm vào batch thao tác cập nhật thống kê khi bài nộp đổi từ old sang new
+        (old=None: bài mới nộp). Ghi cùng batch với bài nộp nên thống kê không lệch khi lỗi.
+        """
+        self.record_many(batch, subject, set_number, [(old, new)])
+    
+    def record_many(self, batch, subject, set_number, transitions):
+        """Như record() cho nhiều bài nộp (list (old, new)), gộp thành 1 lần ghi shard"""
+        delta = {}
+        for old, new in transitions:
+            if old:
+                self._accumulate(delta, self.contribution(old, -1))
+            if new:
+                self._accumulate(delta, self.contribution(new))
+        increments = self._increments(delta)
+        if not increments:
+            return
+        increments["updated_at"] = firestore.SERVER_TIMESTAMP
+        shard = self._shards(subject, set_number).document(str(random.randrange(self.SHARDS)))
+        batch.set(shard, increments, merge=True)
+    
+    def get(self, subject, set_number):
+        """
+        Gộp các shard. Trả về None nếu đề chưa có thống kê, ngược lại:
+        {"count", "graded", "score_sum", "score_sq_sum", "hist", "correct", "mean", "std"}
+        """
+        shards = list(self._shards(subject, set_number).stream())
+        if not shards:
+            return None
+        stats = {"count": 0, "graded": 0, "score_sum": 0.0, "score_sq_sum": 0.0, "hist": {}, "correct": {}}
+        for shard in shards:
+            data = shard.to_dict() or {}
+            data.pop("updated_at", None)
+            self._accumulate(stats, data)
+        for key in ("hist", "correct"):
+            stats[key] = {k: v for k, v in stats[key].items() if v}
+        count = stats["count"]
+        stats["mean"] = stats["score_sum"] / count if count else 0.0
+        stats["std"] = math.sqrt(max(0.0, stats["score_sq_sum"] / count - stats["mean"] ** 2)) if count else 0.0
+        return stats
+    
+    def rebuild(self, subject, set_number):
+        """
+        Tính lại thống kê từ toàn bộ bài nộp (cho dữ liệu cũ hoặc khi nghi ngờ lệch).
+        Ghi đè tất cả shard, trả về số bài nộp đã tính.
+        """
+        docs = self.db.collection("submissions")\
+            .where("subject", "==", subject)\
+            .where("set_number", "==", set_number)\
+            .select(["status", "final_score", "answers"])\
+            .stream()
+        totals = {}
+        for doc in docs:
+            self._accumulate(totals, self.contribution(doc.to_dict() or {}))
+        
+        batch = self.db.batch()
+        shards = self._shards(subject, set_number)
+        for i in range(self.SHARDS):
+            batch.delete(shards.document(str(i)))
+        if totals:
+            batch.set(shards.document("0"), totals | {"updated_at": firestore.SERVER_TIMESTAMP})
+        batch.commit()
+        return totals.get("count", 0)
+
+
 class SubmissionRepository:
     """Thao tác với bài thi"""
     
@@ -59,16 +625,190 @@ class SubmissionRepository:
         self.db = db
         self.collection = "submissions"
     
+    SUMMARY_FIELDS = ["student_id", "student_name", "status", "final_score", "submitted_at"]
+    
+    @staticmethod
+    def make_id(student_id, subject, set_number):
+        """ID cố định cho mỗi (học sinh, môn, mã đề) - mỗi HS chỉ có 1 bài/đề"""
+        raw = f"{student_id}|{subject}|{set_number}"
+        return f"{student_id}_{hashlib.sha1(raw.encode()).hexdigest()[:16]}"
+    
     def check_duplicate(self, student_id, subject, set_number):
-        """Kiểm tra đã nộp bài chưa"""
-        existing = self.db.collection(self.collection)\
-            .where("student_id", "==", student_id)\
+        """Kiểm tra đã nộp bài chưa (1 lần đọc document)"""
+        doc_id = self.make_id(student_id, subject, set_number)
+        return self.db.collection(self.collection).document(doc_id).get().exists
+    
+    def create(self, submission_data):
+        """
+        Tạo bài nộp mới với ID cố định, chỉ ghi khi chưa tồn tại (cùng batch với thống kê của đề).
+        Trả về False nếu học sinh đã nộp đề này trước đó.
+        """
+        doc_id = self.make_id(
+            submission_data["student_id"],
+            submission_data["subject"],
+            submission_data["set_number"]
+        )
+        batch = self.db.batch()
+        batch.create(self.db.collection(self.collection).document(doc_id), submission_data)
+        ExamStatsRepository(self.db).record(
+            batch, submission_data["subject"], submission_data["set_number"], new=submission_data
+        )
+        try:
+            batch.commit()
+        except AlreadyExists:
+            return False
+        return True
+    
+    def list_summaries(self, subject, set_number, status=None, page_size=20, start_after=None):
+        """
+        Lấy 1 trang bài nộp (chỉ các trường tóm tắt, không kèm answers).
+        Trả về (danh sách, cursor) - cursor dùng cho start_after của trang sau.
+        """
+        query = self.db.collection(self.collection)\
+            .where("subject", "==", subject)\
+            .where("set_number", "==", set_number)
+        
+        if status:
+            query = query.where("status", "==", status)
+        
+        query = query.order_by("submitted_at", direction=firestore.Query.DESCENDING)\
+            .select(self.SUMMARY_FIELDS)\
+            .limit(page_size)
+        
+        if start_after is not None:
+            query = query.start_after(start_after)
+        
+        docs = list(query.stream())
+        items = [d.to_dict() | {"id": d.id} for d in docs]
+        return items, (docs[-1] if docs else None)
+    
+    @staticmethod
+    def apply_changes(submission, changes):
+        """
+        Áp dụng changes {qid: {field: value}} lên bài nộp vừa đọc (câu bài nộp không có thì bỏ qua).
+        Trả về (update_data, bài nộp mới): final_score tính lại từ answers sau khi áp dụng,
+        không cộng dồn phần chênh lệch so với bản đã tải lúc mở trang.
+        """
+        answers = dict(submission.get("answers") or {})
+        update_data = {}
+        for qid, fields in changes.items():
+            if qid not in answers:
+                continue
+            answers[qid] = answers[qid] | fields
+            update_data.update({
+                FieldPath("answers", qid, field).to_api_repr(): value for field, value in fields.items()
+            })
+        final_score = total_score(answers)
+        update_data["final_score"] = final_score
+        return update_data, submission | {"final_score": final_score, "answers": answers}
+    
+    def save_grades(self, submission_id, changes):
+        """
+        Lưu kết quả chấm, chỉ ghi các trường giáo viên đã sửa.
+        changes: {qid: {"score": ..., "teacher_comment": ...}}
+        Đọc lại bài nộp và ghi trong 1 transaction: final_score và thống kê của đề tính từ bản vừa đọc,
+        nên chấm đồng thời (giáo viên khác, chấm theo câu hỏi, chấm lại) không làm lệch tổng điểm.
+        Trả về bài nộp sau khi cập nhật.
+        """
+        ref = self.db.collection(self.collection).document(submission_id)
+        stats = ExamStatsRepository(self.db)
+        
+        @firestore.transactional
+        def apply(transaction):
+            current = ref.get(transaction=transaction).to_dict()
+            update_data, graded = self.apply_changes(current, changes)
+            update_data["status"] = graded["status"] = "graded"
+            update_data["updated_at"] = firestore.SERVER_TIMESTAMP
+            transaction.update(ref, update_data)
+            stats.record(transaction, current["subject"], current["set_number"], old=current, new=graded)
+            return graded | {"id": submission_id}
+        
+        return apply(self.db.transaction())
+    
+    def list_answers(self, subject, set_number, question_id, page_size=50, start_after=None):
+        """
+        Lấy 1 trang câu trả lời của 1 câu hỏi trên các bài nộp của đề (không tải các câu khác).
+        Trả về (danh sách, cursor) như list_summaries.
+        """
+        fields = ["student_id", "student_name", "status", "final_score", "graded_qids",
+                  FieldPath("answers", question_id).to_api_repr()]
+        query = self.db.collection(self.collection)\
             .where("subject", "==", subject)\
             .where("set_number", "==", set_number)\
+            .order_by(FieldPath.document_id())\
+            .select(fields)\
+            .limit(page_size)
+        
+        if start_after is not None:
+            query = query.start_after(start_after)
+        
+        docs = list(query.stream())
+        items = [d.to_dict() | {"id": d.id} for d in docs]
+        return items, (docs[-1] if docs else None)
+    
+    def references_media(self, question_id, paths):
+        """Còn bài nộp nào của câu question_id đang hiển thị 1 trong các file `paths` (question_image) không"""
+        docs = self.db.collection(self.collection)\
+            .where(FieldPath("answers", question_id, "question_image").to_api_repr(), "in", list(paths))\
+            .select(["status"])\
             .limit(1)\
-            .get()
-        return len(existing) > 0
+            .stream()
+        return any(True for _ in docs)
     
-    def create(self, submission_data):
-        """Tạo bài nộp mới"""
-        return self.db.collection(self.collection).add(submission_data)
\ No newline at end of file
+    def save_question_grades(self, subject, set_number, question_id, grades, manual_qids):
+        """
+        Lưu điểm 1 câu hỏi cho nhiều bài nộp trong 1 transaction (kèm thống kê của đề).
+        grades: list (bài nộp đã tải bằng list_answers, fields), fields là các trường giáo viên đã sửa
+        ({"score": ..., "teacher_comment": ...}, rỗng nếu chỉ xác nhận điểm). Chỉ truyền các dòng đã sửa/xác nhận.
+        Câu được thêm vào graded_qids của các bài nộp này, bài nộp chuyển sang graded khi đã chấm đủ manual_qids.
+        Các bài nộp được đọc lại trong transaction, final_score tính lại từ answers vừa đọc;
+        bài nộp không có câu question_id bị bỏ qua.
+        Trả về list bài nộp sau khi cập nhật (để giao diện không phải tải lại).
+        """
+        collection = self.db.collection(self.collection)
+        wanted = {
+            submission["id"]: fields for submission, fields in grades
+            if (submission.get("answers") or {}).get(question_id)
+        }
+        if not wanted:
+            return []
+        stats = ExamStatsRepository(self.db)
+        
+        @firestore.transactional
+        def apply(transaction):
+            docs = self.db.get_all([collection.document(sub_id) for sub_id in wanted], transaction=transaction)
+            transitions, updated = [], []
+            for doc in docs:
+                current = doc.to_dict() if doc.exists else None
+                if not current or question_id not in (current.get("answers") or {}):
+                    # Bài nộp không có câu này: không tạo câu trả lời rỗng, không đổi trạng thái
+                    continue
+                update_data, new = self.apply_changes(current, {question_id: wanted[doc.id]})
+                graded_qids = set(current.get("graded_qids") or []) | {question_id}
+                new["graded_qids"] = sorted(graded_qids)
+                update_data["graded_qids"] = firestore.ArrayUnion([question_id])
+                if set(manual_qids) <= graded_qids:
+                    update_data["status"] = new["status"] = "graded"
+                update_data["updated_at"] = firestore.SERVER_TIMESTAMP
+                transaction.update(doc.reference, update_data)
+                transitions.append((current, new))
+                updated.append(new | {"id": doc.id})
+            stats.record_many(transaction, subject, set_number, transitions)
+            return updated
+        
+        return apply(self.db.transaction())
+    
+    def list_by_student(self, student_id, updated_after=None):
+        """Lấy bài nộp của 1 học sinh; nếu có updated_after thì chỉ lấy phần thay đổi"""
+        query = self.db.collection(self.collection)\
+            .where("student_id", "==", student_id)
+        
+        if updated_after is not None:
+            query = query.where("updated_at", ">", updated_after)
+        
+        return [d.to_dict() | {"id": d.id} for d in query.stream()]
+    
+    def get(self, submission_id):
+        """Lấy toàn bộ 1 bài nộp (kèm answers)"""
+        doc = self.db.collection(self.collection).document(submission_id).get()
+        return doc.to_dict() | {"id": doc.id} if doc.exists else None
@@ -0,0 +1,183 @@
+"""
+Chấm lại hàng loạt khi đáp án (hoặc điểm tối đa / điểm một phần) của câu trắc nghiệm/nghe thay đổi
+
+Tiến độ của mỗi câu lưu ở regrade_jobs/{question_id} và được ghi trong cùng transaction với các bài nộp,
+nên job bị ngắt giữa chừng chạy tiếp đúng từ chỗ dừng; chạy lại cũng không cộng điểm 2 lần.
+Job chạy ở thread nền để không chặn phiên Streamlit của giáo viên.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from models import ExamStatsRepository, SubmissionRepository
+from scoring import AnswerKey, CHOICE_TYPES, question_max_score
+
+
+class RegradeJob:
+    """Duyệt bài nộp của đề theo document ID, chỉ cập nhật câu có điểm/đáp án khác đi"""
+
+    PAGE_SIZE = 100  # Mỗi transaction: đọc lại và ghi tối đa 100 bài nộp + 1 shard thống kê + 1 tiến độ
+
+    _pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="regrade")
+    _futures = {}  # question_id -> future của job đang chạy trong process này
+    _lock = threading.Lock()
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = "regrade_jobs"
+        self.stats = ExamStatsRepository(db)
+
+    def _ref(self, question_id):
+        return self.db.collection(self.collection).document(question_id)
+
+    def get(self, question_id):
+        doc = self._ref(question_id).get()
+        return doc.to_dict() | {"id": doc.id} if doc.exists else None
+
+    def start(self, question):
+        """Tạo (hoặc khởi động lại từ đầu) job chấm lại câu hỏi theo đáp án/thang điểm hiện tại"""
+        self._ref(question["id"]).set({
+            "question_id": question["id"],
+            "subject": question["subject"],
+            "set_number": question["set_number"],
+            "type": question.get("type"),
+            "correct_answer": question.get("correct_answer"),
+            "max_score": question_max_score(question),
+            "partial_credit": question.get("partial_credit") or {},
+            "status": "running",
+            "last_id": None,
+            "processed": 0,
+            "changed": 0,
+            "total": (self.stats.get(question["subject"], question["set_number"]) or {}).get("count", 0),
+            "started_at": firestore.SERVER_TIMESTAMP,
+            "updated_at": firestore.SERVER_TIMESTAMP,
+        })
+        return self.get(question["id"])
+
+    def list_running(self, subject, set_number):
+        """Các job chưa chạy xong của 1 đề (bị ngắt giữa chừng)"""
+        docs = self.db.collection(self.collection)\
+            .where("subject", "==", subject)\
+            .where("set_number", "==", set_number)\
+            .where("status", "==", "running")\
+            .stream()
+        return [d.to_dict() | {"id": d.id} for d in docs]
+
+    @staticmethod
+    def key_of(job):
+        """Phần dữ liệu quyết định điểm (so sánh để biết job có bị khởi động lại với đáp án khác)"""
+        return (job.get("correct_answer"), job.get("max_score"), job.get("partial_credit"))
+
+    @staticmethod
+    def regrade_answer(ans, answer_key, question_id, score):
+        """
+        Các trường cần đổi của 1 câu trả lời theo đáp án mới ({} nếu không có gì thay đổi).
+        score: điểm mới của lựa chọn (đã chấm cả trang bằng AnswerKey.score_batch).
+        """
+        expected = {
+            "correct_choice": answer_key.correct[0],
+            "max_score": answer_key.max_score(question_id),
+            "score": score,
+        }
+        return {field: value for field, value in expected.items() if ans.get(field) != value}
+
+    def run_in_background(self, question_id):
+        """
+        Chạy (tiếp) job ở thread nền, không chặn phiên Streamlit.
+        Nếu lần chạy trước của câu này chưa dừng thì 2 lần chạy cùng đọc 1 trang: transaction của lần
+        ghi sau thấy last_id đã đổi và dừng, nên không trang nào bị chấm 2 lần.
+        """
+        with RegradeJob._lock:
+            RegradeJob._futures[question_id] = RegradeJob._pool.submit(self.run, question_id)
+
+    @staticmethod
+    def is_active(question_id):
+        """Job của câu đang chạy ở thread nền của process này"""
+        with RegradeJob._lock:
+            future = RegradeJob._futures.get(question_id)
+            if future is not None and future.done():
+                del RegradeJob._futures[question_id]
+                future = None
+        return future is not None
+
+    def run(self, question_id):
+        """
+        Chạy (tiếp) job tới khi hết bài nộp, trả về dữ liệu job.
+        Dừng sớm nếu job bị khởi động lại với đáp án khác (ở phiên khác).
+        """
+        job = self.get(question_id)
+        if not job or job["status"] != "running":
+            return job
+
+        subject, set_number = job["subject"], job["set_number"]
+        answer_key = AnswerKey.compile([job | {"id": question_id, "type": job.get("type") or CHOICE_TYPES[0]}])
+        submissions = self.db.collection("submissions")
+        document_id = FieldPath.document_id()
+        last_id = job.get("last_id")
+
+        while True:
+            # Chỉ lấy ID của trang tiếp theo, nội dung bài nộp được đọc lại trong transaction
+            query = submissions\
+                .where("subject", "==", subject)\
+                .where("set_number", "==", set_number)
+            if last_id:
+                query = query.where(document_id, ">", submissions.document(last_id))
+            docs = query.order_by(document_id).select(["status"]).limit(self.PAGE_SIZE).stream()
+            refs = [doc.reference for doc in docs]
+            # Hết bài nộp (job xong) hoặc job đã bị khởi động lại ở phiên khác
+            if not self._apply_page(job, last_id, refs, answer_key) or not refs:
+                return self.get(question_id)
+            last_id = refs[-1].id
+
+    def _apply_page(self, job, last_id, refs, answer_key):
+        """
+        Chấm lại 1 trang bài nộp trong 1 transaction: đọc lại bài nộp, ghi điểm mới và final_score tính lại
+        từ answers vừa đọc (không cộng phần chênh lệch), cùng thống kê và tiến độ. Trang rỗng: đánh dấu xong.
+        Trả về False nếu job không còn ở đúng trạng thái lúc đọc trang (bị khởi động lại ở phiên khác).
+        """
+        question_id = job["question_id"]
+        job_ref = self._ref(question_id)
+
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = job_ref.get(transaction=transaction)
+            current = snapshot.to_dict() if snapshot.exists else None
+            if not current or current["status"] != "running" or self.key_of(current) != self.key_of(job) \
+                    or current.get("last_id") != last_id:
+                return False
+            if not refs:
+                transaction.update(job_ref, {
+                    "status": "done", "finished_at": firestore.SERVER_TIMESTAMP,
+                    "updated_at": firestore.SERVER_TIMESTAMP
+                })
+                return True
+
+            # Chấm cả trang 1 lần trên mảng [bài nộp x 1 câu]
+            rows = []
+            for doc in self.db.get_all(refs, transaction=transaction):
+                data = doc.to_dict() if doc.exists else None
+                ans = ((data or {}).get("answers") or {}).get(question_id)
+                if ans and ans.get("type") in CHOICE_TYPES:
+                    rows.append((doc, data, ans))
+            scores, _ = answer_key.score_batch([{question_id: ans.get("student_choice")} for _, _, ans in rows])
+
+            transitions = []
+            for (doc, data, ans), score in zip(rows, scores[:, 0].tolist()):
+                changes = self.regrade_answer(ans, answer_key, question_id, score)
+                if not changes:
+                    continue
+                update_data, regraded = SubmissionRepository.apply_changes(data, {question_id: changes})
+                update_data["updated_at"] = firestore.SERVER_TIMESTAMP
+                transaction.update(doc.reference, update_data)
+                transitions.append((data, regraded))
+
+            self.stats.record_many(transaction, job["subject"], job["set_number"], transitions)
+            transaction.update(job_ref, {
+                "last_id": refs[-1].id,
+                "processed": current.get("processed", 0) + len(refs),
+                "changed": current.get("changed", 0) + len(transitions),
+                "updated_at": firestore.SERVER_TIMESTAMP,
+            })
+            return True
+
+        return apply(self.db.transaction())
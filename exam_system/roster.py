@@ -0,0 +1,190 @@
+"""
+Tạo tài khoản học sinh hàng loạt từ danh sách lớp (CSV)
+"""
+import hashlib
+import io
+import re
+import secrets
+import string
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from models import UserRepository
+from utils import InputValidator
+
+STUDENT_ID_RE = re.compile(r"^HS\d{3,6}$")
+COLUMNS = ["student_id", "username", "full_name", "class", "password", "email"]
+PASSWORD_ALPHABET = string.ascii_letters + string.digits
+
+
+class RosterImporter:
+    """Kiểm tra danh sách, cấp mã HS, băm mật khẩu song song rồi ghi theo batch"""
+
+    HASH_WORKERS = 8
+    PASSWORD_LENGTH = 8
+
+    def __init__(self, db):
+        self.users = UserRepository(db)
+
+    @staticmethod
+    def read_rows(file_obj):
+        """Đọc CSV, trả về list (số dòng trong file, dict cột -> giá trị)"""
+        try:
+            df = pd.read_csv(io.BytesIO(file_obj.getvalue()), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+            raise ValueError(f"File CSV lỗi: {e}") from e
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        if "full_name" not in df.columns:
+            raise ValueError("Thiếu cột full_name")
+        return [(i + 2, row) for i, row in enumerate(df.to_dict("records"))]
+
+    @staticmethod
+    def hash_password(password):
+        # Cùng cách băm với form tạo tài khoản và đăng nhập
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    @staticmethod
+    def _generate_password():
+        return "".join(secrets.choice(PASSWORD_ALPHABET) for _ in range(RosterImporter.PASSWORD_LENGTH))
+
+    def run(self, rows, default_class="", digits=4, start_number=1, dry_run=False):
+        """
+        Trả về báo cáo:
+        {"total", "valid", "created", "errors": [{"row", "error"}],
+         "credentials": [{"student_id", "username", "full_name", "class", "password"}]}
+        Mật khẩu chỉ có trong credentials khi được tạo tự động (để phát cho học sinh).
+        """
+        report = {"total": len(rows), "valid": 0, "created": 0, "errors": [], "credentials": []}
+        accounts, seen_ids, seen_usernames = [], set(), set()
+
+        # 1. Kiểm tra từng dòng và trùng lặp trong file
+        for row_no, row in rows:
+            errors = []
+            full_name = InputValidator.sanitize(str(row.get("full_name", "")), 100)
+            if not full_name:
+                errors.append("Thiếu họ tên")
+
+            student_id = str(row.get("student_id", "")).strip().upper()
+            if student_id:
+                if not STUDENT_ID_RE.match(student_id):
+                    errors.append(f"Mã '{student_id}' không đúng dạng HS + 3-6 chữ số")
+                elif student_id in seen_ids:
+                    errors.append(f"Mã '{student_id}' bị lặp trong file")
+
+            # Tên đăng nhập mặc định = mã viết thường
+            username = str(row.get("username", "")).strip().lower() or student_id.lower()
+            if username:
+                if not UserRepository.index_key(username, "student") or InputValidator.sanitize(username) != username:
+                    errors.append(f"Tên đăng nhập '{username}' không hợp lệ")
+                elif username in seen_usernames:
+                    errors.append(f"Tên đăng nhập '{username}' bị lặp trong file")
+
+            if errors:
+                report["errors"].append({"row": row_no, "error": "; ".join(errors)})
+                continue
+            if student_id:
+                seen_ids.add(student_id)
+            if username:
+                seen_usernames.add(username)
+
+            password = str(row.get("password", "")).strip()
+            accounts.append({
+                "row": row_no, "student_id": student_id, "username": username,
+                "full_name": full_name,
+                "class": InputValidator.sanitize(str(row.get("class", "")), 20) or default_class,
+                "email": str(row.get("email", "")).strip(),
+                "password": password or self._generate_password(),
+                "generated": not password,
+            })
+
+        # 2. Trùng với tài khoản đã có (đọc theo lô, không dừng cả danh sách)
+        taken_ids = self.users.existing_ids([a["student_id"] for a in accounts if a["student_id"]])
+        taken_usernames = self.users.taken_usernames([a["username"] for a in accounts if a["username"]], "student")
+        kept = []
+        for account in accounts:
+            conflicts = []
+            if account["student_id"] in taken_ids:
+                conflicts.append(f"Mã '{account['student_id']}' đã tồn tại")
+            if account["username"] and account["username"] in taken_usernames:
+                conflicts.append(f"Tên đăng nhập '{account['username']}' đã được dùng")
+            if conflicts:
+                report["errors"].append({"row": account["row"], "error": "; ".join(conflicts)})
+            else:
+                kept.append(account)
+        accounts = kept
+
+        # 3. Cấp mã cho dòng chưa có
+        missing = [a for a in accounts if not a["student_id"]]
+        if missing:
+            generated = self._allocate_ids(len(missing), digits, start_number, seen_ids, seen_usernames)
+            for account, student_id in zip(missing, generated):
+                account["student_id"] = student_id
+                account["username"] = account["username"] or student_id.lower()
+            for account in missing[len(generated):]:
+                report["errors"].append({"row": account["row"], "error": f"Hết mã trống với {digits} chữ số"})
+            accounts = [a for a in accounts if a["student_id"]]
+
+        report["valid"] = len(accounts)
+        if dry_run or not accounts:
+            report["errors"].sort(key=lambda e: e["row"])
+            return report
+
+        # 4. Băm mật khẩu song song rồi ghi theo batch
+        with ThreadPoolExecutor(max_workers=self.HASH_WORKERS) as pool:
+            hashes = list(pool.map(self.hash_password, [a["password"] for a in accounts]))
+
+        users = []
+        for account, password_hash in zip(accounts, hashes):
+            users.append((account["student_id"], {
+                "username": account["username"],
+                "password_hash": password_hash,
+                "role": "student",
+                "full_name": account["full_name"],
+                "email": account["email"] or f"{account['username']}@school.edu.vn",
+                "is_active": True,
+                "metadata": {"class": account["class"]},
+            }))
+        created, write_errors = self.users.create_many(users)
+        created = set(created)
+        report["created"] = len(created)
+
+        for account in accounts:
+            if account["student_id"] in write_errors:
+                report["errors"].append({"row": account["row"], "error": write_errors[account["student_id"]]})
+            elif account["student_id"] in created:
+                report["credentials"].append({
+                    "student_id": account["student_id"], "username": account["username"],
+                    "full_name": account["full_name"], "class": account["class"],
+                    "password": account["password"] if account["generated"] else "",
+                })
+        report["errors"].sort(key=lambda e: e["row"])
+        return report
+
+    def _allocate_ids(self, count, digits, start_number, reserved_ids, reserved_usernames, chunk_size=500):
+        """Lấy `count` mã HS trống đầu tiên từ start_number (kiểm tra cả mã và username mặc định)"""
+        allocated = []
+        number = max(1, start_number)
+        limit = 10 ** digits
+        while len(allocated) < count and number < limit:
+            end = min(limit, number + max(chunk_size, count - len(allocated)))
+            candidates = [f"HS{n:0{digits}d}" for n in range(number, end)]
+            candidates = [c for c in candidates if c not in reserved_ids and c.lower() not in reserved_usernames]
+            taken = self.users.existing_ids(candidates)
+            taken_usernames = self.users.taken_usernames([c.lower() for c in candidates], "student")
+            taken |= {c for c in candidates if c.lower() in taken_usernames}
+            for candidate in candidates:
+                if candidate not in taken:
+                    allocated.append(candidate)
+                    if len(allocated) == count:
+                        break
+            number = end
+        return allocated
+
+    @staticmethod
+    def template_csv():
+        sample = pd.DataFrame([
+            {"student_id": "HS0001", "username": "nguyenvana", "full_name": "Nguyễn Văn A",
+             "class": "4A", "password": "", "email": ""},
+            {"student_id": "", "username": "", "full_name": "Trần Thị B",
+             "class": "4A", "password": "matkhau123", "email": ""},
+        ], columns=COLUMNS)
+        return sample.to_csv(index=False).encode("utf-8-sig")
@@ -0,0 +1,147 @@
+"""
+Chấm điểm tự động, không phụ thuộc Streamlit (dùng chung cho nộp bài, chấm bài và chấm lại)
+
+Đáp án của một đề được biên dịch 1 lần (AnswerKey) thành bảng điểm theo mã lựa chọn:
+chấm 1 bài là tra dict; chấm cả lô thì đổi lựa chọn sang mã [bài nộp x câu] rồi lấy chỉ số trên bảng điểm.
+Với lô lớn, phần tốn thời gian là đọc dict lựa chọn của từng bài (đối tượng Python), không phải phép tính điểm.
+Mỗi câu có điểm tối đa riêng (max_score) và có thể cho điểm một phần theo lựa chọn (partial_credit).
+"""
+import math
+import numpy as np
+import pandas as pd
+
+CHOICE_TYPES = ["Trắc nghiệm (MC)", "Nghe (Listening)"]  # Chấm tự động theo đáp án
+MANUAL_TYPES = ["Nói (Speaking)", "Tự luận (Essay)"]  # Giáo viên chấm
+QUESTION_TYPES = CHOICE_TYPES + MANUAL_TYPES
+DEFAULT_MAX_SCORE = 1.0
+NO_CHOICE = 0  # Mã cho lựa chọn trống/không có trong đáp án (0 điểm)
+
+
+def parse_partial_credit(text):
+    """
+    'B=0.5, C=0.25' -> {"B": 0.5, "C": 0.25} (tỉ lệ so với điểm tối đa của câu).
+    ValueError nếu sai dạng hoặc tỉ lệ không nằm trong (0, 1).
+    """
+    result = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        option, sep, ratio = part.rpartition("=")
+        option = option.strip()
+        try:
+            ratio = float(ratio)
+        except ValueError:
+            ratio = None
+        if not sep or not option or ratio is None or not 0 < ratio < 1:
+            raise ValueError(f"Điểm một phần '{part.strip()}' không đúng dạng lựa_chọn=tỉ_lệ (0 < tỉ lệ < 1)")
+        result[option] = ratio
+    return result
+
+
+def format_partial_credit(partial_credit):
+    """Ngược lại của parse_partial_credit (để hiện trong ô nhập)"""
+    return ", ".join(f"{option}={ratio:g}" for option, ratio in (partial_credit or {}).items())
+
+
+def question_max_score(question):
+    """Điểm tối đa của câu (câu cũ chưa có trường max_score tính 1 điểm)"""
+    value = question.get("max_score")
+    return float(value) if value and value > 0 else DEFAULT_MAX_SCORE
+
+
+def total_score(answers, overrides=None):
+    """
+    Tổng điểm của answers ({qid: {"score": ...}}).
+    overrides: {qid: {"score": ...}} - điểm đang chấm, thay cho điểm đã lưu.
+    Cộng bằng fsum và làm tròn để không lệch kiểu 0.1 + 0.2.
+    """
+    overrides = overrides or {}
+    return round(math.fsum(
+        float((overrides.get(qid) or ans).get("score") or 0) for qid, ans in answers.items()
+    ), 4)
+
+
+class AnswerKey:
+    """
+    Đáp án đã biên dịch của một đề:
+    - qids, types, max_scores (float [k])
+    - points: {qid: {lựa chọn: điểm}} để chấm từng bài
+    - codes: {qid: {lựa chọn: mã}} và table float [k, số mã]: table[j, mã] = điểm, để chấm cả lô
+    """
+
+    def __init__(self, qids, types, max_scores, correct, points, codes, table):
+        self.qids = qids
+        self.types = types
+        self.max_scores = max_scores
+        self.correct = correct
+        self.points = points
+        self.codes = codes
+        self.table = table
+        self._index = {qid: j for j, qid in enumerate(qids)}
+        self._choice_items = list(points.items())
+
+    @staticmethod
+    def compile(questions):
+        """Biên dịch từ list câu hỏi (dict có 'id', 'type', 'correct_answer', 'max_score', 'partial_credit')"""
+        qids, types, max_scores, correct, points, codes = [], [], [], [], {}, {}
+        for q in questions:
+            qid = q["id"]
+            max_score = question_max_score(q)
+            qids.append(qid)
+            types.append(q.get("type"))
+            max_scores.append(max_score)
+            correct.append(q.get("correct_answer"))
+            if q.get("type") not in CHOICE_TYPES:
+                continue
+            scores = {option: max_score * ratio for option, ratio in (q.get("partial_credit") or {}).items()}
+            if q.get("correct_answer") is not None:
+                scores[q["correct_answer"]] = max_score
+            points[qid] = scores
+            codes[qid] = {option: code for code, option in enumerate(scores, start=NO_CHOICE + 1)}
+
+        width = 1 + max((len(c) for c in codes.values()), default=0)
+        table = np.zeros((len(qids), width))
+        for j, qid in enumerate(qids):
+            for option, code in codes.get(qid, {}).items():
+                table[j, code] = points[qid][option]
+        return AnswerKey(qids, types, np.array(max_scores), correct, points, codes, table)
+
+    @property
+    def total_max(self):
+        return float(self.max_scores.sum())
+
+    def max_score(self, qid):
+        return float(self.max_scores[self._index[qid]])
+
+    def score_choice(self, qid, choice):
+        """Điểm của 1 lựa chọn (câu không phải trắc nghiệm/nghe: 0, chờ giáo viên chấm)"""
+        return self.points.get(qid, {}).get(choice, 0.0)
+
+    def score(self, choices):
+        """Chấm 1 bài: choices {qid: lựa chọn} -> ({qid: điểm} của các câu trắc nghiệm/nghe, tổng)"""
+        scores = {qid: points.get(choices.get(qid), 0.0) for qid, points in self._choice_items}
+        return scores, round(math.fsum(scores.values()), 4)
+
+    def encode(self, choices_list):
+        """
+        list {qid: lựa chọn} -> mã int32 [n, k] (NO_CHOICE nếu bỏ trống / không được điểm).
+        Đọc dict của các bài 1 lượt (DataFrame.from_records) rồi đổi lựa chọn sang mã theo từng cột.
+        """
+        encoded = np.full((len(choices_list), len(self.qids)), NO_CHOICE, dtype=np.int32)
+        if not choices_list or not self.codes:
+            return encoded
+        frame = pd.DataFrame.from_records(choices_list, columns=list(self.codes))
+        for qid, codes in self.codes.items():
+            # Mã = vị trí trong thứ tự lựa chọn + 1; lựa chọn trống/không có trong đáp án: -1 + 1 = NO_CHOICE
+            categories = pd.Categorical(frame[qid], categories=list(codes))
+            encoded[:, self._index[qid]] = categories.codes + 1
+        return encoded
+
+    def score_codes(self, encoded):
+        """Mã [n, k] -> điểm [n, k]: 1 phép lấy chỉ số trên bảng điểm"""
+        return self.table[np.arange(len(self.qids)), encoded]
+
+    def score_batch(self, choices_list):
+        """Chấm cả lô: list {qid: lựa chọn} -> (điểm float [n, k], tổng float [n])"""
+        scores = self.score_codes(self.encode(choices_list))
+        return scores, scores.sum(axis=1).round(4)
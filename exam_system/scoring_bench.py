@@ -0,0 +1,106 @@
+"""
+Micro-benchmark bộ chấm điểm (scoring.AnswerKey) so với cách chấm cũ trong form nộp bài
+
+Đo: biên dịch đáp án, chấm 1 bài (đường nộp bài), chấm cả lô (đường chấm lại / thống kê).
+Cách cũ được đo với cùng quy tắc điểm (điểm tối đa riêng, điểm một phần) và kết quả được đối chiếu.
+Chấm cả lô in riêng phần mã hóa (đọc dict lựa chọn của từng bài) và phần tra bảng điểm.
+
+Ví dụ:
+    cd exam_system
+    python scoring_bench.py --questions 40 --submissions 100000
+"""
+import argparse
+import random
+import time
+import timeit
+
+import numpy as np
+from scoring import AnswerKey, CHOICE_TYPES, question_max_score
+
+OPTIONS = ["A", "B", "C", "D"]
+
+
+def make_questions(count, essays=2, seed=0):
+    rng = random.Random(seed)
+    questions = []
+    for j in range(count):
+        q = {"id": f"q{j:03d}", "type": rng.choice(CHOICE_TYPES), "options": OPTIONS,
+             "correct_answer": rng.choice(OPTIONS), "max_score": rng.choice([0.5, 1.0, 2.0])}
+        if j % 5 == 0:
+            q["partial_credit"] = {next(o for o in OPTIONS if o != q["correct_answer"]): 0.5}
+        questions.append(q)
+    for j in range(count, count + essays):
+        questions.append({"id": f"q{j:03d}", "type": "Tự luận (Essay)", "max_score": 2.0})
+    return questions
+
+
+def make_submissions(questions, count, seed=1):
+    rng = random.Random(seed)
+    choice_qids = [q["id"] for q in questions if q["type"] in CHOICE_TYPES]
+    return [{qid: rng.choice(OPTIONS) for qid in choice_qids} for _ in range(count)]
+
+
+def score_inline(questions, user_answers):
+    """
+    Cách chấm cũ (duyệt câu hỏi, so sánh chuỗi, cộng dồn float) với cùng quy tắc điểm như AnswerKey:
+    đúng được điểm tối đa của câu, lựa chọn có điểm một phần được điểm tối đa x tỉ lệ
+    """
+    total_score = 0.0
+    for q in questions:
+        if q.get("type") in CHOICE_TYPES:
+            choice = user_answers.get(q["id"])
+            max_score = question_max_score(q)
+            if choice == q.get("correct_answer"):
+                total_score += max_score
+            else:
+                total_score += max_score * (q.get("partial_credit") or {}).get(choice, 0)
+    return round(total_score, 4)
+
+
+def _per_call(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bộ chấm điểm")
+    parser.add_argument("--questions", type=int, default=40, help="Số câu trắc nghiệm/nghe")
+    parser.add_argument("--submissions", type=int, default=100000, help="Số bài cho phép đo chấm cả lô")
+    args = parser.parse_args()
+
+    questions = make_questions(args.questions)
+    submissions = make_submissions(questions, args.submissions)
+    key = AnswerKey.compile(questions)
+    one = submissions[0]
+
+    compile_us = _per_call(lambda: AnswerKey.compile(questions), 1000) * 1e6
+    inline_us = _per_call(lambda: score_inline(questions, one), 10000) * 1e6
+    single_us = _per_call(lambda: key.score(one), 10000) * 1e6
+    print(f"Biên dịch đáp án ({len(questions)} câu): {compile_us:.1f} µs")
+    print(f"Chấm 1 bài - cách cũ: {inline_us:.1f} µs | AnswerKey.score: {single_us:.1f} µs")
+
+    start = time.perf_counter()
+    loop_totals = [score_inline(questions, choices) for choices in submissions]
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded = key.encode(submissions)
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    key.score_codes(encoded).sum(axis=1)
+    codes_s = time.perf_counter() - start
+    start = time.perf_counter()
+    _, totals = key.score_batch(submissions)
+    batch_s = time.perf_counter() - start
+
+    assert np.allclose(totals, loop_totals), "score_batch lệch với cách chấm cũ"
+
+    print(f"Chấm {len(submissions)} bài - vòng lặp cũ: {loop_s:.2f}s | score_batch: {batch_s:.2f}s "
+          f"(mã hóa {encode_s:.2f}s + tra bảng {codes_s * 1000:.1f}ms)")
+    # Phần tra bảng đã là phép tính mảng; thời gian còn lại gần như toàn bộ là đọc dict của từng bài
+    print(f"Tra bảng trên mã có sẵn nhanh hơn vòng lặp cũ {loop_s / codes_s:.0f} lần, "
+          f"score_batch tính cả mã hóa nhanh hơn {loop_s / batch_s:.1f} lần")
+    print(f"Điểm TB: {totals.mean():.3f} / {key.total_max:g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Đo đếm RPC tới Firestore/Storage theo từng lần rerun và từng session
+
+Bật bằng biến môi trường KIWI_TRACE=1. Khi bật, get_db()/get_storage() trả về
+client được bọc: mỗi lần đọc/ghi/ký URL được ghi lại (collection, thao tác,
+số document, độ trễ) vào bộ nhớ và vào logs/rpc_trace.jsonl để trang debug đọc.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from config import LOG_DIR
+from log_setup import file_logger
+
+TRACE_FILE = os.path.join(LOG_DIR, "rpc_trace.jsonl")
+MAX_RECORDS = 20000
+
+# Phương thức chỉ dựng query/reference (không gọi mạng) -> trả về proxy mới
+_CHAIN_METHODS = {
+    "collection", "document", "where", "order_by", "select", "limit", "limit_to_last",
+    "offset", "start_at", "start_after", "end_at", "end_before", "batch", "blob",
+}
+# Phương thức gọi RPC thật -> được đo thời gian và ghi lại
+_FIRESTORE_RPCS = {"get", "stream", "add", "set", "create", "update", "delete", "get_all", "commit"}
+_STORAGE_RPCS = {
+    "upload_from_string", "download_as_bytes", "exists", "delete",
+    "generate_signed_url", "list_blobs", "get_blob",
+}
+_WRITE_OPS = {"add", "set", "create", "update", "delete", "commit"}
+
+_records = deque(maxlen=MAX_RECORDS)
+_reruns = {}
+_lock = threading.Lock()
+
+
+def _session_id():
+    """ID session Streamlit của thread hiện tại ("background" nếu chạy ở thread nền)"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+    return ctx.session_id if ctx else "background"
+
+
+def begin_rerun():
+    """Gọi ở đầu script để đánh số lần rerun của session"""
+    session = _session_id()
+    with _lock:
+        _reruns[session] = _reruns.get(session, 0) + 1
+
+
+def record(kind, collection, op, docs, latency_ms, error=None):
+    """Ghi lại 1 RPC"""
+    session = _session_id()
+    with _lock:
+        entry = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "session": session,
+            "rerun": _reruns.get(session, 0),
+            "kind": kind,
+            "collection": collection,
+            "op": op,
+            "docs": docs,
+            "latency_ms": round(latency_ms, 2),
+            "write": op in _WRITE_OPS,
+            "error": error,
+        }
+        _records.append(entry)
+    # Ghi file ở thread nền của logging, không chặn rerun
+    file_logger("rpc_trace", TRACE_FILE).info(json.dumps(entry, ensure_ascii=False))
+
+
+def recent_records():
+    """Các RPC đã ghi trong process hiện tại"""
+    with _lock:
+        return list(_records)
+
+
+def load_records(path=TRACE_FILE, limit=MAX_RECORDS):
+    """Đọc các RPC gần nhất từ file (dùng được từ process khác, vd. trang debug)"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = deque(f, maxlen=limit)
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def _unwrap(value):
+    if isinstance(value, _Traced):
+        return value._target
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(v) for v in value)
+    return value
+
+
+def _count_docs(op, result):
+    if op in ("stream", "get_all", "list_blobs") or isinstance(result, list):
+        return len(result)
+    if op == "get":
+        return 1
+    if op == "commit":
+        return len(result) if isinstance(result, list) else None
+    return None
+
+
+class _Traced:
+    """Proxy bọc client/query/reference/blob, ghi lại các RPC đi qua nó"""
+
+    def __init__(self, target, kind, collection=None):
+        self._target = target
+        self._kind = kind
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        rpcs = _FIRESTORE_RPCS if self._kind == "firestore" else _STORAGE_RPCS
+        if self._collection == "(batch)" and name != "commit":
+            # set/update/delete của batch chỉ xếp hàng, RPC xảy ra khi commit
+            return lambda *args, **kwargs: attr(*_unwrap(args), **{k: _unwrap(v) for k, v in kwargs.items()})
+        if name not in _CHAIN_METHODS and name not in rpcs:
+            return attr
+
+        def call(*args, **kwargs):
+            args = _unwrap(args)
+            kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+
+            if name in _CHAIN_METHODS:
+                return _Traced(attr(*args, **kwargs), self._kind, self._child_collection(name, args))
+
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+                if name in ("stream", "get_all", "list_blobs"):
+                    result = list(result)
+            except Exception as e:
+                record(self._kind, self._collection, name, None,
+                       (time.perf_counter() - start) * 1000, error=type(e).__name__)
+                raise
+            record(self._kind, self._collection, name, _count_docs(name, result),
+                   (time.perf_counter() - start) * 1000)
+
+            if name == "add" and isinstance(result, tuple):
+                return result[0], _Traced(result[1], self._kind, self._collection)
+            return iter(result) if name == "stream" else result
+
+        return call
+
+    def _child_collection(self, name, args):
+        if name == "collection" and args:
+            return f"{self._collection}/{args[0]}" if self._collection else args[0]
+        if name == "blob" and args:
+            return str(args[0]).rsplit("/", 1)[0] if "/" in str(args[0]) else ""
+        if name == "batch":
+            return "(batch)"
+        return self._collection
+
+    def __repr__(self):
+        return f"Traced({self._target!r})"
+
+
+def wrap_db(db):
+    """Bọc Firestore client"""
+    return db if isinstance(db, _Traced) else _Traced(db, "firestore")
+
+
+def wrap_storage(bucket):
+    """Bọc Storage bucket"""
+    return bucket if isinstance(bucket, _Traced) else _Traced(bucket, "storage")
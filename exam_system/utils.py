@@ -3,9 +3,52 @@ Các hàm tiện ích: Upload file, validate input
 """
 import streamlit as st
 import re
-import uuid
+import hashlib
 import time
-from config import get_storage
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TLRUCache
+from config import get_db, get_storage
+from models import MediaRefRepository, SubmissionRepository
+from media import ImageProcessor, AudioProcessor
+
+
+class _SignedUrlCache:
+    """Cache URL đã ký theo đường dẫn blob, dùng chung cho cả process"""
+
+    REFRESH_MARGIN = 120  # Ký lại khi URL còn dưới 2 phút
+    MAX_ENTRIES = 5000
+
+    # Mỗi URL hết hạn riêng theo thời hạn ký; đầy thì bỏ URL ít dùng nhất
+    _entries = TLRUCache(
+        maxsize=MAX_ENTRIES,
+        ttu=lambda key, url, now: now + key[1] - _SignedUrlCache.REFRESH_MARGIN
+    )
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(path, expiration):
+        with _SignedUrlCache._lock:
+            return _SignedUrlCache._entries.get((path, expiration))
+
+    @staticmethod
+    def put(path, expiration, url):
+        with _SignedUrlCache._lock:
+            _SignedUrlCache._entries[(path, expiration)] = url
+
+
+class BytesFile:
+    """Bọc bytes trong bộ nhớ thành đối tượng giống file upload của Streamlit"""
+    
+    def __init__(self, data, name, content_type):
+        self._data = data
+        self.name = name
+        self.type = content_type
+        self.size = len(data)
+    
+    def getvalue(self):
+        return self._data
+
 
 class FileUtils:
     """Xử lý upload/download file"""
@@ -25,6 +68,47 @@ class FileUtils:
         
         return True, ""
     
+    @staticmethod
+    def _write_blob(path, data, content_type, retries=0):
+        """Ghi bytes vào blob (không đụng tới UI, an toàn khi chạy ở thread khác)"""
+        for attempt in range(retries + 1):
+            try:
+                get_storage().blob(path).upload_from_string(data, content_type=content_type)
+                return path
+            except Exception:
+                if attempt == retries:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+    
+    @staticmethod
+    def _content_stem(data, folder):
+        """Tên blob theo hash nội dung: cùng file luôn ra cùng đường dẫn"""
+        return f"{folder}/{hashlib.sha256(data).hexdigest()}"
+    
+    @staticmethod
+    def _store(file_obj, folder, retries=0, refs_count=1):
+        """
+        Ghi file lên Storage theo hash nội dung trong thư mục `folder` và tăng số tham chiếu
+        thêm `refs_count` (số câu hỏi dùng file). File đã có thì không upload lại.
+        """
+        data = file_obj.getvalue()
+        ext = file_obj.name.split(".")[-1].lower()
+        path = f"{FileUtils._content_stem(data, folder)}.{ext}"
+        
+        refs = MediaRefRepository(get_db())
+        existing = refs.acquire(path, count=refs_count)
+        if existing is not None and "size" in existing:
+            return path
+        # Chưa có hoặc lần upload trước chưa xong: nội dung theo hash nên ghi lại vẫn ra cùng file
+        try:
+            if existing is not None or not get_storage().blob(path).exists():
+                FileUtils._write_blob(path, data, file_obj.type, retries)
+            refs.describe(path, {"content_type": file_obj.type, "size": len(data)})
+        except Exception:
+            FileUtils.release(path, count=refs_count)
+            raise
+        return path
+    
     @staticmethod
     def upload_to_storage(file_obj, folder):
         """Upload file lên Firebase Storage"""
@@ -38,30 +122,270 @@ class FileUtils:
             st.error(msg)
             return None
         
-        bucket = get_storage()
+        return FileUtils._store(file_obj, folder)
+    
+    @staticmethod
+    def upload_image(file_obj, folder, retries=0):
+        """
+        Upload ảnh đã chuẩn hóa (bỏ EXIF) kèm các bản thu nhỏ, đặt tên theo hash của file gốc.
+        Trả về (image_path, image_variants) với image_variants dạng
+        {"thumb": {"path": ..., "width": ..., "height": ...}, "display": {...}}
+        """
+        if not file_obj:
+            return None, None
+        
+        valid, msg = FileUtils.validate_file(file_obj, ['jpg', 'jpeg', 'png'], 3)
+        if not valid:
+            st.error(msg)
+            return None, None
+        
+        try:
+            return FileUtils._store_image(file_obj, folder, retries)
+        except ValueError as e:
+            st.error(str(e))
+            return None, None
+    
+    @staticmethod
+    def _store_image(file_obj, folder, retries=0, refs_count=1):
+        """Phần xử lý/upload của upload_image (không đụng tới UI), ảnh lỗi -> ValueError"""
+        raw = file_obj.getvalue()
         ext = file_obj.name.split(".")[-1].lower()
-        filename = f"{folder}/{int(time.time())}_{uuid.uuid4().hex[:8]}.{ext}"
+        stem = FileUtils._content_stem(raw, folder)
+        image_path = f"{stem}.{ext}"
         
-        blob = bucket.blob(filename)
-        blob.upload_from_string(
-            file_obj.getvalue(),
-            content_type=file_obj.type
-        )
+        # Ảnh đã upload trước đó: dùng lại các biến thể đã lưu, không xử lý/upload lại
+        refs = MediaRefRepository(get_db())
+        existing = refs.acquire(image_path, count=refs_count)
+        if existing and existing.get("variants"):
+            return image_path, existing["variants"]
         
-        return filename
+        try:
+            (original, content_type), variants = ImageProcessor.process(raw, ext)
+            
+            uploads = {image_path: (original, content_type)}
+            image_variants = {}
+            for name, (data, variant_type, width, height) in variants.items():
+                path = f"{stem}_{name}.{ImageProcessor.VARIANT_EXT}"
+                uploads[path] = (data, variant_type)
+                image_variants[name] = {"path": path, "width": width, "height": height}
+            
+            with ThreadPoolExecutor(max_workers=len(uploads)) as pool:
+                futures = [pool.submit(FileUtils._write_blob, path, data, ctype, retries)
+                           for path, (data, ctype) in uploads.items()]
+                for future in futures:
+                    future.result()
+            refs.describe(image_path, {
+                "content_type": content_type, "size": len(original), "variants": image_variants
+            })
+        except Exception:
+            # Ảnh lỗi/upload lỗi: trả lại tham chiếu vừa lấy (xóa các blob đã kịp upload nếu không ai dùng)
+            FileUtils.release(image_path, count=refs_count)
+            raise
+        return image_path, image_variants
+    
+    @staticmethod
+    def release(path, question_id=None, count=1):
+        """
+        Bỏ `count` tham chiếu tới file (khi câu hỏi đổi/xóa media, hoặc upload lỗi).
+        Xóa blob (kèm các biến thể ảnh) khi không còn câu hỏi nào dùng, rồi mới xóa document tham chiếu:
+        trong lúc xóa, upload cùng file ở nơi khác sẽ chờ và upload lại sau đó.
+        question_id: câu hỏi đang bỏ ảnh; nếu bài nộp của câu này còn hiển thị ảnh (hoặc biến thể)
+        thì tham chiếu được giữ lại cho các bài nộp đó (ghi vào retained_for), file không bị xóa.
+        """
+        if not path:
+            return
+        db = get_db()
+        refs = MediaRefRepository(db)
+        if question_id:
+            info = refs.get(path)
+            if info is None:
+                return  # File không được quản lý (upload trước khi có media_refs)
+            paths = [path] + [v["path"] for v in (info.get("variants") or {}).values()]
+            if SubmissionRepository(db).references_media(question_id, paths):
+                refs.retain(path, question_id)
+                return
+        data = refs.release(path, count)
+        if data is None:
+            return
+        bucket = get_storage()
+        paths = [path] + [v["path"] for v in (data.get("variants") or {}).values()]
+        for blob_path in paths:
+            try:
+                bucket.blob(blob_path).delete()
+            except Exception:
+                pass  # Blob đã bị xóa trước đó
+        refs.finish_release(path)
+    
+    @staticmethod
+    def pick_image(question, width):
+        """
+        Đường dẫn ảnh nhỏ nhất vẫn đủ rộng `width` px để hiển thị.
+        Câu hỏi cũ chưa có biến thể thì dùng ảnh gốc.
+        """
+        variants = sorted((question.get('image_variants') or {}).values(), key=lambda v: v['width'])
+        if not variants:
+            return question.get('image_path')
+        for variant in variants:
+            if variant['width'] >= width:
+                return variant['path']
+        # Ảnh gốc nhỏ hơn `width`: biến thể lớn nhất đã là toàn bộ ảnh
+        return variants[-1]['path']
     
     @staticmethod
     def get_signed_url(path, expiration=900):
-        """Lấy URL tạm thời (15 phút)"""
+        """Lấy URL tạm thời (15 phút), dùng lại URL cũ nếu chưa sắp hết hạn"""
         if not path:
             return None
+        url = _SignedUrlCache.get(path, expiration)
+        if url:
+            return url
         try:
             bucket = get_storage()
             blob = bucket.blob(path)
-            return blob.generate_signed_url(version="v4", expiration=expiration)
+            url = blob.generate_signed_url(version="v4", expiration=expiration)
+            _SignedUrlCache.put(path, expiration, url)
+            return url
         except Exception as e:
             st.error(f"Lỗi tải file: {str(e)}")
             return None
+    
+    @staticmethod
+    def get_signed_urls(paths, expiration=900):
+        """Ký một lượt toàn bộ media của đề thi, trả về dict {path: url}"""
+        urls = {}
+        missing = []
+        for path in dict.fromkeys(p for p in paths if p):
+            url = _SignedUrlCache.get(path, expiration)
+            if url:
+                urls[path] = url
+            else:
+                missing.append(path)
+        
+        if missing:
+            bucket = get_storage()
+            for path in missing:
+                try:
+                    url = bucket.blob(path).generate_signed_url(version="v4", expiration=expiration)
+                except Exception as e:
+                    st.error(f"Lỗi tải file: {str(e)}")
+                    continue
+                _SignedUrlCache.put(path, expiration, url)
+                urls[path] = url
+        return urls
+
+
+class RecordingUploader:
+    """Thu gọn (AudioProcessor) và upload bài nói ở nền ngay khi học sinh ghi âm xong"""
+    
+    FOLDER = "submission_recordings"
+    MAX_MB = 20           # 1 phút WAV ~5 MB, vượt quá là dữ liệu bất thường
+    JOB_TTL = 3 * 3600    # Giây: job đã xong quá lâu (phiên bị bỏ dở) thì bị xóa khỏi _jobs
+    
+    _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="recording-upload")
+    _jobs = {}  # path -> (digest, future, thời điểm đưa vào hàng đợi)
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def recording_path(student_id, subject, set_number, qid, content_type=AudioProcessor.CONTENT_TYPE):
+        """Đường dẫn cố định theo học sinh, đề thi và câu hỏi; đuôi file theo content type được lưu"""
+        ext = AudioProcessor.extension(content_type)
+        return f"{RecordingUploader.FOLDER}/{student_id}/{subject}_{set_number}/{qid}.{ext}"
+    
+    @staticmethod
+    def submit(student_id, subject, set_number, qid, audio_bytes):
+        """
+        Đưa file ghi âm vào hàng đợi upload, trả về ngay đường dẫn blob dự kiến (dùng làm khóa cho wait).
+        Nếu phải lưu WAV (không nén được) thì file nằm ở đường dẫn đuôi .wav, trả về trong audio_path của wait().
+        Gọi lại với cùng dữ liệu (mỗi lần rerun) sẽ không upload lại.
+        ValueError nếu dữ liệu không phải WAV hoặc quá MAX_MB.
+        """
+        file_obj = BytesFile(audio_bytes, f"{qid}.wav", "audio/wav")
+        valid, msg = FileUtils.validate_file(file_obj, ["wav"], RecordingUploader.MAX_MB)
+        if valid and (audio_bytes[:4] != b"RIFF" or audio_bytes[8:12] != b"WAVE"):
+            valid, msg = False, "File ghi âm không đúng định dạng WAV"
+        if not valid:
+            raise ValueError(msg)
+        
+        path = RecordingUploader.recording_path(student_id, subject, set_number, qid)
+        digest = hashlib.sha1(audio_bytes).hexdigest()
+        
+        with RecordingUploader._lock:
+            RecordingUploader._evict()
+            job = RecordingUploader._jobs.get(path)
+            if job and job[0] == digest and not (job[1].done() and job[1].exception()):
+                return path
+            
+            previous = job[1] if job else None
+            
+            def upload():
+                # Chờ bản ghi cũ của cùng câu xong trước để không bị ghi đè ngược thứ tự
+                if previous:
+                    try:
+                        previous.result()
+                    except Exception:
+                        pass
+                try:
+                    data, content_type, metadata = AudioProcessor.compact(audio_bytes)
+                except ValueError:
+                    # Không đọc được định dạng: lưu nguyên bản ghi (WAV của audio_recorder) để không mất bài làm
+                    data, content_type, metadata = audio_bytes, "audio/wav", {
+                        "audio_original_bytes": len(audio_bytes),
+                        "audio_stored_bytes": len(audio_bytes),
+                    }
+                stored = RecordingUploader.recording_path(student_id, subject, set_number, qid, content_type)
+                FileUtils._write_blob(stored, data, content_type, retries=2)
+                return metadata | {"audio_path": stored}
+            
+            future = RecordingUploader._pool.submit(upload)
+            RecordingUploader._jobs[path] = (digest, future, time.time())
+        return path
+    
+    @staticmethod
+    def _evict():
+        """Bỏ các job đã xong từ lâu mà không ai chờ (phiên bị bỏ dở), đã giữ _lock"""
+        now = time.time()
+        for path, (_, future, queued_at) in list(RecordingUploader._jobs.items()):
+            if future.done() and now - queued_at > RecordingUploader.JOB_TTL:
+                del RecordingUploader._jobs[path]
+    
+    @staticmethod
+    def _find_stored(path):
+        """Đường dẫn file đã upload (đuôi theo định dạng đã lưu) khi job không còn trong _jobs"""
+        stem = path.rsplit(".", 1)[0]
+        bucket = get_storage()
+        for ext in AudioProcessor.EXTENSIONS.values():
+            if bucket.blob(f"{stem}.{ext}").exists():
+                return f"{stem}.{ext}"
+        return None
+    
+    @staticmethod
+    def wait(paths, timeout=60):
+        """
+        Chờ các file upload xong, trả về (metadata, errors):
+        {path: thời lượng/kích thước, audio_path đã lưu} cho file thành công và {path: thông báo lỗi} cho file thất bại
+        """
+        metadata, errors = {}, {}
+        for path in paths:
+            with RecordingUploader._lock:
+                job = RecordingUploader._jobs.get(path)
+            if not job:
+                # Job đã bị dọn (JOB_TTL) nhưng file vẫn đã được upload
+                stored = RecordingUploader._find_stored(path)
+                if stored:
+                    metadata[path] = {"audio_path": stored}
+                else:
+                    errors[path] = "Không tìm thấy bản ghi âm, vui lòng ghi lại"
+                continue
+            try:
+                metadata[path] = job[1].result(timeout=timeout)
+            except Exception as e:
+                errors[path] = str(e) or type(e).__name__
+        
+        with RecordingUploader._lock:
+            for path in paths:
+                if path not in errors:
+                    RecordingUploader._jobs.pop(path, None)
+        return metadata, errors
 
 
 class InputValidator:
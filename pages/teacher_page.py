@@ -5,7 +5,9 @@ from components import (
     QuestionCreationForm,
     QuestionEditForm,
     GradingInterface,
-    UserManagementPanel
+    UserManagementPanel,
+    BulkImportPanel,
+    ExamAnalyticsPanel
 )
 
 def teacher_page():
@@ -13,11 +15,13 @@ def teacher_page():
     user = st.session_state['user']
     UserHeader.render(user)
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "➕ Tạo Câu Hỏi",
         "✏️ Sửa Câu Hỏi", 
         "💯 Chấm Bài",
-        "👥 Quản Lý"
+        "👥 Quản Lý",
+        "📥 Nhập Hàng Loạt",
+        "📈 Thống Kê"
     ])
     
     with tab1:
@@ -28,3 +32,7 @@ def teacher_page():
         GradingInterface.render()
     with tab4:
         UserManagementPanel.render()
+    with tab5:
+        BulkImportPanel.render()
+    with tab6:
+        ExamAnalyticsPanel.render()